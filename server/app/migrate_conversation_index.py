@@ -0,0 +1,15 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.dirname(current_dir))
+
+from utils.chatHistoryManager import ChatHistoryManager
+from dotenv import load_dotenv, find_dotenv
+load_dotenv(find_dotenv())
+
+if __name__ == "__main__":
+    chat_history_manager = ChatHistoryManager(os.getenv("UPSTASH_REDIS_REST_URL"), os.getenv("UPSTASH_REDIS_REST_TOKEN"))
+    indexed = chat_history_manager.build_conversation_index()
+    print(f"Indexed {indexed} conversations")
@@ -0,0 +1,35 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.dirname(current_dir))
+
+from server import chain
+
+def render_workflow_image(output_folder: str = os.path.join(current_dir, 'output')):
+    """
+    Renders the compiled workflow as a Mermaid PNG. Rendering calls the mermaid.ink service,
+    which is why it runs here instead of when the server starts.
+
+    Args:
+        output_folder (str): The folder the image is written to.
+
+    Returns:
+        str: The path of the written image.
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    image_file = os.path.join(output_folder, 'workflow_image.png')
+
+    workflow_image = chain.get_graph().draw_mermaid_png()
+
+    with open(image_file, 'wb') as f:
+        f.write(workflow_image)
+
+    return image_file
+
+if __name__ == "__main__":
+    image_file = render_workflow_image()
+    print(f"Workflow image saved at {image_file}")
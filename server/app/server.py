@@ -1,5 +1,12 @@
+import time
+
+SERVER_STARTED_AT = time.perf_counter()
+
+import asyncio
+import json
 import os
 import sys
+from functools import partial
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -9,35 +16,87 @@ utils_dir = os.path.join(os.path.dirname(current_dir), 'utils')
 sys.path.append(utils_dir)
 
 from typing import Callable
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from typing import List, Any, Union, Dict
+from langchain_openai import ChatOpenAI
+from typing import List, Any, Dict, Optional
 from utils.grader import GraderUtils
-from utils.graph import GraphState
 from utils.generate_chain import create_generate_chain
 from utils.nodes import GraphNodes
 from utils.edges import EdgeGraph
 from utils.pinecone_store import PineconeRetriever
+from utils.faiss_store import FaissRetriever
+from utils.lexical_index import LEXICAL_INDEX_DEFAULT_PATH
 from utils.chatHistoryManager import ChatHistoryManager
-from langgraph.graph import END, StateGraph
-from fastapi import FastAPI, Header, HTTPException, Request
+from utils.answer_cache import SemanticAnswerCache
+from utils.rpc_executor import JsonRpcExecutor
+from utils.rpc_cache import JsonRpcCache, BLOCK_TIME
+from utils.router import KeywordRouter
+from utils.prompts import create_prompt_registry
+from utils.streaming import stream_answer
+from utils.logger import configure_logging, get_logger
+from utils.workflow import build_workflow
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Annotated
 from fastapi.responses import RedirectResponse
+from prometheus_client import make_asgi_app
+from sse_starlette.sse import EventSourceResponse
 from langserve import add_routes
-from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.output_parsers import StrOutputParser
-from IPython.display import display, Image
+from pydantic import BaseModel
 from langgraph.checkpoint.memory import MemorySaver
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
-pinecone_retriever = PineconeRetriever(
-    pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    index_name="web3-api-index",
-    namespace="infura-docs"
+# JSON logs written from a background thread. LOG_PAYLOADS=false keeps questions, answers, documents,
+# chat history and command output out of the logs entirely; use it in production.
+configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    payloads=os.getenv("LOG_PAYLOADS", "true").lower() == "true",
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1")),
+    max_field_chars=int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
 )
+log = get_logger("server")
+
+# "lazy" defers the Pinecone connection to the first retrieval, "eager" opens it while the
+# app starts up. Neither mode calls the LangChain hub or renders the workflow diagram; run
+# `python app/render_graph.py` to regenerate output/workflow_image.png.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+
+# "pinecone" queries the hosted index; "faiss" serves the local index built by documentLoader from disk.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "vector_index")
+
+# Fuses the vector results with the BM25 index documentLoader builds next to the vector index,
+# which finds exact identifiers such as eth_getBlockByHash that embeddings rank poorly.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "false").lower() == "true"
+hybrid = dict(
+    lexical_index_path=os.getenv(
+        "LEXICAL_INDEX_PATH", os.path.join(FAISS_INDEX_PATH, "lexical") if VECTOR_BACKEND == "faiss" else LEXICAL_INDEX_DEFAULT_PATH
+    ) if HYBRID_RETRIEVAL else None,
+    hybrid_candidates=int(os.getenv("HYBRID_CANDIDATES", "10"))
+)
+
+if VECTOR_BACKEND == "faiss":
+    retriever = FaissRetriever(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        path=FAISS_INDEX_PATH,
+        namespace="infura-docs",
+        namespaces=["solidity-docs"],
+        embedding_cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH"),
+        lazy=True,
+        **hybrid
+    )
+else:
+    retriever = PineconeRetriever(
+        pinecone_api_key=os.getenv("PINECONE_API_KEY"),
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        index_name="web3-api-index",
+        namespace="infura-docs",
+        namespaces=["solidity-docs"],
+        embedding_cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH"),
+        lazy=True,
+        **hybrid
+    )
 
 redis_url = os.getenv("UPSTASH_REDIS_REST_URL")
 redis_token = os.getenv("UPSTASH_REDIS_REST_TOKEN")
@@ -50,11 +109,13 @@ grader = GraderUtils(llm)
 
 retrieval_grader = grader.create_retrieval_grader()
 
+batch_retrieval_grader = grader.create_batch_retrieval_grader()
+
 hallucination_grader = grader.create_hallucination_grader()
 
 code_evaluator = grader.create_code_evaluator()
 
-question_rewriter = grader.create_question_rewriter()
+question_rewriter = grader.create_question_rewriter(use_hub=os.getenv("QUESTION_REWRITER_PROMPT") == "hub")
 
 action_evaluator = grader.create_action_evaluator()
 
@@ -62,124 +123,81 @@ execute_evaluator = grader.create_execution_evaluator()
 create_params_evaluator = grader.create_params_evaluator()
 paramsProvidedConfidence = grader.paramsProvidedConfidence()
 
-workflow = StateGraph(GraphState)
-
-chat_history_manager = ChatHistoryManager(redis_url, redis_token)
-
-memory = MemorySaver()
-
-save_message = chat_history_manager.save_message
-get_all_messages = chat_history_manager.get_all_messages
-graph_nodes = GraphNodes(
-    llm, pinecone_retriever, retrieval_grader, hallucination_grader, code_evaluator, question_rewriter,
-    save_message, get_all_messages
+chat_history_manager = ChatHistoryManager(
+    redis_url, redis_token,
+    max_messages=int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "0")) or None
 )
 
-edge_graph = EdgeGraph(hallucination_grader, code_evaluator, action_evaluator, execute_evaluator,create_params_evaluator, paramsProvidedConfidence)
-
-workflow.add_node("retrieveInfura", graph_nodes.retrieveInfura)
-workflow.add_node("retrieveSolidity", graph_nodes.retrieveSolidity)
-workflow.add_node("grade_documents", graph_nodes.grade_documents)
-workflow.add_node("generate", graph_nodes.generate)
-workflow.add_node("transform_query", graph_nodes.transform_query)
-workflow.add_node("evaluator", graph_nodes.rewrite_question)
-workflow.add_node("chat", graph_nodes.chat)
-workflow.add_node("transform_execution", graph_nodes.transform_execution)
-workflow.add_node("execution", graph_nodes.execution)
-workflow.add_node("path_to_execution", graph_nodes.path_to_execution)
-workflow.add_node("command_interpreter", graph_nodes.execution_interpreter)
-workflow.add_node("ending", graph_nodes.ending)
-workflow.add_node("params_needed", graph_nodes.params_needed)
-workflow.add_node("params_inquiry", graph_nodes.params_inquiry)
-workflow.add_node("adding_params", graph_nodes.adding_params)
-
-workflow.set_entry_point("evaluator")
-
-workflow.add_conditional_edges(
-    "evaluator",
-    edge_graph.action_first,
-    {
-        "infura": "retrieveInfura",
-        "solidity": "retrieveSolidity",
-        "chat": "chat",
-    },
+# The graph only reads the newest window of a conversation; the /conversations routes still return all of it.
+chat_history_window = dict(
+    limit=int(os.getenv("CHAT_HISTORY_WINDOW", "20")) or None,
+    token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "0")) or None
 )
 
-workflow.add_edge("ending", END)
-workflow.add_edge("chat", "ending")
-
-workflow.add_edge("retrieveInfura", "grade_documents")
-workflow.add_edge("retrieveSolidity", "grade_documents")
-workflow.add_conditional_edges(
-    "grade_documents",
-    edge_graph.decide_to_generate,
-    {
-        "transform_query": "transform_query",
-        "generate": "generate",
-    },
-)
+memory = MemorySaver()
 
-workflow.add_conditional_edges(
-    "transform_query",
-    edge_graph.tool_direction,
-    {
-        "infura": "retrieveInfura",
-        "solidity": "retrieveSolidity",
-    },
-)
-workflow.add_conditional_edges(
-    "generate",
-    edge_graph.grade_generation_v_documents_and_question,
-    {
-        "not supported": "generate",
-        "useful": "path_to_execution",
-        "not useful": "transform_query",
-    },
-)
+answer_cache = None
+if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true":
+    answer_cache = SemanticAnswerCache(
+        retriever.embeddings,
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.98")),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        execution_ttl=float(os.getenv("ANSWER_CACHE_EXECUTION_TTL", "0")),
+        max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    )
+
+rpc_cache = None
+if os.getenv("RPC_CACHE_ENABLED", "true").lower() == "true":
+    rpc_cache = JsonRpcCache(
+        head_ttl=float(os.getenv("RPC_CACHE_HEAD_TTL", str(BLOCK_TIME))),
+        max_size=int(os.getenv("RPC_CACHE_SIZE", "2048"))
+    )
+
+rpc_executor = JsonRpcExecutor(cache=rpc_cache)
 
-workflow.add_conditional_edges(
-    "path_to_execution",
-    edge_graph.decide_to_execute,
-    {
-        "execute": "transform_execution",
-        "no-execute": "ending",
-    },
+save_message = chat_history_manager.save_message
+get_all_messages = partial(chat_history_manager.get_recent_messages, **chat_history_window)
+asave_message = chat_history_manager.asave_message
+aget_all_messages = partial(chat_history_manager.aget_recent_messages, **chat_history_window)
+
+# A/B splits between registered prompt versions, e.g. {"execution_interpreter": {"v1": 0.5, "v2": 0.5}}.
+prompt_registry = create_prompt_registry()
+for prompt_name, weights in json.loads(os.getenv("PROMPT_VARIANTS", "{}")).items():
+    prompt_registry.set_weights(prompt_name, weights)
+
+# "keyword" answers obvious routing decisions locally and falls back to the LLM; "llm" always asks the LLM.
+router = KeywordRouter() if os.getenv("ROUTER_MODE", "keyword") == "keyword" else None
+
+edge_graph = EdgeGraph(
+    hallucination_grader, code_evaluator, action_evaluator, execute_evaluator,create_params_evaluator, paramsProvidedConfidence,
+    router=router,
+    generation_grading_mode=os.getenv("GENERATION_GRADING_MODE", "parallel"),
+    cancel_early=os.getenv("GENERATION_GRADING_CANCEL_EARLY", "true").lower() == "true",
+    max_generation_attempts=int(os.getenv("MAX_GENERATION_ATTEMPTS", "3")),
+    max_query_rewrites=int(os.getenv("MAX_QUERY_REWRITES", "3"))
 )
 
-workflow.add_conditional_edges(
-    "transform_execution",
-    edge_graph.paramsCheck,
-    {
-        "params-needed": "params_needed",
-        "no-params-needed": "execution",
-    }
-)
-workflow.add_conditional_edges(
-    "params_needed",
-    edge_graph.paramsProvided, 
-    {
-        "params-provided": "adding_params", 
-        "params-not-provided": "params_inquiry",
-    }
+graph_nodes = GraphNodes(
+    llm, retriever, retrieval_grader, hallucination_grader, code_evaluator, question_rewriter,
+    save_message, get_all_messages,
+    batch_retrieval_grader=batch_retrieval_grader,
+    grading_mode=os.getenv("GRADING_MODE", "concurrent"),
+    grading_concurrency=int(os.getenv("GRADING_CONCURRENCY", "4")),
+    asaveMessage=asave_message,
+    aget_all_messages=aget_all_messages,
+    answer_cache=answer_cache,
+    saveTurn=chat_history_manager.save_turn,
+    asaveTurn=chat_history_manager.asave_turn,
+    rpc_executor=rpc_executor,
+    rewrite_mode=os.getenv("REWRITE_MODE", "off"),
+    route_question=edge_graph.route_question,
+    aroute_question=edge_graph.aroute_question,
+    prompt_registry=prompt_registry
 )
-workflow.add_edge("adding_params", "execution")
-workflow.add_edge("execution", "command_interpreter")
-workflow.add_edge("command_interpreter", "ending")
-workflow.add_edge("params_inquiry", END)
-chain = workflow.compile()
-
-output_folder = os.path.join(current_dir, 'output')
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-image_file = os.path.join(output_folder, 'workflow_image.png')
 
-workflow_image = chain.get_graph().draw_mermaid_png()
+workflow = build_workflow(graph_nodes, edge_graph, use_answer_cache=answer_cache is not None)
 
-with open(image_file, 'wb') as f:
-    f.write(workflow_image)
-
-print(f"Workflow image saved at {image_file}")
+chain = workflow.compile()
 
 async def check_authentication(userId: str):
     if not userId or userId not in app.state.sessions or not app.state.sessions[userId].get("is_authenticated"):
@@ -200,7 +218,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.mount("/metrics", make_asgi_app())
+
 app.state.sessions = {}
+app.state.first_request_served = False
+
+async def warm_up_lexical():
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(retriever.warm_up_lexical)
+    except Exception as exc:
+        # The first query of a namespace builds its index again.
+        log.warning("lexical_warm_up_failed", error=str(exc))
+        return
+    log.info("lexical_warm_up_completed", seconds=round(time.perf_counter() - started, 2))
+
+@app.on_event("startup")
+async def report_startup_time():
+    if STARTUP_MODE == "eager":
+        await asyncio.to_thread(retriever.warm_up)
+    elif HYBRID_RETRIEVAL:
+        # The BM25 side is local, so even a lazy startup builds it, in the background.
+        app.state.lexical_warm_up = asyncio.create_task(warm_up_lexical())
+    log.info("startup_completed", seconds=round(time.perf_counter() - SERVER_STARTED_AT, 2), mode=STARTUP_MODE)
+
+@app.on_event("shutdown")
+async def close_rpc_clients():
+    rpc_executor.close()
+    await rpc_executor.aclose()
 
 class User(BaseModel):
     userId: str
@@ -217,41 +262,81 @@ class ConversationKeysResponse(BaseModel):
 class ConversationMessagesResponse(BaseModel):
     messages: List[dict]
 
+class CacheStatsResponse(BaseModel):
+    embeddings: dict
+    answers: Optional[dict] = None
+    rpc: Optional[dict] = None
+
 @app.get("/")
 async def redirect_root_to_docs():
     return RedirectResponse("/docs")
 
 @app.middleware("http")
 async def extract_user_id_middleware(request: Request, call_next: Callable):
-    if request.method == "OPTIONS":
+    # Monitoring endpoints are scraped without a user.
+    if request.method == "OPTIONS" or request.url.path.startswith("/metrics") or request.url.path == "/cache/stats":
         return await call_next(request)
 
+    if not app.state.first_request_served:
+        app.state.first_request_served = True
+        log.info("first_request", seconds=round(time.perf_counter() - SERVER_STARTED_AT, 2))
+
     user_id = request.headers.get("user_id")
     conv_id = request.headers.get("conv_id")
-    print("---------Header Response----------")
-    print(f"User ID: {user_id}")
-    print(f"Conversation ID: {conv_id}")
+    log.debug("request", method=request.method, path=request.url.path, user_id=user_id, conv_id=conv_id)
     if not user_id:
         raise HTTPException(status_code=403, detail="User ID header missing")
 
     request.state.user_id = user_id
-
-    graph_nodes.saveChatInfo(user_id, conv_id)
+    request.state.conv_id = conv_id
 
     return await call_next(request)
 
+async def add_chat_identity_to_config(config: Dict[str, Any], request: Request) -> Dict[str, Any]:
+    """
+    Copies the user and conversation IDs of the request into the runnable config, so each
+    graph run carries its own identity instead of reading it from shared state.
+
+    Args:
+        config (dict): The runnable config built by langserve for this request.
+        request (Request): The incoming HTTP request.
+
+    Returns:
+        dict: The config with 'user_id' and 'conv_id' set under 'configurable'.
+    """
+    configurable = config.setdefault("configurable", {})
+    configurable["user_id"] = request.headers.get("user_id")
+    configurable["conv_id"] = request.headers.get("conv_id")
+    return config
+
+@app.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats_route():
+    """
+    Report the hit and miss counters of the server caches.
+
+    Returns:
+        CacheStatsResponse: The counters of the query-embedding cache and, when enabled, the semantic answer cache and the JSON-RPC result cache.
+    """
+    return {
+        "embeddings": retriever.embeddings.stats(),
+        "answers": answer_cache.stats() if answer_cache is not None else None,
+        "rpc": rpc_cache.stats() if rpc_cache is not None else None,
+    }
+
 @app.get("/conversations/{user_id}", response_model=ConversationKeysResponse)
-async def retrieve_conversation_keys_route(user_id: str):
+async def retrieve_conversation_keys_route(user_id: str, offset: int = 0, limit: int = 50):
     """
-    Retrieve all conversation keys for a specific user.
+    Retrieve a page of conversation keys for a specific user, most recently active first.
     
     Args:
         user_id (str): The ID of the user.
+        offset (int): The number of conversations to skip.
+        limit (int): The maximum number of conversations to return.
 
     Returns:
         ConversationKeysResponse: A list of conversation keys for the user.
     """
-    conversation_keys = chat_history_manager.retrieve_conversation_keys(user_id)
+    conversation_keys = await chat_history_manager.aretrieve_conversation_keys(user_id, offset=offset, limit=limit)
     if not conversation_keys:
         raise HTTPException(status_code=404, detail="No conversation keys found for the user.")
     
@@ -269,16 +354,41 @@ async def get_all_messages_route(user_id: str, conversation_id: str):
     Returns:
         ConversationMessagesResponse: A list of all messages for the specified conversation.
     """
-    messages = chat_history_manager.get_all_messages(user_id, conversation_id)
+    messages = await chat_history_manager.aget_all_messages(user_id, conversation_id)
     if not messages:
         raise HTTPException(status_code=404, detail="No messages found for this conversation.")
     
     return {"messages": messages}
 
+@app.post("/web3buddy_chat/stream_answer")
+async def stream_answer_route(body: Input, request: Request):
+    """
+    Answer a question as server-sent events, token by token, while the graph is still running.
+
+    The stream carries `token` events for the answer text, `retract` when grading rejects the
+    text streamed so far or a later step replaces it, `annotate` when it is kept without passing grading, and a final `end`
+    event with the authoritative answer and the time to first token.
+
+    Args:
+        body (Input): The user's question.
+        request (Request): The incoming HTTP request, carrying the user and conversation IDs.
+
+    Returns:
+        EventSourceResponse: The event stream.
+    """
+    config = await add_chat_identity_to_config({}, request)
+
+    async def events():
+        async for event, data in stream_answer(chain, {"input": body.input}, config):
+            yield {"event": event, "data": json.dumps(data)}
+
+    return EventSourceResponse(events())
+
 add_routes(
     app,
     chain.with_types(input_type=Input, output_type=Output),
-    path="/web3buddy_chat"
+    path="/web3buddy_chat",
+    per_req_config_modifier=add_chat_identity_to_config
 )
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(current_dir)
+
+from offline import QUESTIONS, MockJsonRpcServer, build_offline_graph
+from utils.logger import configure_logging
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def run_level(chain, route: str, concurrency: int, requests: int):
+    """
+    Sends `requests` turns of one route through the graph, `concurrency` at a time.
+
+    Returns:
+        dict: Throughput, latency percentiles and the number of turns that failed or returned no answer.
+    """
+    latencies = []
+    failures = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal failures
+        for _ in remaining:
+            payload = {"input": QUESTIONS[route]}
+            config = {"configurable": {"user_id": "bench", "conv_id": uuid.uuid4().hex}}
+            started = time.perf_counter()
+            try:
+                output = await chain.ainvoke(payload, config=config)
+                if not output.get("generation"):
+                    failures += 1
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "failures": failures,
+        "turns_per_second": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+    }
+
+async def main(args):
+    with MockJsonRpcServer(latency=args.rpc_latency_ms / 1e3) as rpc_server, tempfile.TemporaryDirectory() as index_path:
+        chain, rpc_executor = build_offline_graph(
+            rpc_server.url,
+            llm_latency=args.llm_latency_ms / 1e3,
+            embedding_latency=args.embedding_latency_ms / 1e3,
+            rpc_cache=not args.no_rpc_cache,
+            instrumented=not args.no_instrumentation,
+            local_index_path=index_path if args.retriever in ("faiss", "hybrid") else None,
+            hybrid=args.retriever == "hybrid"
+        )
+        report = {
+            "llm_latency_ms": args.llm_latency_ms,
+            "embedding_latency_ms": args.embedding_latency_ms,
+            "rpc_latency_ms": args.rpc_latency_ms,
+            "retriever": args.retriever,
+            "routes": {},
+        }
+        try:
+            for route in args.routes.split(","):
+                # One untimed turn per route warms up imports, clients and caches.
+                await run_level(chain, route, 1, 1)
+                report["routes"][route] = {
+                    str(concurrency): await run_level(chain, route, concurrency, args.requests)
+                    for concurrency in (int(level) for level in args.concurrency.split(","))
+                }
+        finally:
+            await rpc_executor.aclose()
+            rpc_executor.close()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure throughput and p50/p95/p99 latency of the compiled graph per route, fully offline.")
+    parser.add_argument("--routes", default="infura,solidity,chat")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of turns in flight.")
+    parser.add_argument("--requests", type=int, default=50, help="Turns per route and concurrency level.")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--rpc-latency-ms", type=float, default=30)
+    parser.add_argument("--retriever", choices=["memory", "faiss", "hybrid"], default="memory",
+                        help="faiss: retrieve from a local index, as with VECTOR_BACKEND=faiss; hybrid: also fuse a BM25 index, as with HYBRID_RETRIEVAL=true.")
+    parser.add_argument("--no-rpc-cache", action="store_true", help="Send every JSON-RPC call to the mock server.")
+    parser.add_argument("--no-instrumentation", action="store_true", help="Build the graph without the per-node metrics wrappers.")
+    args = parser.parse_args()
+
+    configure_logging(level=os.getenv("LOG_LEVEL", "WARNING"), payloads=False)
+    print(json.dumps(asyncio.run(main(args)), indent=2))
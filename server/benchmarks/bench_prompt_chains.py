@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.dirname(current_dir))
+
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.output_parsers import StrOutputParser
+from utils.prompts import EXECUTION_INTERPRETER_PROMPT, create_prompt_registry
+
+INPUTS = {
+    "generation": '{"jsonrpc":"2.0","id":1,"result":"0x134e82a"}',
+    "documents": [],
+    "input": "What is the latest block number?",
+}
+
+def per_call_chain(llm):
+    # What every node call did before the registry: build the prompt and the pipeline, then invoke.
+    prompt = PromptTemplate(template=EXECUTION_INTERPRETER_PROMPT.template, input_variables=EXECUTION_INTERPRETER_PROMPT.input_variables)
+    return (prompt | llm | StrOutputParser()).invoke(INPUTS)
+
+def precompiled_chain(prompts):
+    _, chain = prompts.get("execution_interpreter", "user")
+    return chain.invoke(INPUTS)
+
+def run(call, calls: int, workers: int):
+    latencies = []
+
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls_per_second": calls / elapsed,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare building a prompt chain per call with the precompiled prompt registry, using a fake LLM.")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    llm = FakeListLLM(responses=["The latest block number is 20244522."])
+    prompts = create_prompt_registry().compile(llm)
+
+    # Warm both paths so imports and lazy initialization are not measured.
+    per_call_chain(llm)
+    precompiled_chain(prompts)
+
+    report = {
+        "calls": args.calls,
+        "workers": args.workers,
+        "per_call_construction": run(lambda: per_call_chain(llm), args.calls, args.workers),
+        "precompiled": run(lambda: precompiled_chain(prompts), args.calls, args.workers),
+    }
+    report["construction_overhead_p50_us"] = report["per_call_construction"]["p50_us"] - report["precompiled"]["p50_us"]
+    print(json.dumps(report, indent=2))
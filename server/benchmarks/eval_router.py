@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.dirname(current_dir))
+
+from utils.router import KeywordRouter
+
+def load_eval_set(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def evaluate(examples, router: KeywordRouter, action_evaluator=None):
+    """
+    Runs the keyword router, and optionally the LLM action evaluator, over a labeled eval set.
+
+    Args:
+        examples (list): {"question", "route"} records.
+        router (KeywordRouter): The fast-path router.
+        action_evaluator: The LLM action evaluator chain, or None to skip the LLM.
+
+    Returns:
+        dict: Coverage, accuracy, agreement and latency figures.
+    """
+    fast_latencies, llm_latencies = [], []
+    answered = correct = 0
+    llm_correct = agreed = compared = 0
+    misses = []
+
+    for example in examples:
+        started = time.perf_counter()
+        decision = router.route(example["question"])
+        fast_latencies.append(time.perf_counter() - started)
+
+        if decision is not None:
+            answered += 1
+            if decision == example["route"]:
+                correct += 1
+            else:
+                misses.append({**example, "router": decision})
+
+        if action_evaluator is not None:
+            started = time.perf_counter()
+            llm_decision = action_evaluator.invoke({"question": example["question"]}).strip().lower()
+            llm_latencies.append(time.perf_counter() - started)
+            llm_correct += llm_decision == example["route"]
+            if decision is not None:
+                compared += 1
+                agreed += llm_decision == decision
+
+    report = {
+        "examples": len(examples),
+        "fast_path_coverage": answered / len(examples),
+        "fast_path_accuracy": correct / answered if answered else None,
+        "fast_path_p50_us": percentile(fast_latencies, 0.5) * 1e6,
+        "fast_path_p99_us": percentile(fast_latencies, 0.99) * 1e6,
+        "fast_path_mistakes": misses,
+    }
+    if action_evaluator is not None:
+        report.update({
+            "llm_accuracy": llm_correct / len(examples),
+            "llm_agreement_on_fast_path": agreed / compared if compared else None,
+            "llm_p50_ms": percentile(llm_latencies, 0.5) * 1e3,
+            "llm_p99_ms": percentile(llm_latencies, 0.99) * 1e3,
+        })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report coverage, accuracy and latency of the keyword router on a labeled eval set.")
+    parser.add_argument("--eval-set", default=os.path.join(current_dir, "router_eval.jsonl"))
+    parser.add_argument("--llm", action="store_true", help="Also run the LLM action evaluator (needs OPENAI_API_KEY) and report agreement.")
+    args = parser.parse_args()
+
+    action_evaluator = None
+    if args.llm:
+        from dotenv import load_dotenv, find_dotenv
+        from langchain_openai import ChatOpenAI
+        from utils.grader import GraderUtils
+        load_dotenv(find_dotenv())
+        action_evaluator = GraderUtils(ChatOpenAI(model="gpt-4o", temperature=0)).create_action_evaluator()
+
+    print(json.dumps(evaluate(load_eval_set(args.eval_set), KeywordRouter(), action_evaluator), indent=2))
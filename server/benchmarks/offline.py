@@ -0,0 +1,381 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from bisect import insort
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.dirname(current_dir))
+
+# The execution node inserts the Infura key into generated commands; the mock JSON-RPC server ignores it.
+os.environ.setdefault("INFURA_API_KEY", "offline-benchmark")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from utils.chatHistoryManager import ChatHistoryManager
+from utils.edges import EdgeGraph
+from utils.embedding_cache import CachedEmbeddings
+from utils.faiss_store import FaissRetriever, LocalVectorIndex
+from utils.grader import GraderUtils
+from utils.lexical_index import LexicalIndex
+from utils.nodes import GraphNodes
+from utils.prompts import create_prompt_registry
+from utils.router import KeywordRouter
+from utils.rpc_cache import JsonRpcCache
+from utils.rpc_executor import JsonRpcExecutor
+from utils.workflow import build_workflow
+
+# One question per route. The scripted model keys its route-dependent answers on these.
+QUESTIONS = {
+    "infura": "What is the latest block number on Ethereum mainnet?",
+    "solidity": "How do I write a modifier in Solidity that restricts a function to the owner?",
+    "chat": "Hello, what can you do?",
+}
+
+CHARS_PER_TOKEN = 4
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A stand-in for ChatOpenAI that answers each prompt from a script after a fixed latency.
+
+    `replies` is a list of (marker, reply) pairs; the first marker found in the prompt wins, and a
+    callable reply is called with the prompt. Token usage is reported from the prompt and reply
+    lengths, so the token metrics are populated.
+    """
+    replies: List[Any]
+    default: str = "I can help with that."
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.default
+        for marker, reply in self.replies:
+            if marker in prompt:
+                text = reply(prompt) if callable(reply) else reply
+                break
+        usage = {"prompt_tokens": len(prompt) // CHARS_PER_TOKEN, "completion_tokens": len(text) // CHARS_PER_TOKEN}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))], llm_output={"token_usage": usage})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+def scripted_llm(rpc_url: str, latency: float = 0.0) -> ScriptedChatModel:
+    """
+    Scripts the answers of every prompt in the graph: graders pass, routing follows the keyword
+    router, and the Infura question is answered by executing `eth_blockNumber` against `rpc_url`.
+    """
+    router = KeywordRouter()
+    curl_command = (
+        f"curl {rpc_url}/v3/{{infuraKey}} -X POST -H \"Content-Type: application/json\" "
+        "-d '{\"jsonrpc\":\"2.0\",\"method\":\"eth_blockNumber\",\"params\":[],\"id\":1}'"
+    )
+
+    def batch_scores(prompt):
+        count = int(prompt.split("exactly ", 1)[1].split(" ", 1)[0])
+        return json.dumps({"scores": ["yes"] * count})
+
+    def execute_score(prompt):
+        return json.dumps({"score": 0.9 if QUESTIONS["infura"] in prompt else 0.1})
+
+    return ScriptedChatModel(
+        latency=latency,
+        replies=[
+            ("assessing relevance of retrieved documents", batch_scores),
+            ("assessing relevance of a retrieved document", json.dumps({"score": "yes"})),
+            ("grounded in/supported by", json.dumps({"score": 0.9})),
+            ("You are a code evaluator", json.dumps({"score": 0.9, "feedback": "Correct and relevant."})),
+            ("decision maker responsible", lambda prompt: router.route(prompt.rsplit("Here is the question:", 1)[-1]) or "chat"),
+            ("requires executing a curl command", execute_score),
+            ("likely requires additional parameters", json.dumps({"score": 0.1})),
+            ("likely it is that parameters are provided", json.dumps({"score": 0.1})),
+            ("extracting only the cURL command", curl_command),
+            ("interpret the output of the cURL command", "The latest block number is 20244522."),
+            ("You are Web3Buddy", "Here is an answer grounded in the documentation, with an example:\n" + curl_command),
+        ],
+    )
+
+class SlowEmbeddings(Embeddings):
+    """
+    Deterministic fake embeddings with a fixed latency per call, standing in for OpenAI embeddings.
+    """
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.embeddings = DeterministicFakeEmbedding(size=size)
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self.embeddings.embed_query(text)
+
+NAMESPACES = ("infura-docs", "solidity-docs")
+
+def synthetic_documents(namespace: str, count: int):
+    return [
+        Document(page_content=f"{namespace} reference page {i}: methods, parameters and examples.", metadata={"source": f"{namespace}/{i}"})
+        for i in range(count)
+    ]
+
+def local_index_retriever(embeddings: Embeddings, path: str, documents_per_namespace: int = 50,
+                          hybrid: bool = False) -> FaissRetriever:
+    """
+    Writes synthetic documents to a local index at `path` the way `documentLoader` does, and
+    returns the `FaissRetriever` that serves it. With `hybrid`, a BM25 index is written too and
+    the retriever fuses both, as with `HYBRID_RETRIEVAL=true`.
+    """
+    index = LocalVectorIndex(path)
+    lexical_path = os.path.join(path, "lexical")
+    lexical_index = LexicalIndex(lexical_path)
+    for namespace in NAMESPACES:
+        documents = synthetic_documents(namespace, documents_per_namespace)
+        vectors = embeddings.embed_documents([document.page_content for document in documents])
+        entries = [
+            (f"{namespace}-{i}", vector, {**document.metadata, "text": document.page_content})
+            for i, (document, vector) in enumerate(zip(documents, vectors))
+        ]
+        index.upsert(entries, namespace=namespace)
+        if hybrid:
+            lexical_index.upsert(entries, namespace=namespace)
+    return FaissRetriever(None, path, NAMESPACES[0], namespaces=NAMESPACES[1:], embeddings=embeddings,
+                          lexical_index_path=lexical_path if hybrid else None)
+
+class InMemoryRetriever:
+    def __init__(self, embeddings: Embeddings, documents_per_namespace: int = 50, k: int = 4,
+                 namespaces=NAMESPACES):
+        """
+        A brute-force in-memory vector store with the `retrieve` / `aretrieve` interface of
+        `PineconeRetriever`, seeded with synthetic documents in each namespace.
+
+        Args:
+            embeddings (Embeddings): The embeddings; queries go through the same `CachedEmbeddings` as in production.
+            documents_per_namespace (int): The number of synthetic documents per namespace.
+            k (int): The number of documents returned per query, as in the Pinecone retriever.
+            namespaces (tuple): The namespaces to seed.
+        """
+        self.embeddings = CachedEmbeddings(embeddings, model="offline-benchmark")
+        self.k = k
+        self.namespace = namespaces[0]
+        self._namespaces = {}
+        for namespace in namespaces:
+            documents = synthetic_documents(namespace, documents_per_namespace)
+            vectors = embeddings.embed_documents([document.page_content for document in documents])
+            self._namespaces[namespace] = list(zip(vectors, documents))
+
+    def _nearest(self, vector, namespace):
+        best = []
+        for candidate, document in self._namespaces[namespace or self.namespace]:
+            score = sum(a * b for a, b in zip(vector, candidate))
+            insort(best, (-score, id(document), document))
+            del best[self.k:]
+        return [document for _, _, document in best]
+
+    def retrieve(self, query: str, namespace: str = None):
+        return self._nearest(self.embeddings.embed_query(query), namespace)
+
+    async def aretrieve(self, query: str, namespace: str = None):
+        return self._nearest(await self.embeddings.aembed_query(query), namespace)
+
+class InMemoryRedis:
+    """
+    The subset of the Upstash Redis client used by `ChatHistoryManager`, kept in process.
+    """
+    def __init__(self):
+        self._lists = {}
+        self._sorted_sets = {}
+        self._lock = threading.Lock()
+
+    def lpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            for value in values:
+                items.insert(0, value)
+            return len(items)
+
+    def ltrim(self, key, start, stop):
+        with self._lock:
+            items = self._lists.get(key, [])
+            self._lists[key] = items[start:None if stop == -1 else stop + 1]
+            return "OK"
+
+    def lrange(self, key, start, stop):
+        with self._lock:
+            return list(self._lists.get(key, [])[start:None if stop == -1 else stop + 1])
+
+    def zadd(self, key, scores, gt=False):
+        with self._lock:
+            members = self._sorted_sets.setdefault(key, {})
+            for member, score in scores.items():
+                if not gt or score > members.get(member, float("-inf")):
+                    members[member] = score
+            return len(scores)
+
+    def zrange(self, key, start, stop, rev=False):
+        with self._lock:
+            ordered = sorted(self._sorted_sets.get(key, {}).items(), key=lambda item: item[1], reverse=rev)
+            return [member for member, _ in ordered[start:None if stop == -1 else stop + 1]]
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+class _Pipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((getattr(self._redis, name), args, kwargs))
+            return self
+        return queue
+
+    def exec(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self._commands]
+
+class InMemoryAsyncRedis:
+    """
+    Async view of an `InMemoryRedis`, standing in for the Upstash asyncio client.
+    """
+    def __init__(self, redis: InMemoryRedis):
+        self._redis = redis
+
+    async def lrange(self, key, start, stop):
+        return self._redis.lrange(key, start, stop)
+
+    async def zrange(self, key, start, stop, rev=False):
+        return self._redis.zrange(key, start, stop, rev=rev)
+
+    def pipeline(self):
+        return _AsyncPipeline(self._redis)
+
+class _AsyncPipeline(_Pipeline):
+    async def exec(self):
+        return _Pipeline.exec(self)
+
+def in_memory_chat_history() -> ChatHistoryManager:
+    """
+    A `ChatHistoryManager` whose sync and async clients are replaced with an in-memory store.
+    The Upstash clients are only built, never called.
+    """
+    manager = ChatHistoryManager("https://offline.invalid", "offline")
+    manager.redis = InMemoryRedis()
+    manager.async_redis = InMemoryAsyncRedis(manager.redis)
+    return manager
+
+class MockJsonRpcServer:
+    def __init__(self, latency: float = 0.0, block_number: int = 20244522):
+        """
+        A local JSON-RPC endpoint answering single and batch calls after a fixed latency.
+
+        Args:
+            latency (float): Seconds to wait before answering each HTTP request.
+            block_number (int): The result of `eth_blockNumber`.
+        """
+        results = {
+            "eth_blockNumber": hex(block_number),
+            "eth_chainId": "0x1",
+            "eth_gasPrice": "0x4a817c800",
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(latency)
+                calls = body if isinstance(body, list) else [body]
+                responses = [{"jsonrpc": "2.0", "id": call.get("id"), "result": results.get(call.get("method"), "0x0")} for call in calls]
+                payload = json.dumps(responses if isinstance(body, list) else responses[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+def build_offline_graph(rpc_url: str, llm_latency: float = 0.0, embedding_latency: float = 0.0,
+                        rpc_cache: bool = True, instrumented: bool = True, local_index_path: str = None,
+                        hybrid: bool = False):
+    """
+    Builds and compiles the graph the way `app/server.py` does, with its default settings, but
+    with every external service replaced by an in-process stand-in.
+
+    Args:
+        rpc_url (str): The base URL of the mock JSON-RPC server.
+        llm_latency (float): Seconds each LLM call takes.
+        embedding_latency (float): Seconds each query embedding takes.
+        rpc_cache (bool): Cache JSON-RPC results, as `RPC_CACHE_ENABLED` does.
+        instrumented (bool): Wrap the steps with the metrics instrumentation.
+        local_index_path (str): Serve retrieval from a local index written to this directory
+            (`VECTOR_BACKEND=faiss`) instead of the in-memory store.
+        hybrid (bool): Fuse the local index with a BM25 index (`HYBRID_RETRIEVAL=true`).
+
+    Returns:
+        tuple: The compiled graph and the JSON-RPC executor, to be closed by the caller.
+    """
+    llm = scripted_llm(rpc_url, latency=llm_latency)
+    embeddings = SlowEmbeddings(latency=embedding_latency)
+    if local_index_path:
+        retriever = local_index_retriever(embeddings, local_index_path, hybrid=hybrid)
+    else:
+        retriever = InMemoryRetriever(embeddings)
+    chat_history_manager = in_memory_chat_history()
+    rpc_executor = JsonRpcExecutor(cache=JsonRpcCache() if rpc_cache else None)
+
+    grader = GraderUtils(llm)
+    edge_graph = EdgeGraph(
+        grader.create_hallucination_grader(), grader.create_code_evaluator(), grader.create_action_evaluator(),
+        grader.create_execution_evaluator(), grader.create_params_evaluator(), grader.paramsProvidedConfidence(),
+        router=KeywordRouter(),
+        generation_grading_mode="parallel"
+    )
+    graph_nodes = GraphNodes(
+        llm, retriever, grader.create_retrieval_grader(), grader.create_hallucination_grader(), grader.create_code_evaluator(),
+        grader.create_question_rewriter(),
+        chat_history_manager.save_message, chat_history_manager.get_recent_messages,
+        batch_retrieval_grader=grader.create_batch_retrieval_grader(),
+        grading_mode="concurrent",
+        asaveMessage=chat_history_manager.asave_message,
+        aget_all_messages=chat_history_manager.aget_recent_messages,
+        saveTurn=chat_history_manager.save_turn,
+        asaveTurn=chat_history_manager.asave_turn,
+        rpc_executor=rpc_executor,
+        route_question=edge_graph.route_question,
+        aroute_question=edge_graph.aroute_question,
+        prompt_registry=create_prompt_registry()
+    )
+    return build_workflow(graph_nodes, edge_graph, instrumented=instrumented).compile(), rpc_executor
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+import numpy as np
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+class SemanticAnswerCache:
+    def __init__(self, embeddings, similarity_threshold: float = 0.98, ttl: float = 3600,
+                 execution_ttl: float = 0, max_size: int = 512):
+        """
+        Caches final answers keyed on the question embedding and the routed namespace.
+
+        A lookup returns the stored answer of the most similar earlier question in the same
+        namespace when its cosine similarity reaches `similarity_threshold`. Entries expire after
+        `ttl` seconds and the least recently used entry is evicted once `max_size` is reached.
+
+        Args:
+            embeddings (Embeddings): The model used to embed questions.
+            similarity_threshold (float): The minimum cosine similarity for a hit. ada-002 scores
+                most pairs of short questions in a narrow high band, and questions that differ in
+                one word ("gas price on mainnet" / "on sepolia") can score above 0.95, so keep it
+                high; every lookup logs its nearest score at DEBUG level for calibration.
+            ttl (float): Seconds an answer built from documentation stays valid.
+            execution_ttl (float): Seconds an answer built from live chain data (the `execution`
+                node) stays valid. 0 keeps those answers out of the cache entirely.
+            max_size (int): The maximum number of cached answers.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.execution_ttl = execution_ttl
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._ids = count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _match(self, vector, namespace: str):
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, None
+            for entry_id, entry in list(self._entries.items()):
+                if entry["expires_at"] <= now:
+                    del self._entries[entry_id]
+                    continue
+                if entry["namespace"] != namespace:
+                    continue
+                score = float(np.dot(entry["vector"], vector))
+                if best_score is None or score > best_score:
+                    best_id, best_score = entry_id, score
+
+            log.debug("answer_cache_lookup", namespace=namespace, nearest_score=best_score, threshold=self.similarity_threshold)
+            if best_id is None or best_score < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"]
+
+    def _insert(self, vector, namespace: str, answer: str, ttl: float):
+        with self._lock:
+            self._entries[next(self._ids)] = {
+                "namespace": namespace,
+                "vector": vector,
+                "answer": answer,
+                "expires_at": time.monotonic() + ttl,
+            }
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _ttl_for(self, executed: bool):
+        return self.execution_ttl if executed else self.ttl
+
+    def lookup(self, question: str, namespace: str):
+        """
+        Looks up a cached answer for a question routed to a namespace.
+
+        Args:
+            question (str): The user's question.
+            namespace (str): The vector store namespace the question was routed to.
+
+        Returns:
+            str: The cached answer, or None on a miss.
+        """
+        return self._match(self._unit(self.embeddings.embed_query(question)), namespace)
+
+    async def alookup(self, question: str, namespace: str):
+        """
+        Async variant of `lookup`.
+        """
+        return self._match(self._unit(await self.embeddings.aembed_query(question)), namespace)
+
+    def store(self, question: str, namespace: str, answer: str, executed: bool = False):
+        """
+        Stores the final answer of a turn.
+
+        Args:
+            question (str): The user's question.
+            namespace (str): The vector store namespace the question was routed to.
+            answer (str): The final answer.
+            executed (bool): Whether the answer came from live chain data.
+        """
+        ttl = self._ttl_for(executed)
+        if ttl <= 0 or not answer:
+            return
+        self._insert(self._unit(self.embeddings.embed_query(question)), namespace, answer, ttl)
+
+    async def astore(self, question: str, namespace: str, answer: str, executed: bool = False):
+        """
+        Async variant of `store`.
+        """
+        ttl = self._ttl_for(executed)
+        if ttl <= 0 or not answer:
+            return
+        self._insert(self._unit(await self.embeddings.aembed_query(question)), namespace, answer, ttl)
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The hits, misses, hit rate and number of cached answers.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
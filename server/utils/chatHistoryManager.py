@@ -1,17 +1,56 @@
 from upstash_redis import Redis
+from upstash_redis.asyncio import Redis as AsyncRedis
 import json
 from datetime import datetime
+from utils.logger import get_logger
+
+# Sorted set per user holding its conversation keys, scored by last activity.
+CONVERSATION_INDEX_KEY = "conversations:{user_id}"
+
+# Rough characters-per-token ratio used to fit history into a token budget without a tokenizer round-trip.
+CHARS_PER_TOKEN = 4
+
+log = get_logger(__name__)
 
 class ChatHistoryManager:
-    def __init__(self, redis_url, redis_token):
+    def __init__(self, redis_url, redis_token, max_messages: int = None):
         """
         Initialize the Redis client using environment variables.
         Raises an error if the required environment variables are not set.
+
+        Args:
+            redis_url (str): The Upstash REST URL.
+            redis_token (str): The Upstash REST token.
+            max_messages (int): When set, every write trims the conversation to its newest `max_messages` entries.
         """
         if not redis_url or not redis_token:
             raise ValueError("UPSTASH_REDIS_REST_URL and UPSTASH_REDIS_REST_TOKEN must be set in the environment")
+        if max_messages is not None and max_messages < 1:
+            raise ValueError("max_messages must be at least 1")
 
         self.redis = Redis(url=redis_url, token=redis_token)
+        self.async_redis = AsyncRedis(url=redis_url, token=redis_token)
+        self.max_messages = max_messages
+
+    def _serialize_message(self, message: str, message_type: str):
+        """
+        Serialize a message together with its type and timestamp for storage in Redis.
+
+        Args:
+            message (str): The message to save.
+            message_type (str): The type of message ('user' or 'assistant').
+
+        Returns:
+            str: The JSON encoded message.
+        """
+        timestamp = datetime.now().isoformat()
+        return json.dumps({
+            "type": message_type,
+            "data": {
+                "content": message,
+            },
+            "timestamp": timestamp
+        })
 
     def save_message(self, user_id: str, conversation_id: str, message: str, message_type: str):
         """
@@ -26,40 +65,113 @@ class ChatHistoryManager:
         Returns:
             bool: True if the message was saved successfully, False otherwise.
         """
+        return self.save_turn(user_id, conversation_id, [(message, message_type)])
+
+    def _queue_turn(self, pipeline, user_id: str, redis_key: str, messages):
+        """
+        Queues the writes of one turn on a pipeline: a single LPUSH of every message, oldest
+        first so the list stays newest-first, an LTRIM when the history is capped, and a ZADD
+        that moves the conversation to the top of the user's index.
+        """
+        pipeline.lpush(redis_key, *[self._serialize_message(message, message_type) for message, message_type in messages])
+        if self.max_messages:
+            pipeline.ltrim(redis_key, 0, self.max_messages - 1)
+        pipeline.zadd(CONVERSATION_INDEX_KEY.format(user_id=user_id), {redis_key: datetime.now().timestamp()})
+        return pipeline
+
+    def save_turn(self, user_id: str, conversation_id: str, messages):
+        """
+        Save the messages of one turn in a single round-trip.
+
+        Args:
+            user_id (str): The ID of the user.
+            conversation_id (str): The ID of the conversation.
+            messages (list): (message, message_type) pairs in the order they were exchanged,
+                e.g. [(question, 'user'), (answer, 'assistant')].
+
+        Returns:
+            bool: True if the messages were saved successfully, False otherwise.
+        """
+        if not messages:
+            return True
         try:
-            timestamp = datetime.now().isoformat()
-            message_for_redis = json.dumps({
-                "type": message_type,
-                "data": {
-                    "content": message,
-                },
-                "timestamp": timestamp
-            })
-            
             redis_key = f"{user_id}:{conversation_id}"
-            
-            self.redis.lpush(redis_key, message_for_redis)
-            
+
+            self._queue_turn(self.redis.pipeline(), user_id, redis_key, messages).exec()
+
             return True
         except Exception as e:
-            print(f"Error saving message: {e}")
+            log.error("save_turn_failed", error=str(e))
             return False
 
-    def retrieve_conversation_keys(self, user_id: str):
+    def _recent_range(self, limit: int = None):
+        return -1 if limit is None else max(limit, 1) - 1
+
+    def _fit_token_budget(self, messages, token_budget: int = None):
+        """
+        Keeps the newest messages whose estimated size fits in `token_budget` tokens.
+        Messages are newest-first, so the oldest ones are the first to be dropped.
+        """
+        if token_budget is None:
+            return messages
+
+        kept, used = [], 0
+        for message in messages:
+            content = message.get("data", {}).get("content", "")
+            tokens = len(str(content)) // CHARS_PER_TOKEN + 1
+            if used + tokens > token_budget:
+                break
+            kept.append(message)
+            used += tokens
+        return kept
+
+    def get_recent_messages(self, user_id: str, conversation_id: str, limit: int = None, token_budget: int = None):
+        """
+        Retrieve the newest messages of a conversation, reading only the requested window from Redis.
+
+        Args:
+            user_id (str): The ID of the user.
+            conversation_id (str): The ID of the conversation.
+            limit (int): The maximum number of messages to read. None reads the whole conversation.
+            token_budget (int): The maximum estimated number of tokens of the returned messages.
+
+        Returns:
+            list: The newest messages, newest first.
+        """
+        try:
+            redis_key = f"{user_id}:{conversation_id}"
+
+            messages = self.redis.lrange(redis_key, 0, self._recent_range(limit))
+
+            return self._fit_token_budget([json.loads(msg) for msg in messages], token_budget)
+        except Exception as e:
+            log.error("get_recent_messages_failed", error=str(e))
+            return []
+
+    def _index_range(self, offset: int = 0, limit: int = None):
+        start = max(offset, 0)
+        stop = -1 if limit is None else start + max(limit, 1) - 1
+        return start, stop
+
+    def retrieve_conversation_keys(self, user_id: str, offset: int = 0, limit: int = None):
         """
-        Retrieve all conversation keys for a specific user.
+        Retrieve the conversation keys of a specific user from the user's conversation index,
+        most recently active first.
 
         Args:
             user_id (str): The ID of the user.
+            offset (int): The number of conversations to skip.
+            limit (int): The maximum number of conversations to return. None returns all of them.
 
         Returns:
             list: A list of conversation keys (e.g., {user_id}:{conversation_id}-*).
         """
         try:
-            conversation_keys = self.redis.keys(f"{user_id}:*")
+            start, stop = self._index_range(offset, limit)
+            conversation_keys = self.redis.zrange(CONVERSATION_INDEX_KEY.format(user_id=user_id), start, stop, rev=True)
             return conversation_keys
         except Exception as e:
-            print(f"Error retrieving conversation keys: {e}")
+            log.error("retrieve_conversation_keys_failed", error=str(e))
             return []
 
     def get_all_messages(self, user_id: str, conversation_id: str):
@@ -80,5 +192,122 @@ class ChatHistoryManager:
             
             return [json.loads(msg) for msg in messages]
         except Exception as e:
-            print(f"Error retrieving all messages: {e}")
-            return []
\ No newline at end of file
+            log.error("get_all_messages_failed", error=str(e))
+            return []
+
+    async def asave_message(self, user_id: str, conversation_id: str, message: str, message_type: str):
+        """
+        Asynchronously save a message to the chat history for a specific user and conversation.
+
+        Args:
+            user_id (str): The ID of the user.
+            conversation_id (str): The ID of the conversation.
+            message (str): The message to save.
+            message_type (str): The type of message ('user' or 'assistant').
+
+        Returns:
+            bool: True if the message was saved successfully, False otherwise.
+        """
+        return await self.asave_turn(user_id, conversation_id, [(message, message_type)])
+
+    async def asave_turn(self, user_id: str, conversation_id: str, messages):
+        """
+        Async variant of `save_turn`.
+        """
+        if not messages:
+            return True
+        try:
+            redis_key = f"{user_id}:{conversation_id}"
+
+            await self._queue_turn(self.async_redis.pipeline(), user_id, redis_key, messages).exec()
+
+            return True
+        except Exception as e:
+            log.error("save_turn_failed", error=str(e))
+            return False
+
+    async def aget_recent_messages(self, user_id: str, conversation_id: str, limit: int = None, token_budget: int = None):
+        """
+        Async variant of `get_recent_messages`.
+        """
+        try:
+            redis_key = f"{user_id}:{conversation_id}"
+
+            messages = await self.async_redis.lrange(redis_key, 0, self._recent_range(limit))
+
+            return self._fit_token_budget([json.loads(msg) for msg in messages], token_budget)
+        except Exception as e:
+            log.error("get_recent_messages_failed", error=str(e))
+            return []
+
+    async def aretrieve_conversation_keys(self, user_id: str, offset: int = 0, limit: int = None):
+        """
+        Async variant of `retrieve_conversation_keys`.
+        """
+        try:
+            start, stop = self._index_range(offset, limit)
+            conversation_keys = await self.async_redis.zrange(CONVERSATION_INDEX_KEY.format(user_id=user_id), start, stop, rev=True)
+            return conversation_keys
+        except Exception as e:
+            log.error("retrieve_conversation_keys_failed", error=str(e))
+            return []
+
+    async def aget_all_messages(self, user_id: str, conversation_id: str):
+        """
+        Asynchronously retrieve all messages from a specific conversation for a user.
+
+        Args:
+            user_id (str): The ID of the user.
+            conversation_id (str): The ID of the conversation.
+
+        Returns:
+            list: A list of all messages for the specified conversation.
+        """
+        try:
+            redis_key = f"{user_id}:{conversation_id}"
+
+            messages = await self.async_redis.lrange(redis_key, 0, -1)
+
+            return [json.loads(msg) for msg in messages]
+        except Exception as e:
+            log.error("get_all_messages_failed", error=str(e))
+            return []
+
+    def build_conversation_index(self, batch_size: int = 500):
+        """
+        One-time migration that indexes conversations written before the per-user index existed.
+        Walks the keyspace with SCAN, so Redis is never blocked the way KEYS blocks it, and scores
+        every conversation by the timestamp of its newest message.
+
+        Args:
+            batch_size (int): The SCAN page size.
+
+        Returns:
+            int: The number of conversations indexed.
+        """
+        indexed = 0
+        cursor = 0
+        while True:
+            cursor, keys = self.redis.scan(cursor, match="*:*", count=batch_size, type="list")
+            keys = [key for key in keys if not key.startswith(CONVERSATION_INDEX_KEY.format(user_id=""))]
+            if keys:
+                newest = self.redis.pipeline()
+                for key in keys:
+                    newest.lindex(key, 0)
+                newest_messages = newest.exec()
+
+                index = self.redis.pipeline()
+                for key, message in zip(keys, newest_messages):
+                    user_id = key.split(":", 1)[0]
+                    index.zadd(CONVERSATION_INDEX_KEY.format(user_id=user_id), {key: self._last_activity(message)}, gt=True)
+                index.exec()
+                indexed += len(keys)
+
+            if int(cursor) == 0:
+                return indexed
+
+    def _last_activity(self, message):
+        try:
+            return datetime.fromisoformat(json.loads(message)["timestamp"]).timestamp()
+        except Exception:
+            return 0.0
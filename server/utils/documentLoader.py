@@ -1,20 +1,31 @@
 import os
 import time
 import json
+import hashlib
+import queue
 from dotenv import load_dotenv
-from uuid import uuid4
-from typing import List
+from collections import deque
+from typing import Callable, Iterable, List, NamedTuple
 import requests
+import threading
+import tiktoken
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from pinecone import Pinecone, ServerlessSpec
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from langchain_community.document_loaders import FireCrawlLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.faiss_store import LocalVectorIndex
+from utils.ingestion_manifest import IngestionCheckpoint, IngestionManifest, chunk_id
+from utils.lexical_index import LEXICAL_INDEX_DEFAULT_PATH, LexicalIndex
+from utils.logger import get_logger
 
 load_dotenv()
 
+log = get_logger(__name__)
+
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 fire_api_key = os.getenv("FIRE_API_KEY")
@@ -33,7 +44,49 @@ def initialize_pinecone(api_key: str, index_name: str, dimension: int = 1536):
             time.sleep(1)
     return pc.Index(index_name)
 
-def save_documents_to_pinecone(docs: List[Document], vector_store: PineconeVectorStore, source_url: str, namespace: str):
+# OpenAI accepts at most 2048 inputs and 8191 tokens per input in one embedding request.
+MAX_BATCH_INPUTS = 2048
+
+class RateLimiter:
+    def __init__(self, tokens_per_minute: int = None, requests_per_minute: int = None):
+        """
+        A token bucket shared by the embedding workers, so concurrent batches stay within the
+        provider's tokens-per-minute and requests-per-minute limits.
+
+        Args:
+            tokens_per_minute (int): The token budget per minute. None means unlimited.
+            requests_per_minute (int): The request budget per minute. None means unlimited.
+        """
+        self._limits = {"tokens": tokens_per_minute, "requests": requests_per_minute}
+        self._available = {key: float(limit) for key, limit in self._limits.items() if limit}
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """
+        Blocks until `tokens` tokens and one request fit in the budget.
+        """
+        wanted = {"tokens": tokens, "requests": 1}
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for key in self._available:
+                    limit = self._limits[key]
+                    self._available[key] = min(limit, self._available[key] + (now - self._updated) * limit / 60)
+                self._updated = now
+                # A batch larger than the whole budget waits for a full bucket instead of forever.
+                missing = {key: min(wanted[key], self._limits[key]) - self._available[key] for key in self._available}
+                if all(amount <= 0 for amount in missing.values()):
+                    for key in self._available:
+                        self._available[key] -= wanted[key]
+                    return
+                wait = max(amount * 60 / self._limits[key] for key, amount in missing.items() if amount > 0)
+            time.sleep(wait)
+
+def split_documents(docs: List[Document], source_url: str) -> List[Document]:
+    """
+    Splits crawled pages into chunks carrying the page metadata, trimmed to fit Pinecone's metadata limit.
+    """
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
@@ -43,6 +96,7 @@ def save_documents_to_pinecone(docs: List[Document], vector_store: PineconeVecto
         length_function=len,
     )
 
+    chunked_docs = []
     for doc in docs:
         chunks = text_splitter.split_text(doc.page_content)
 
@@ -54,23 +108,398 @@ def save_documents_to_pinecone(docs: List[Document], vector_store: PineconeVecto
 
             metadata_size = len(json.dumps(trimmed_metadata).encode('utf-8'))
             if metadata_size > 40960:
-                print(f"Warning: Metadata size is {metadata_size} bytes, exceeding the limit. Trimming metadata.")
+                log.warning("chunk_metadata_trimmed", url=source_url, metadata_bytes=metadata_size)
                 trimmed_metadata = {key: value[:50] for key, value in trimmed_metadata.items() if isinstance(value, str)}
 
-            chunked_doc = Document(page_content=chunk, metadata=trimmed_metadata)
+            chunked_docs.append(Document(page_content=chunk, metadata=trimmed_metadata))
+    return chunked_docs
+
+def _embed_batch(embeddings: Embeddings, batch, tokens: int, rate_limiter: RateLimiter = None):
+    if rate_limiter is not None:
+        rate_limiter.acquire(tokens)
+    return batch, embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+
+def _vectors(batch, vectors):
+    # PineconeVectorStore reads the chunk text from the "text" metadata key.
+    return [
+        (chunk_key, vector, {**chunk.metadata, "text": chunk.page_content})
+        for (chunk_key, chunk), vector in zip(batch, vectors)
+    ]
+
+def delete_chunks(index, ids, namespace: str, batch_size: int = 1000):
+    """
+    Deletes chunks from the index by ID, `batch_size` IDs per request (Pinecone's limit).
+    """
+    ids = sorted(ids)
+    for start in range(0, len(ids), batch_size):
+        index.delete(ids=ids[start:start + batch_size], namespace=namespace)
+
+def page_key(doc: Document) -> str:
+    """
+    Identifies a crawled page by its URL, or by a hash of its content when the crawler reports none.
+    """
+    url = doc.metadata.get("sourceURL") or doc.metadata.get("url")
+    return url or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+class EmbeddingBatch(NamedTuple):
+    chunks: list
+    tokens: int
+
+class PageDone(NamedTuple):
+    source_url: str
+    page_key: str
+    chunk_ids: List[str]
 
-            uuids = str(uuid4())
+class UrlDone(NamedTuple):
+    source_url: str
 
-            vector_store.add_documents(documents=[chunked_doc], ids=[uuids], namespace=namespace)
+# Ends a stage's input queue.
+STOP = object()
+
+class PipelineStopped(Exception):
+    """
+    Raised inside a stage when another stage has failed.
+    """
+
+class IngestionPipeline:
+    def __init__(self, index, embeddings: Embeddings, namespace: str, manifest: IngestionManifest,
+                 checkpoint: IngestionCheckpoint, load_pages: Callable[[str], Iterable[Document]],
+                 batch_tokens: int = 20000, concurrency: int = 4, upsert_batch_size: int = 100,
+                 rate_limiter: RateLimiter = None, queue_size: int = 32, flush_interval: float = 1.0,
+                 lexical_index: LexicalIndex = None, save_every: int = 100, save_interval: float = 5.0):
+        """
+        Streams crawled pages into the index through three concurrent stages joined by bounded queues:
+
+        - crawl: loads the pages of each URL, skipping the pages and URLs the checkpoint lists.
+        - split: splits pages into chunks, drops chunks the manifest lists, and groups the rest
+          into token-sized embedding batches across pages.
+        - write: embeds up to `concurrency` batches at once and upserts the vectors in bulk. A page
+          is recorded in the manifest and the checkpoint once all its chunks are in the index, and
+          stale chunks are deleted once a URL is complete. With a `lexical_index`, every upsert and
+          deletion is applied to it as well.
+
+        A full queue blocks the stage that feeds it, so memory stays bounded however large the crawl.
+        A rate-limited crawl only pauses the crawl stage, and an interrupted run started again with
+        the same checkpoint resumes after the last saved page.
+
+        Args:
+            index: The Pinecone index.
+            embeddings (Embeddings): The embedding model.
+            namespace (str): The Pinecone namespace.
+            manifest (IngestionManifest): The chunk IDs already ingested, updated as pages are written.
+            checkpoint (IngestionCheckpoint): The progress of this run.
+            load_pages (Callable): Returns the pages of a URL, e.g. `FireCrawlLoader(...).lazy_load()`.
+            batch_tokens (int): The most tokens in one embedding request.
+            concurrency (int): The number of embedding requests in flight.
+            upsert_batch_size (int): The number of vectors per Pinecone upsert.
+            rate_limiter (RateLimiter): Optional limiter for the embedding requests.
+            queue_size (int): The number of crawled pages buffered ahead of the split stage.
+            flush_interval (float): Seconds without new pages after which a partial batch is sent anyway.
+            lexical_index (LexicalIndex): Optional BM25 index kept in step with the vector index. Chunks
+                the manifest lists but the lexical index lacks are written to it from their text,
+                without being embedded again, so a lexical index added to an existing namespace is
+                backfilled by the next run.
+            save_every (int): Recorded pages after which the manifest and the checkpoint are saved.
+            save_interval (float): Seconds after which recorded pages are saved anyway. Both are also
+                saved when a URL completes and when the run stops. Pages recorded but not yet saved
+                are ingested again by a resumed run, which only rewrites the same IDs.
+        """
+        self.index = index
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.manifest = manifest
+        self.checkpoint = checkpoint
+        self.load_pages = load_pages
+        self.batch_tokens = batch_tokens
+        self.concurrency = max(1, concurrency)
+        self.upsert_batch_size = upsert_batch_size
+        self.rate_limiter = rate_limiter
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.lexical_index = lexical_index
+        self.save_every = save_every
+        self.save_interval = save_interval
+
+    def run(self, urls: List[str]) -> dict:
+        """
+        Ingests the URLs and discards the namespace's checkpoint once all of them are complete.
+
+        Returns:
+            dict: The number of pages, chunks written, unchanged chunks skipped, embedding requests,
+                upserts, deleted chunks and chunks backfilled into the lexical index, the elapsed
+                seconds and chunks per second.
+        """
+        started = time.perf_counter()
+        self.stats = {"pages": 0, "chunks": 0, "skipped": 0, "embedding_requests": 0, "upserts": 0, "deleted": 0, "lexical_backfilled": 0}
+        self._pages = queue.Queue(maxsize=self.queue_size)
+        self._batches = queue.Queue(maxsize=self.concurrency * 2)
+        self._stop = threading.Event()
+        self._errors = []
+        self._lexical_ids = self.lexical_index.ids(self.namespace) if self.lexical_index is not None else set()
+        self._unsaved_pages = 0
+        self._saved_at = time.monotonic()
+
+        stages = [
+            threading.Thread(target=self._run_stage, args=(self._crawl, urls), name="ingest-crawl", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._split,), name="ingest-split", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            self._run_stage(self._write)
+            for stage in stages:
+                stage.join()
+        finally:
+            # Pages recorded before a failure or an interrupt are kept for the resumed run.
+            self._save_progress()
+        if self._errors:
+            raise self._errors[0]
+
+        self.checkpoint.discard(self.namespace)
+        self.checkpoint.save()
+        self.stats["seconds"] = time.perf_counter() - started
+        self.stats["chunks_per_second"] = self.stats["chunks"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+        return self.stats
+
+    def _run_stage(self, stage, *args):
+        try:
+            stage(*args)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, target: queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _get(self, source: queue.Queue, timeout: float = None):
+        waited = 0.0
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.5)
+            except queue.Empty:
+                waited += 0.5
+                if timeout is not None and waited >= timeout:
+                    raise
+        raise PipelineStopped()
+
+    def _crawl(self, urls):
+        for url in urls:
+            if self.checkpoint.is_complete(self.namespace, url):
+                log.info("ingestion_url_skipped", url=url, reason="completed before the run was interrupted")
+                continue
+            log.info("ingestion_crawl_started", url=url)
+            done = set(self.checkpoint.pages(self.namespace, url))
+            while True:
+                try:
+                    for doc in self.load_pages(url):
+                        key = page_key(doc)
+                        if key not in done:
+                            done.add(key)
+                            self._put(self._pages, (url, key, doc))
+                    break
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and e.response.status_code == 429:
+                        retry_after = int(e.response.headers.get("Retry-After", 30))
+                        log.warning("ingestion_rate_limited", url=url, retry_after_s=retry_after)
+                        # Pages already queued are not sent again after the retry.
+                        if self._stop.wait(retry_after):
+                            raise PipelineStopped()
+                    else:
+                        raise
+            self._put(self._pages, (url, None, None))
+        self._put(self._pages, STOP)
+
+    def _split(self):
+        encoding = tiktoken.get_encoding("cl100k_base")
+        known_ids = {}
+        batch, batch_tokens, markers = [], 0, []
+
+        def flush():
+            nonlocal batch, batch_tokens, markers
+            # A page marker follows the batch holding the page's last chunk.
+            if batch:
+                self._put(self._batches, EmbeddingBatch(batch, batch_tokens))
+            for marker in markers:
+                self._put(self._batches, marker)
+            batch, batch_tokens, markers = [], 0, []
+
+        while True:
+            try:
+                item = self._get(self._pages, timeout=self.flush_interval)
+            except queue.Empty:
+                flush()
+                continue
+            if item is STOP:
+                flush()
+                self._put(self._batches, STOP)
+                return
+            url, key, doc = item
+            if doc is None:
+                flush()
+                self._put(self._batches, UrlDone(url))
+                continue
+
+            if url not in known_ids:
+                known_ids[url] = self.manifest.chunk_ids(self.namespace, url)
+            ids = []
+            backfill = []
+            for chunk in split_documents([doc], url):
+                chunk_key = chunk_id(url, chunk.page_content)
+                ids.append(chunk_key)
+                if chunk_key in known_ids[url]:
+                    self.stats["skipped"] += 1
+                    # Already embedded and upserted; only the lexical index lacks it.
+                    if self.lexical_index is not None and chunk_key not in self._lexical_ids:
+                        self._lexical_ids.add(chunk_key)
+                        backfill.append((chunk_key, chunk))
+                    continue
+                known_ids[url].add(chunk_key)
+                if self.lexical_index is not None:
+                    self._lexical_ids.add(chunk_key)
+                tokens = len(encoding.encode(chunk.page_content, disallowed_special=()))
+                if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= MAX_BATCH_INPUTS):
+                    flush()
+                batch.append((chunk_key, chunk))
+                batch_tokens += tokens
+            if backfill:
+                self.lexical_index.upsert(_vectors(backfill, [None] * len(backfill)), namespace=self.namespace)
+                self.stats["lexical_backfilled"] += len(backfill)
+            markers.append(PageDone(url, key, ids))
+
+    def _write(self):
+        in_flight = deque()
+        running = 0
+        pending = []
+        waiting = []
+
+        def upsert(count):
+            nonlocal waiting
+            vectors = pending[:count]
+            if vectors:
+                self.index.upsert(vectors=vectors, namespace=self.namespace)
+                if self.lexical_index is not None:
+                    self.lexical_index.upsert(vectors, namespace=self.namespace)
+                self.stats["upserts"] += 1
+                self.stats["chunks"] += len(vectors)
+                del pending[:count]
+            # Pages whose last chunk was in this upsert are now fully in the index.
+            for position, marker in waiting:
+                if position <= count:
+                    self._record_page(marker)
+            waiting = [(position - count, marker) for position, marker in waiting if position > count]
+
+        def settle(entry):
+            nonlocal running
+            if isinstance(entry, PageDone):
+                waiting.append((len(pending), entry))
+                if not pending:
+                    upsert(0)
+            elif isinstance(entry, UrlDone):
+                upsert(len(pending))
+                self._complete_url(entry.source_url)
+            else:
+                running -= 1
+                batch, vectors = entry.result()
+                self.stats["embedding_requests"] += 1
+                pending.extend(_vectors(batch, vectors))
+                while len(pending) >= self.upsert_batch_size:
+                    upsert(self.upsert_batch_size)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                try:
+                    item = self._get(self._batches, timeout=self.flush_interval)
+                except queue.Empty:
+                    item = None
+                if item is STOP:
+                    break
+                if isinstance(item, EmbeddingBatch):
+                    in_flight.append(executor.submit(_embed_batch, self.embeddings, item.chunks, item.tokens, self.rate_limiter))
+                    running += 1
+                elif item is not None:
+                    in_flight.append(item)
+                # Entries settle in order; a marker settles once every batch queued before it has.
+                while in_flight and (not isinstance(in_flight[0], Future) or in_flight[0].done() or running >= self.concurrency):
+                    settle(in_flight.popleft())
+            while in_flight:
+                settle(in_flight.popleft())
+            upsert(len(pending))
+
+    def _record_page(self, marker: PageDone):
+        self.manifest.add(self.namespace, marker.source_url, marker.chunk_ids)
+        self.checkpoint.add_page(self.namespace, marker.source_url, marker.page_key, marker.chunk_ids)
+        self.stats["pages"] += 1
+        self._unsaved_pages += 1
+        if self._unsaved_pages >= self.save_every or time.monotonic() - self._saved_at >= self.save_interval:
+            self._save_progress()
+
+    def _save_progress(self):
+        # The manifest goes first, so a saved checkpoint never lists pages the manifest lacks.
+        self.manifest.save()
+        self.checkpoint.save()
+        self._unsaved_pages = 0
+        self._saved_at = time.monotonic()
+
+    def _complete_url(self, url: str):
+        # The pages ingested before an interruption count as seen too.
+        seen_ids = set().union(*self.checkpoint.pages(self.namespace, url).values())
+        # Only a crawl that found pages can tell which chunks are gone.
+        if seen_ids:
+            stale_ids = self.manifest.chunk_ids(self.namespace, url) - seen_ids
+            if stale_ids:
+                delete_chunks(self.index, stale_ids, namespace=self.namespace)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(stale_ids, namespace=self.namespace)
+                self.stats["deleted"] += len(stale_ids)
+                log.info("ingestion_stale_chunks_deleted", url=url, chunks=len(stale_ids))
+            self.manifest.replace(self.namespace, url, seen_ids)
+        self.checkpoint.complete(self.namespace, url)
+        self._save_progress()
+        log.info("ingestion_url_complete", url=url)
 
 def main():
     index_name = "web3-api-index"
 
-    index = initialize_pinecone(pinecone_api_key, index_name, dimension=1536)
+    # "faiss" builds the local index served by FaissRetriever instead of writing to Pinecone.
+    vector_backend = os.getenv("VECTOR_BACKEND", "pinecone")
+    if vector_backend == "faiss":
+        index_path = os.getenv("FAISS_INDEX_PATH", "vector_index")
+        index = LocalVectorIndex(index_path)
+        default_manifest_path = os.path.join(index_path, "ingestion_manifest.json")
+        default_checkpoint_path = os.path.join(index_path, "ingestion_checkpoint.json")
+        default_lexical_path = os.path.join(index_path, "lexical")
+    else:
+        index = initialize_pinecone(pinecone_api_key, index_name, dimension=1536)
+        default_manifest_path = "ingestion_manifest.json"
+        default_checkpoint_path = "ingestion_checkpoint.json"
+        default_lexical_path = LEXICAL_INDEX_DEFAULT_PATH
+    # The BM25 side of hybrid retrieval, built from the same chunks as the vector index.
+    lexical_index = LexicalIndex(os.getenv("LEXICAL_INDEX_PATH", default_lexical_path))
 
     embeddings = OpenAIEmbeddings(api_key=openai_api_key, model="text-embedding-ada-002")
 
-    vector_store = PineconeVectorStore(index=index, embedding=embeddings)
+    rate_limiter = RateLimiter(
+        tokens_per_minute=int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000")) or None,
+        requests_per_minute=int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000")) or None
+    )
+    ingestion = dict(
+        batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "20000")),
+        concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+        upsert_batch_size=int(os.getenv("UPSERT_BATCH_SIZE", "100")),
+        rate_limiter=rate_limiter
+    )
+
+    # Each index keeps its own manifest and checkpoint, so switching backends never skips chunks or
+    # pages that only the other one holds.
+    manifest = IngestionManifest(os.getenv("INGESTION_MANIFEST_PATH", default_manifest_path))
 
     urls = [
         # "https://docs.rss3.io/guide/core",
@@ -108,30 +537,18 @@ def main():
     namespace2 = "solidity-docs"
     namespace = "defillama-api"
 
-    for url in urls:
-        print(f"Crawling URL: {url}")
-        loader = FireCrawlLoader(api_key=fire_api_key, url=url, mode="crawl")
-
-        pages = []
-        while True:
-            try:
-                for doc in loader.lazy_load():
-                    pages.append(doc)
-                    if len(pages) >= 10:
-                        save_documents_to_pinecone(pages, vector_store, source_url=url, namespace=namespace)
-                        pages = []
-                break
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429:
-                    retry_after = int(e.response.headers.get("Retry-After", 30))
-                    print(f"Rate limit exceeded. Retrying after {retry_after} seconds.")
-                    time.sleep(retry_after)
-                else:
-                    raise
-
-        if pages:
-            save_documents_to_pinecone(pages, vector_store, source_url=url, namespace=namespace)
-            print(f"Documents from {url} saved successfully.")
+    pipeline = IngestionPipeline(
+        index, embeddings, namespace, manifest,
+        IngestionCheckpoint(os.getenv("INGESTION_CHECKPOINT_PATH", default_checkpoint_path)),
+        load_pages=lambda url: FireCrawlLoader(api_key=fire_api_key, url=url, mode="crawl").lazy_load(),
+        lexical_index=lexical_index,
+        **ingestion
+    )
+    stats = pipeline.run(urls)
+    if vector_backend == "faiss":
+        index.compact()
+    lexical_index.compact()
+    log.info("ingestion_finished", **stats)
 
 if __name__ == "__main__":
     main()
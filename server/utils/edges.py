@@ -1,13 +1,35 @@
+import asyncio
+import contextvars
 import json
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import RETRY_BUDGET_EXHAUSTED
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# sequential: hallucination grader, then usefulness grader. parallel: both at once.
+GENERATION_GRADING_MODES = ("sequential", "parallel")
 
 class EdgeGraph:
-    def __init__(self, hallucination_grader, code_evaluator, create_action_evaluator, create_execution_evaluator, create_params_evaluator, paramsProvidedConfidence):
+    def __init__(self, hallucination_grader, code_evaluator, create_action_evaluator, create_execution_evaluator, create_params_evaluator, paramsProvidedConfidence, router=None,
+                 generation_grading_mode="sequential", cancel_early=True,
+                 max_generation_attempts=3, max_query_rewrites=3):
+        if generation_grading_mode not in GENERATION_GRADING_MODES:
+            raise ValueError(f"generation_grading_mode must be one of {GENERATION_GRADING_MODES}, got '{generation_grading_mode}'")
+
         self.hallucination_grader = hallucination_grader
         self.code_evaluator = code_evaluator
         self.create_action_evaluator = create_action_evaluator
         self.create_execution_evaluator = create_execution_evaluator
         self.create_params_evaluator = create_params_evaluator
         self.paramsProvidedConfidence = paramsProvidedConfidence
+        self.router = router
+        self.generation_grading_mode = generation_grading_mode
+        self.cancel_early = cancel_early
+        self.max_generation_attempts = max_generation_attempts
+        self.max_query_rewrites = max_query_rewrites
+        # Shared so a parallel check can return before an abandoned grader call finishes.
+        self._grading_pool = ThreadPoolExecutor(thread_name_prefix="generation-grader") if generation_grading_mode == "parallel" else None
 
 
     def decide_to_generate(self, state):
@@ -20,19 +42,25 @@ class EdgeGraph:
         Returns:
             str: Binary decision for next node to call
         """
-        print("---ASSESS GRADED DOCUMENTS---")
-        question = state["input"]
         filtered_documents = state["documents"]
         if not filtered_documents:
-            print("---DECISION: ALL DOCUMENTS ARE NOT RELEVANT TO QUESTION, TRANSFORM QUERY---")
-            return "transform_query"
+            log.info("decide_to_generate", decision="transform_query", relevant_documents=0)
+            return self._within_retry_budget(state, "transform_query")
         else:
-            print("---DECISION: GENERATE---")
+            log.info("decide_to_generate", decision="generate", relevant_documents=len(filtered_documents))
             return "generate"
 
+    async def adecide_to_generate(self, state):
+        """
+        Async variant of `decide_to_generate`.
+        """
+        return self.decide_to_generate(state)
+
     def grade_generation_v_documents_and_question(self, state):
         """
         Determines whether the generation is grounded in the document and answers question.
+        A retry that would exceed the turn's retry budget goes to "fallback" instead, or to
+        "unsupported fallback" when the generation was not grounded.
 
         Args:
             state (dict): The current graph state
@@ -40,30 +68,114 @@ class EdgeGraph:
         Returns:
             str: Decision for next node to call
         """
-        print("---CHECK HALLUCINATIONS---")
+        return self._within_retry_budget(state, self._grade_generation(state))
+
+    async def agrade_generation_v_documents_and_question(self, state):
+        """
+        Async variant of `grade_generation_v_documents_and_question`.
+        """
+        return self._within_retry_budget(state, await self._agrade_generation(state))
+
+    def _grade_generation(self, state):
         question = state["input"]
         documents = state["documents"]
         generation = state["generation"]
+        if self.generation_grading_mode == "parallel":
+            return self._grade_generation_in_parallel(question, documents, generation)
         score = self.hallucination_grader.invoke({"documents": documents, "generation": generation})
-        grade = score["score"]
-        if grade >= 0.5:
-            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-            print("---GRADE GENERATION vs QUESTION---")
-            score = self.code_evaluator.invoke({"input": question, "generation": generation, "documents": documents})
-            grade = score["score"]
-            if grade >= 0.5:
-                print("---DECISION: GENERATION ADDRESSES QUESTION---")
-                return "useful"
+        if not self._is_grounded(score):
+            return "not supported"
+        score = self.code_evaluator.invoke({"input": question, "generation": generation, "documents": documents})
+        return self._usefulness_decision(score)
+
+    async def _agrade_generation(self, state):
+        question = state["input"]
+        documents = state["documents"]
+        generation = state["generation"]
+        if self.generation_grading_mode == "parallel":
+            return await self._agrade_generation_in_parallel(question, documents, generation)
+        score = await self.hallucination_grader.ainvoke({"documents": documents, "generation": generation})
+        if not self._is_grounded(score):
+            return "not supported"
+        score = await self.code_evaluator.ainvoke({"input": question, "generation": generation, "documents": documents})
+        return self._usefulness_decision(score)
+
+    def _grade_generation_in_parallel(self, question, documents, generation):
+        """
+        Runs the hallucination and usefulness graders at once. A generation that is not grounded is
+        "not supported" whatever its usefulness, so with `cancel_early` that verdict is returned as
+        soon as it arrives, without waiting for the usefulness grader.
+        """
+        # Each grader runs in a copy of this context, so its LLM call is traced and counted under this edge.
+        grounding = self._grading_pool.submit(contextvars.copy_context().run, self.hallucination_grader.invoke, {"documents": documents, "generation": generation})
+        usefulness = self._grading_pool.submit(contextvars.copy_context().run, self.code_evaluator.invoke, {"input": question, "generation": generation, "documents": documents})
+
+        grounded = self._is_grounded(grounding.result())
+        if not self.cancel_early:
+            usefulness.result()
+        if not grounded:
+            if not usefulness.done():
+                # A running thread cannot be stopped; its result is simply not waited for.
+                usefulness.cancel()
+                log.debug("usefulness_grade_abandoned")
+            return "not supported"
+        return self._usefulness_decision(usefulness.result())
+
+    async def _agrade_generation_in_parallel(self, question, documents, generation):
+        """
+        Async variant of `_grade_generation_in_parallel`. An abandoned usefulness grade is cancelled,
+        which also aborts its in-flight LLM request.
+        """
+        grounding = asyncio.ensure_future(self.hallucination_grader.ainvoke({"documents": documents, "generation": generation}))
+        usefulness = asyncio.ensure_future(self.code_evaluator.ainvoke({"input": question, "generation": generation, "documents": documents}))
+
+        try:
+            if self.cancel_early:
+                grounding_score = await grounding
             else:
-                print("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
-                return "not useful"
+                grounding_score, _ = await asyncio.gather(grounding, usefulness)
+            if not self._is_grounded(grounding_score):
+                return "not supported"
+            return self._usefulness_decision(await usefulness)
+        finally:
+            if not usefulness.done():
+                log.debug("usefulness_grade_cancelled")
+                usefulness.cancel()
+
+    def _within_retry_budget(self, state, decision):
+        """
+        Redirects a retry to a fallback once its loop has used up its budget for the turn:
+        re-generating ("not supported") is capped by `max_generation_attempts` and goes to
+        "unsupported fallback", since the latest generation must not be served; re-phrasing the
+        query ("not useful" / "transform_query") is capped by `max_query_rewrites` and goes to "fallback".
+        """
+        if decision == "not supported" and state.get("generation_attempts", 0) >= self.max_generation_attempts:
+            loop = "generate"
+        elif decision in ("not useful", "transform_query") and state.get("query_rewrites", 0) >= self.max_query_rewrites:
+            loop = "transform_query"
         else:
-            print("---DECISION: GENERATIONS ARE HALLUCINATED, RE-TRY---")
-            return "not supported"
+            return decision
+
+        log.warning("retry_budget_exhausted", loop=loop, generation_attempts=state.get("generation_attempts", 0), query_rewrites=state.get("query_rewrites", 0))
+        RETRY_BUDGET_EXHAUSTED.labels(loop=loop).inc()
+        return "unsupported fallback" if loop == "generate" else "fallback"
+
+    def _is_grounded(self, score):
+        grade = score["score"]
+        log.info("grade_hallucination", score=grade, grounded=grade >= 0.5)
+        return grade >= 0.5
+
+    def _usefulness_decision(self, score):
+        grade = score["score"]
+        decision = "useful" if grade >= 0.5 else "not useful"
+        log.info("grade_usefulness", score=grade, decision=decision)
+        return decision
 
     def action_first(self, state):
         """
         Evaluates the user's question to decide the next action based on its content.
+        The keyword router answers the obvious cases; the LLM action evaluator is only called when it is unsure.
+        A route already decided by the entry node is used as is.
 
         Args:
             state (dict): The current graph state
@@ -71,19 +183,50 @@ class EdgeGraph:
         Returns:
             str: A string indicating the next action: "infura", "solidity", or "chat".
         """
-        question = state["generation"]
-        decision = self.create_action_evaluator.invoke({"question": question})
+        decision = state.get("route") or self.route_question(state["generation"])
+        return self._action_decision(state, decision)
+
+    async def aaction_first(self, state):
+        """
+        Async variant of `action_first`.
+        """
+        decision = state.get("route") or await self.aroute_question(state["generation"])
+        return self._action_decision(state, decision)
+
+    def route_question(self, question):
+        """
+        Decides between "infura", "solidity" and "chat" for a question, with the keyword router first and the LLM as fallback.
+        """
+        decision = self._fast_route(question)
+        if decision is None:
+            decision = self.create_action_evaluator.invoke({"question": question})
+        return decision
+
+    async def aroute_question(self, question):
+        """
+        Async variant of `route_question`.
+        """
+        decision = self._fast_route(question)
+        if decision is None:
+            decision = await self.create_action_evaluator.ainvoke({"question": question})
+        return decision
+
+    def _fast_route(self, question):
+        if self.router is None:
+            return None
+        decision = self.router.route(question)
+        log.debug("fast_route", decision=decision)
+        return decision
+
+    def _action_decision(self, state, decision):
         if decision == "infura":
-            print("---DECISION: INFURA---")
             state["vector_store_namespace"] = "infura-docs"
-            return "infura"
         elif decision == "solidity":
-            print("---DECISION: SOLIDITY---")
             state["vector_store_namespace"] = "solidity-docs"
-            return "solidity"
         else:
-            print("---DECISION: CHAT---")
-            return "chat"
+            decision = "chat"
+        log.info("action_first", decision=decision)
+        return decision
 
     def execution_action(self, state):
         """
@@ -95,14 +238,12 @@ class EdgeGraph:
         Returns:
             str: The next node to call
         """
-        print("---EXECUTE ACTION---")
         question = state["input"]
         decision = self.execution_evaluator.invoke({"question": question})
+        log.info("execution_action", decision=decision)
         if decision == "execute":
-            print("---DECISION: EXECUTE INFURA COMMAND---")
             return "retrieveInfura"
         else:
-            print("---DECISION: NO EXECUTION NEEDED---")
             return "chat"
 
     def decide_to_execute(self, state):
@@ -116,32 +257,37 @@ class EdgeGraph:
         Returns:
             str: A string indicating the decision: "execute" or "no-execute".
         """
-        print("---DECISION TO EXECUTE---")
+        decision_with_confidence = self.create_execution_evaluator.invoke(self._execution_inputs(state))
+        return self._execution_decision(decision_with_confidence)
+
+    async def adecide_to_execute(self, state):
+        """
+        Async variant of `decide_to_execute`.
+        """
+        decision_with_confidence = await self.create_execution_evaluator.ainvoke(self._execution_inputs(state))
+        return self._execution_decision(decision_with_confidence)
+
+    def _execution_inputs(self, state):
         question = state["input"]
         generation = state["generation"]
         documents = state.get("documents", [])
-        print(f"Determined documents: {documents}")
-        decision_with_confidence = self.create_execution_evaluator.invoke({
+        return {
             "question": question,
             "generation": generation,
             "documents": documents
-        })
-        print("--------DECISION---------")
-        print(f"Decision with confidence (raw): {decision_with_confidence}")
+        }
+
+    def _execution_decision(self, decision_with_confidence):
         try:
             decision_data = json.loads(decision_with_confidence)
             confidence = decision_data.get("score", 0)
         except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
+            log.warning("unparsable_decision", edge="decide_to_execute", error=str(e), payload={"raw": decision_with_confidence})
             confidence = 0
-        print(f"Confidence score: {confidence}")
         confidence_threshold = 0.6
-        if confidence >= confidence_threshold:
-            print("---CONFIDENT: EXECUTE---")
-            return "execute"
-        else:
-            print("---CONFIDENT: NO EXECUTE---")
-            return "no-execute"
+        decision = "execute" if confidence >= confidence_threshold else "no-execute"
+        log.info("decide_to_execute", confidence=confidence, decision=decision)
+        return decision
 
     def tool_direction(self, state):
         """
@@ -153,15 +299,39 @@ class EdgeGraph:
         Returns:
             str: The next tool to use: "infura" or "solidity".
         """
-        print("---TOOL DIRECTION---")
         vector = state["vector_store_namespace"]
-        if vector == "infura-docs":
-            print("---DECISION: INFURA---")
-            return "infura"
-        else:
-            print("---DECISION: SOLIDITY---")
-            return "solidity"
+        decision = "infura" if vector == "infura-docs" else "solidity"
+        log.info("tool_direction", decision=decision)
+        return decision
         
+
+    async def atool_direction(self, state):
+        """
+        Async variant of `tool_direction`.
+        """
+        return self.tool_direction(state)
+
+    def answer_cached(self, state):
+        """
+        Skips the retrieval pipeline when the semantic answer cache already holds an answer.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            str: "cached" on a cache hit, otherwise the tool to retrieve with: "infura" or "solidity".
+        """
+        if state.get("cache_hit"):
+            log.info("answer_cached", decision="cached")
+            return "cached"
+        return self.tool_direction(state)
+
+    async def aanswer_cached(self, state):
+        """
+        Async variant of `answer_cached`.
+        """
+        return self.answer_cached(state)
+
     
     def paramsCheck(self, state):
         """
@@ -174,32 +344,37 @@ class EdgeGraph:
         Returns:
             str: The next node to call
         """
-        print("---PARAMS CHECK---")
+        decision_with_confidence = self.create_params_evaluator.invoke(self._params_check_inputs(state))
+        return self._params_check_decision(decision_with_confidence)
+
+    async def aparamsCheck(self, state):
+        """
+        Async variant of `paramsCheck`.
+        """
+        decision_with_confidence = await self.create_params_evaluator.ainvoke(self._params_check_inputs(state))
+        return self._params_check_decision(decision_with_confidence)
+
+    def _params_check_inputs(self, state):
         question = state["input"]
         generation = state["generation"]
         documents = state.get("documents", [])
-        print(f"Determined documents: {documents}")
-        decision_with_confidence = self.create_params_evaluator.invoke({
+        return {
             "question": question,
             "curl_command": generation,
             "documents": documents
-        })
-        print("--------DECISION---------")
-        print(f"Decision with confidence (raw): {decision_with_confidence}")
+        }
+
+    def _params_check_decision(self, decision_with_confidence):
         try:
             decision_data = json.loads(decision_with_confidence)
             confidence = decision_data.get("score", 0)
         except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
+            log.warning("unparsable_decision", edge="paramsCheck", error=str(e), payload={"raw": decision_with_confidence})
             confidence = 0
-        print(f"Confidence score: {confidence}")
         confidence_threshold = 0.6
-        if confidence >= confidence_threshold:
-            print("---CONFIDENT: PARAMS ARE NEEDED---")
-            return "params-needed"
-        else:
-            print("---CONFIDENT: NO PARAMS ARE NEEDED---")
-            return "no-params-needed"
+        decision = "params-needed" if confidence >= confidence_threshold else "no-params-needed"
+        log.info("params_check", confidence=confidence, decision=decision)
+        return decision
 
     def paramsProvided(self, state):
         """
@@ -212,27 +387,31 @@ class EdgeGraph:
         Returns:
             str: The next node to call ("params-provided" or "params-not-provided")
         """
-        print("---PARAMS PROVIDED---")
         question = state["input"]
-        generation = state["generation"]
-        documents = state.get("documents", [])
         decision_with_confidence = self.paramsProvidedConfidence.invoke({
             "input": question,
         })
-        print("--------DECISION---------")
-        print(f"Decision with confidence (raw): {decision_with_confidence}")
+        return self._params_provided_decision(decision_with_confidence)
+
+    async def aparamsProvided(self, state):
+        """
+        Async variant of `paramsProvided`.
+        """
+        question = state["input"]
+        decision_with_confidence = await self.paramsProvidedConfidence.ainvoke({
+            "input": question,
+        })
+        return self._params_provided_decision(decision_with_confidence)
+
+    def _params_provided_decision(self, decision_with_confidence):
         try:
             decision_data = json.loads(decision_with_confidence)
             confidence_score = decision_data.get("score", 0.0)
-            print(f"Decision with confidence score: {confidence_score}")
             confidence_threshold = 0.6
-            if confidence_score >= confidence_threshold:
-                print("---DECISION: PARAMS PROVIDED---")
-                return "params-provided"
-            else:
-                print("---DECISION: PARAMS NOT PROVIDED---")
-                return "params-not-provided"
+            decision = "params-provided" if confidence_score >= confidence_threshold else "params-not-provided"
+            log.info("params_provided", confidence=confidence_score, decision=decision)
+            return decision
         except json.JSONDecodeError as e:
-            print(f"Error parsing decision: {e}")
-            print("Falling back to 'params-not-provided' due to parsing issue.")
+            # Falls back to asking the user for the parameters.
+            log.warning("unparsable_decision", edge="paramsProvided", error=str(e), fallback="params-not-provided", payload={"raw": decision_with_confidence})
             return "params-not-provided"
\ No newline at end of file
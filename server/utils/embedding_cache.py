@@ -0,0 +1,157 @@
+import asyncio
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, model: str, max_size: int = 1024, db_path: str = None):
+        """
+        Wraps an embeddings model with a bounded LRU cache for query embeddings and an optional
+        sqlite layer that survives restarts.
+
+        Entries are keyed by model and normalized text (surrounding whitespace stripped, inner
+        whitespace collapsed), so retries that differ only in spacing reuse the same embedding.
+        Case is kept: the embedding model is case-sensitive.
+
+        Args:
+            embeddings (Embeddings): The embeddings model to delegate cache misses to.
+            model (str): The model name, part of every cache key.
+            max_size (int): The maximum number of embeddings held in memory.
+            db_path (str): Optional path of a sqlite database used as a persistent second layer.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.embeddings = embeddings
+        self.model = model
+        self.max_size = max_size
+        self.db_path = db_path
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def _lookup(self, text: str):
+        key = (self.model, self.normalize(text))
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        return key, vector
+
+    def _lookup_disk(self, key):
+        """
+        Looks a key up in the sqlite layer after a memory miss, counting the lookup as a hit or a miss.
+        """
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            vector = array("d", row[0]).tolist()
+            self._remember(key, vector)
+            self.hits += 1
+            self.disk_hits += 1
+            return vector
+
+    def _remember(self, key, vector):
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, key, vector: List[float]):
+        with self._lock:
+            self._remember(key, vector)
+
+    def _persist(self, key, vector: List[float]):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    (*key, array("d", vector).tobytes()),
+                )
+                self._db.commit()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Returns the embedding of a query, computing it only on a cache miss.
+        """
+        key, vector = self._lookup(text)
+        if vector is None:
+            vector = self._lookup_disk(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+            self._persist(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Async variant of `embed_query`. The sqlite layer is read and written on a worker thread,
+        so a memory miss never blocks the event loop on disk I/O.
+        """
+        key, vector = self._lookup(text)
+        if vector is None and self._db is not None:
+            vector = await asyncio.to_thread(self._lookup_disk, key)
+        elif vector is None:
+            vector = self._lookup_disk(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._store(key, vector)
+            if self._db is not None:
+                await asyncio.to_thread(self._persist, key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Document embeddings are not cached; they are delegated to the wrapped model.
+        """
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The hits (memory and disk), disk hits, misses, hit rate and number of embeddings held in memory.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._cache),
+                "max_size": self.max_size,
+            }
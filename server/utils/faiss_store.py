@@ -0,0 +1,334 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+from typing import Any, List
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_openai import OpenAIEmbeddings
+from utils.embedding_cache import CachedEmbeddings
+from utils.lexical_index import BM25Pool, hybrid_retriever
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# Files of a namespace directory.
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.f32"
+DOCUMENTS_FILE = "documents.jsonl"
+
+# The metadata key holding the chunk text, as in PineconeVectorStore.
+TEXT_KEY = "text"
+
+def _replay(directory: str):
+    """
+    Reads a namespace directory and returns its dimension, its number of vector rows and the live
+    entries, mapping each ID to its row and metadata. Later entries override earlier ones, and an
+    entry pointing past the written rows (an interrupted write) is ignored.
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None, 0, {}, False
+    with open(index_path, "r", encoding="utf-8") as index_file:
+        dimension = json.load(index_file)["dimension"]
+
+    vectors_path = os.path.join(directory, VECTORS_FILE)
+    size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+    rows = size // (4 * dimension)
+    consistent = size == rows * 4 * dimension
+
+    live = {}
+    documents_path = os.path.join(directory, DOCUMENTS_FILE)
+    if os.path.exists(documents_path):
+        with open(documents_path, "r", encoding="utf-8") as documents_file:
+            for line in documents_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    consistent = False
+                    continue
+                if entry.get("deleted"):
+                    live.pop(entry["id"], None)
+                elif entry["row"] < rows:
+                    live[entry["id"]] = (entry["row"], entry["metadata"])
+                else:
+                    consistent = False
+    return dimension, rows, live, consistent
+
+class _NamespaceWriter:
+    def __init__(self, directory: str):
+        self.directory = directory
+        _recover(directory)
+        os.makedirs(directory, exist_ok=True)
+        self.dimension, self.rows, live, consistent = _replay(directory)
+        if not consistent:
+            self.compact()
+
+    def upsert(self, vectors):
+        ids, values, metadata = zip(*vectors)
+        array = np.asarray(values, dtype="float32")
+        faiss.normalize_L2(array)
+        if self.dimension is None:
+            self.dimension = array.shape[1]
+            with open(os.path.join(self.directory, INDEX_FILE), "w", encoding="utf-8") as index_file:
+                json.dump({"dimension": self.dimension, "metric": "cosine"}, index_file)
+        if array.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {array.shape[1]} does not match the index dimension {self.dimension}")
+
+        # Vectors are written before the entries that point to them, so a torn write leaves no dangling entry.
+        with open(os.path.join(self.directory, VECTORS_FILE), "ab") as vectors_file:
+            array.tofile(vectors_file)
+        with open(os.path.join(self.directory, DOCUMENTS_FILE), "a", encoding="utf-8") as documents_file:
+            for offset, (vector_id, entry_metadata) in enumerate(zip(ids, metadata)):
+                documents_file.write(json.dumps({"id": vector_id, "row": self.rows + offset, "metadata": entry_metadata}) + "\n")
+        self.rows += len(ids)
+
+    def delete(self, ids):
+        with open(os.path.join(self.directory, DOCUMENTS_FILE), "a", encoding="utf-8") as documents_file:
+            for vector_id in ids:
+                documents_file.write(json.dumps({"id": vector_id, "deleted": True}) + "\n")
+
+    def compact(self):
+        """
+        Rewrites the namespace with only its live entries, in a new directory swapped in by rename.
+        """
+        dimension, rows, live, _ = _replay(self.directory)
+        if dimension is None:
+            return
+        vectors = np.fromfile(os.path.join(self.directory, VECTORS_FILE), dtype="float32", count=rows * dimension).reshape(rows, dimension)
+
+        staging = f"{self.directory}.compact"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        shutil.copy(os.path.join(self.directory, INDEX_FILE), staging)
+        entries = list(live.items())
+        vectors[[row for _, (row, _) in entries]].astype("float32").tofile(os.path.join(staging, VECTORS_FILE))
+        with open(os.path.join(staging, DOCUMENTS_FILE), "w", encoding="utf-8") as documents_file:
+            for row, (vector_id, (_, entry_metadata)) in enumerate(entries):
+                documents_file.write(json.dumps({"id": vector_id, "row": row, "metadata": entry_metadata}) + "\n")
+
+        previous = f"{self.directory}.old"
+        os.replace(self.directory, previous)
+        os.replace(staging, self.directory)
+        shutil.rmtree(previous)
+        self.dimension, self.rows = dimension, len(entries)
+
+def _recover(directory: str):
+    # A compaction interrupted between its two renames leaves only the old copy.
+    previous = f"{directory}.old"
+    if not os.path.exists(directory) and os.path.exists(previous):
+        os.replace(previous, directory)
+
+class LocalVectorIndex:
+    def __init__(self, path: str):
+        """
+        An on-disk vector index with one directory per namespace, written by the ingestion
+        pipeline through the same `upsert` / `delete` calls as a Pinecone index.
+
+        Each namespace is an append-only log: normalized float32 vectors in `vectors.f32` and one
+        JSON entry per upsert or deletion in `documents.jsonl`. Every call is on disk when it
+        returns, so the pipeline's checkpoint never runs ahead of the index. `compact` drops
+        deleted and overwritten rows.
+
+        Args:
+            path (str): The root directory of the index.
+        """
+        self.path = path
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: str) -> _NamespaceWriter:
+        namespace = namespace or ""
+        with self._lock:
+            if namespace not in self._namespaces:
+                self._namespaces[namespace] = _NamespaceWriter(os.path.join(self.path, namespace or "default"))
+            return self._namespaces[namespace]
+
+    def upsert(self, vectors, namespace: str = None):
+        """
+        Writes (id, values, metadata) tuples. An existing ID is overwritten.
+        """
+        if vectors:
+            writer = self._namespace(namespace)
+            with self._lock:
+                writer.upsert(vectors)
+
+    def delete(self, ids, namespace: str = None):
+        writer = self._namespace(namespace)
+        with self._lock:
+            writer.delete(ids)
+
+    def compact(self):
+        """
+        Compacts every namespace written through this index.
+        """
+        with self._lock:
+            for writer in self._namespaces.values():
+                writer.compact()
+
+class NamespaceSnapshot:
+    def __init__(self, directory: str):
+        """
+        A read-only view of a namespace. The vectors are memory-mapped, so opening a namespace
+        reads no vectors and the OS page cache is shared between processes.
+        """
+        dimension, rows, live, _ = _replay(directory)
+        self.vectors = None
+        self.documents = {}
+        self.dead_rows = 0
+        if dimension is None or rows == 0:
+            return
+        self.vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype="float32", mode="r", shape=(rows, dimension))
+        for row, entry_metadata in live.values():
+            entry_metadata = dict(entry_metadata)
+            self.documents[row] = Document(page_content=entry_metadata.pop(TEXT_KEY, ""), metadata=entry_metadata)
+        # Overwritten and deleted rows stay in the file until the next compaction.
+        self.dead_rows = rows - len(self.documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, vector: List[float], k: int) -> List[Document]:
+        """
+        Returns the `k` documents with the highest cosine similarity to `vector`, by exact search.
+        """
+        if not self.documents:
+            return []
+        query = np.asarray([vector], dtype="float32")
+        faiss.normalize_L2(query)
+        _, rows = faiss.knn(query, self.vectors, min(k + self.dead_rows, len(self.vectors)), faiss.METRIC_INNER_PRODUCT)
+        found = [self.documents[row] for row in rows[0] if row in self.documents]
+        return found[:k]
+
+class LocalNamespaceRetriever(BaseRetriever):
+    """
+    A retriever over one memory-mapped namespace, returning the `k` most similar chunks like
+    Pinecone's default retriever.
+    """
+    embeddings: Embeddings
+    snapshot: Any
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.snapshot.search(self.embeddings.embed_query(query), self.k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        # On a cold page cache the exact search reads the memmap from disk.
+        return await asyncio.to_thread(self.snapshot.search, vector, self.k)
+
+class FaissRetriever:
+    def __init__(self, openai_api_key: str, path: str, namespace: str, namespaces=None,
+                 embedding_cache_size: int = 1024, embedding_cache_path: str = None, lazy: bool = False,
+                 embeddings: Embeddings = None, lexical_index_path: str = None, hybrid_candidates: int = 10):
+        """
+        Serves retrieval from the local index built by `documentLoader`, with the same interface as
+        `PineconeRetriever`: a pool of retrievers, one per namespace, chosen on every call.
+
+        Args:
+            openai_api_key (str): The OpenAI API key used for query embeddings.
+            path (str): The root directory of the local index.
+            namespace (str): The default namespace, used when a call does not name one.
+            namespaces (list): Additional namespaces to open at startup. Any other namespace is opened on first use.
+            embedding_cache_size (int): The number of query embeddings kept in the in-memory LRU cache.
+            embedding_cache_path (str): Optional sqlite path that persists query embeddings across restarts.
+            lazy (bool): Defer opening the namespaces until first use (or an explicit `warm_up`).
+            embeddings (Embeddings): The query embeddings model, instead of OpenAI's. It must be the
+                model the index was built with.
+            lexical_index_path (str): The BM25 index built by `documentLoader`. When given, each namespace
+                fuses its vector and BM25 results by reciprocal rank fusion.
+            hybrid_candidates (int): The number of results each side contributes to the fusion.
+        """
+        if embeddings is None and not openai_api_key:
+            raise ValueError("Please provide an OpenAI API key.")
+
+        self.path = path
+        embedding_model = "text-embedding-ada-002"
+        self.embeddings = CachedEmbeddings(
+            embeddings or OpenAIEmbeddings(api_key=openai_api_key, model=embedding_model),
+            model=embedding_model,
+            max_size=embedding_cache_size,
+            db_path=embedding_cache_path,
+        )
+
+        self.namespace = namespace
+        self.namespaces = list(dict.fromkeys([namespace, *(namespaces or [])]))
+
+        self.lexical_index_path = lexical_index_path
+        self.hybrid_candidates = hybrid_candidates
+        self._lexical_indexes = BM25Pool(lexical_index_path) if lexical_index_path else None
+
+        self._retrievers = {}
+        self._retrievers_lock = threading.RLock()
+
+        if not lazy:
+            self.warm_up()
+
+    def warm_up(self):
+        """
+        Opens the configured namespaces.
+        """
+        for name in self.namespaces:
+            self.get_retriever(name)
+
+    def warm_up_lexical(self):
+        """
+        Builds the BM25 indexes of the configured namespaces without opening their vector indexes,
+        so the first hybrid query does not pay for indexing.
+        """
+        if self._lexical_indexes is not None:
+            self._lexical_indexes.warm_up(self.namespaces)
+
+    def _build_retriever(self, namespace: str):
+        snapshot = NamespaceSnapshot(os.path.join(self.path, namespace))
+        if not len(snapshot):
+            log.warning("local_namespace_empty", namespace=namespace, path=self.path)
+        if not self.lexical_index_path:
+            return LocalNamespaceRetriever(embeddings=self.embeddings, snapshot=snapshot)
+        vector_retriever = LocalNamespaceRetriever(embeddings=self.embeddings, snapshot=snapshot, k=self.hybrid_candidates)
+        return hybrid_retriever(vector_retriever, self._lexical_indexes.get(namespace), candidates=self.hybrid_candidates)
+
+    def get_retriever(self, namespace: str = None):
+        """
+        Returns the pooled retriever for a namespace, opening and caching it on first use.
+
+        Args:
+            namespace (str): The namespace to query. Defaults to the namespace given at construction.
+
+        Returns:
+            A retriever object for querying the namespace.
+        """
+        namespace = namespace or self.namespace
+        retriever = self._retrievers.get(namespace)
+        if retriever is None:
+            with self._retrievers_lock:
+                retriever = self._retrievers.get(namespace)
+                if retriever is None:
+                    retriever = self._build_retriever(namespace)
+                    self._retrievers[namespace] = retriever
+        return retriever
+
+    def retrieve(self, query: str, namespace: str = None):
+        """
+        Retrieves the documents most similar to the query from a namespace.
+        """
+        return self.get_retriever(namespace).invoke(query)
+
+    async def aretrieve(self, query: str, namespace: str = None):
+        """
+        Async variant of `retrieve`. A namespace's first call opens it on a worker thread, so
+        replaying its files never stalls the event loop.
+        """
+        retriever = self._retrievers.get(namespace or self.namespace)
+        if retriever is None:
+            retriever = await asyncio.to_thread(self.get_retriever, namespace)
+        return await retriever.ainvoke(query)
@@ -1,6 +1,10 @@
-from langchain.prompts import PromptTemplate
+from langchain.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
-from langchain import hub
+
+# Local copy of the "efriis/self-rag-question-rewriter" LangChain hub prompt, so startup
+# does not depend on a network call to the hub.
+QUESTION_REWRITER_SYSTEM_PROMPT = """You a question re-writer that converts an input question to a better version that is optimized \n 
+     for vectorstore retrieval. Look at the input and try to reason about the underlying semantic intent / meaning."""
 
 class GraderUtils:
     def __init__(self, model):
@@ -35,6 +39,35 @@ class GraderUtils:
 
         return retriever_grader
 
+    def create_batch_retrieval_grader(self):
+        """
+        Creates a retrieval grader that assesses the relevance of several retrieved documents to a user question in a single call.
+
+        Returns:
+            A callable function that takes a numbered list of documents and a question as input and returns a JSON object with a 'scores' list holding one 'yes' or 'no' per document, in order.
+        """
+        batch_grade_prompt = PromptTemplate(
+            template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            You are a grader assessing relevance of retrieved documents to a user question. If a document contains keywords related to the user question, grade it as relevant. It does not need to be a stringent test. The goal is to filter out erroneous retrievals.
+            The documents are numbered starting at 0. Grade every document independently with a binary score 'yes' or 'no'.
+            Provide the scores as a JSON with a single key 'scores' holding a list with exactly {document_count} entries, in the same order as the documents, and no preamble or explanation.
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+
+            Here are the retrieved documents: \n\n {documents} \n\n
+            Here is the user question: {input} \n
+            Here is a rewrited question that might be more clear: {rewrited_question}
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+            input_variables=["documents", "document_count", "input", "rewrited_question"],
+        )
+
+        batch_retriever_grader = batch_grade_prompt | self.model | JsonOutputParser()
+
+        return batch_retriever_grader
+
     def create_hallucination_grader(self):
         """
         Creates a hallucination grader that assesses whether an answer is grounded in/supported by a set of facts using a confidence score.
@@ -100,14 +133,26 @@ class GraderUtils:
 
         return code_evaluator
 
-    def create_question_rewriter(self):
+    def create_question_rewriter(self, use_hub=False):
         """
         Creates a question rewriter chain that rewrites a given question to improve its clarity and relevance.
 
+        Args:
+            use_hub (bool): Pull the prompt from the LangChain hub instead of using the bundled copy.
+
         Returns:
             A callable function that takes a question as input and returns the rewritten question as a string.
         """
-        re_write_prompt = hub.pull("efriis/self-rag-question-rewriter")
+        if use_hub:
+            from langchain import hub
+            re_write_prompt = hub.pull("efriis/self-rag-question-rewriter")
+        else:
+            re_write_prompt = ChatPromptTemplate.from_messages(
+                [
+                    ("system", QUESTION_REWRITER_SYSTEM_PROMPT),
+                    ("human", "Here is the initial question: \n\n {question} \n Formulate an improved question."),
+                ]
+            )
         question_rewriter = re_write_prompt | self.model | StrOutputParser()
 
         return question_rewriter
@@ -9,10 +9,21 @@ class GraphState(TypedDict):
 
     Attributes:
         question: question
+        userId: ID of the user who sent the question, resolved per request
+        convId: ID of the conversation the question belongs to, resolved per request
         generation: LLM generation
         documents: list of documents
         chat_history: chat history
         api_call_count: count of API calls
+        cache_hit: whether the answer was served from the semantic answer cache
+        executed: whether the answer was built from a live chain call
+        rewritten_input: the rewritten question used for retrieval, when question rewriting is enabled
+        route: the route decided while the question was rewritten, when both run concurrently, or "chat" once the chat node answered
+        generation_attempts: number of times `generate` ran in this turn
+        query_rewrites: number of times `transform_query` ran in this turn
+        best_generation: the latest answer produced by `generate`, used if the retry budget runs out
+        grounded_generation: the latest answer that passed the hallucination grader, used if the generate loop runs out
+        retry_budget_exhausted: whether the turn ended with the fallback answer because its retry budget ran out
     """
 
     input: str
@@ -21,4 +32,13 @@ class GraphState(TypedDict):
     generation: str
     documents: List[str]  
     chat_history: List[BaseMessage]   
-    vector_store_namespace: str
\ No newline at end of file
+    vector_store_namespace: str
+    cache_hit: bool
+    executed: bool
+    rewritten_input: str
+    route: str
+    generation_attempts: int
+    query_rewrites: int
+    best_generation: str
+    grounded_generation: str
+    retry_budget_exhausted: bool
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+
+def chunk_id(source_url: str, content: str) -> str:
+    """
+    Returns a deterministic ID for a chunk: a hash of its source URL followed by a hash of its text.
+
+    Re-ingesting an unchanged chunk yields the same ID, so it overwrites itself instead of being
+    duplicated, and every chunk of a URL shares the same ID prefix.
+    """
+    url_hash = hashlib.sha256(source_url.encode("utf-8")).hexdigest()[:16]
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+    return f"{url_hash}#{content_hash}"
+
+class IngestionManifest:
+    def __init__(self, path: str):
+        """
+        Records which chunk IDs each source URL has in each namespace, in a local JSON file.
+
+        The loader skips chunks already listed for their URL and, once a URL is crawled again in
+        full, deletes the listed chunks that the new crawl no longer produced.
+
+        Args:
+            path (str): The JSON file. It is created on the first `save`.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # IDs are kept as sets and only sorted when the file is written.
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                self._entries = {
+                    namespace: {source_url: set(ids) for source_url, ids in urls.items()}
+                    for namespace, urls in json.load(manifest_file).items()
+                }
+
+    def chunk_ids(self, namespace: str, source_url: str) -> set:
+        """
+        Returns the IDs of the chunks ingested from a URL into a namespace.
+        """
+        with self._lock:
+            return set(self._entries.get(namespace, {}).get(source_url, []))
+
+    def add(self, namespace: str, source_url: str, ids):
+        """
+        Adds chunk IDs to a URL, keeping the ones already listed.
+        """
+        with self._lock:
+            self._entries.setdefault(namespace, {}).setdefault(source_url, set()).update(ids)
+
+    def replace(self, namespace: str, source_url: str, ids):
+        """
+        Sets the chunk IDs of a URL to exactly `ids`, after its stale chunks have been deleted.
+        """
+        with self._lock:
+            self._entries.setdefault(namespace, {})[source_url] = set(ids)
+
+    def save(self):
+        """
+        Writes the manifest atomically, so an interrupted run never leaves a truncated file.
+        """
+        with self._lock:
+            entries = {namespace: {source_url: sorted(ids) for source_url, ids in urls.items()} for namespace, urls in self._entries.items()}
+        _write_atomically(self.path, json.dumps(entries, indent=1, sort_keys=True))
+
+class IngestionCheckpoint:
+    def __init__(self, path: str):
+        """
+        Records the progress of an ingestion run, so an interrupted run resumes where it stopped.
+
+        For each URL it lists the pages whose chunks are all in the index, with their chunk IDs,
+        and whether the URL is complete. A resumed run skips complete URLs and the listed pages.
+        The entries of a namespace are discarded when a run over it finishes.
+
+        Args:
+            path (str): The JSON file. It is created on the first `save`.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as checkpoint_file:
+                self._entries = json.load(checkpoint_file)
+
+    def _url(self, namespace: str, source_url: str) -> dict:
+        return self._entries.setdefault(namespace, {}).setdefault(source_url, {"pages": {}, "complete": False})
+
+    def pages(self, namespace: str, source_url: str) -> dict:
+        """
+        Returns the ingested pages of a URL, mapping each page key to its chunk IDs.
+        """
+        with self._lock:
+            return {page_key: set(ids) for page_key, ids in self._entries.get(namespace, {}).get(source_url, {}).get("pages", {}).items()}
+
+    def add_page(self, namespace: str, source_url: str, page_key: str, ids):
+        with self._lock:
+            self._url(namespace, source_url)["pages"][page_key] = sorted(ids)
+
+    def is_complete(self, namespace: str, source_url: str) -> bool:
+        with self._lock:
+            return self._entries.get(namespace, {}).get(source_url, {}).get("complete", False)
+
+    def complete(self, namespace: str, source_url: str):
+        """
+        Marks a URL as complete. Its page list is no longer needed and is dropped.
+        """
+        with self._lock:
+            self._entries.setdefault(namespace, {})[source_url] = {"pages": {}, "complete": True}
+
+    def discard(self, namespace: str):
+        with self._lock:
+            self._entries.pop(namespace, None)
+
+    def save(self):
+        with self._lock:
+            payload = json.dumps(self._entries, indent=1, sort_keys=True)
+        _write_atomically(self.path, payload)
+
+def _write_atomically(path: str, payload: str):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as output_file:
+        output_file.write(payload)
+    os.replace(temporary_path, path)
@@ -0,0 +1,135 @@
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import patch_config
+from utils.metrics import STEP_DURATION, STEP_LLM_CALLS, STEP_TOKENS, RETRIEVED_DOCUMENTS
+
+ROUTES = ("infura", "solidity", "chat")
+NAMESPACE_ROUTES = {"infura-docs": "infura", "solidity-docs": "solidity"}
+
+# Steps that run before `action_first` has picked a route.
+UNROUTED = "unrouted"
+
+RETRIEVAL_NODES = ("retrieveInfura", "retrieveSolidity")
+
+# Rough characters-per-token ratio, used only when the provider reports no token usage (streamed calls).
+CHARS_PER_TOKEN = 4
+
+class StepUsage(BaseCallbackHandler):
+    """
+    Counts the LLM calls and tokens of a single graph step, including the calls of every chain the step runs.
+
+    Token counts come from the provider's `token_usage`. Streamed calls report none, so their prompt is
+    estimated from its length and their completion from the number of streamed chunks.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, sum(len(prompt) for prompt in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, sum(len(str(message.content)) for batch in messages for message in batch))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            if run_id in self._runs:
+                self._runs[run_id][1] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        with self._lock:
+            prompt_chars, chunks = self._runs.pop(run_id, (0, 0))
+            self.llm_calls += 1
+            if usage:
+                self.prompt_tokens += usage.get("prompt_tokens", 0)
+                self.completion_tokens += usage.get("completion_tokens", 0)
+            else:
+                text = "".join(generation.text for generations in response.generations for generation in generations)
+                self.prompt_tokens += prompt_chars // CHARS_PER_TOKEN
+                self.completion_tokens += chunks or len(text) // CHARS_PER_TOKEN
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+            self.llm_calls += 1
+
+    def _start(self, run_id, prompt_chars):
+        with self._lock:
+            self._runs[run_id] = [prompt_chars, 0]
+
+def _with_handler(config, handler):
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    else:
+        callbacks = [*(callbacks or []), handler]
+    return patch_config(config, callbacks=callbacks)
+
+def route_of(state, output=None):
+    """
+    Returns the route of a turn as far as it is known at a step: "infura", "solidity", "chat" or "unrouted".
+    """
+    if isinstance(output, str) and output in ROUTES:
+        return output
+    for source in (output, state):
+        if isinstance(source, dict):
+            route = source.get("route") or NAMESPACE_ROUTES.get(source.get("vector_store_namespace"))
+            if route:
+                return route
+    return UNROUTED
+
+def _observe(name, kind, state, output, elapsed, usage):
+    route = route_of(state, output)
+    STEP_DURATION.labels(node=name, kind=kind, route=route).observe(elapsed)
+    STEP_LLM_CALLS.labels(node=name, kind=kind, route=route).observe(usage.llm_calls)
+    STEP_TOKENS.labels(node=name, kind=kind, route=route, type="prompt").observe(usage.prompt_tokens)
+    STEP_TOKENS.labels(node=name, kind=kind, route=route, type="completion").observe(usage.completion_tokens)
+    if name in RETRIEVAL_NODES and isinstance(output, dict):
+        RETRIEVED_DOCUMENTS.labels(node=name, route=route).observe(len(output.get("documents") or []))
+
+def instrument(step, name: str, kind: str = "node"):
+    """
+    Wraps a graph step so every run records its wall time, LLM calls, prompt and completion tokens
+    and, for retrieval nodes, the number of documents, labeled by step and route.
+
+    The step runs as a child of the wrapper with a `StepUsage` handler added to its callbacks, so
+    the LLM calls of every chain it invokes are attributed to it. Failed runs are recorded too.
+
+    Args:
+        step (Runnable): The node or conditional edge.
+        name (str): The node name, or the edge function name.
+        kind (str): "node" or "edge".
+
+    Returns:
+        RunnableLambda: The instrumented step, with sync and async variants.
+    """
+    def run(state, config):
+        usage = StepUsage()
+        started = time.perf_counter()
+        output = None
+        try:
+            output = step.invoke(state, _with_handler(config, usage))
+            return output
+        finally:
+            _observe(name, kind, state, output, time.perf_counter() - started, usage)
+
+    async def arun(state, config):
+        usage = StepUsage()
+        started = time.perf_counter()
+        output = None
+        try:
+            output = await step.ainvoke(state, _with_handler(config, usage))
+            return output
+        finally:
+            _observe(name, kind, state, output, time.perf_counter() - started, usage)
+
+    return RunnableLambda(run, afunc=arun, name=name)
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+DOCUMENTS_FILE = "documents.jsonl"
+
+# Where the loader and the server look for the index with the Pinecone backend, independent of the
+# working directory either is started from.
+LEXICAL_INDEX_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lexical_index")
+
+# The metadata key holding the chunk text, as in PineconeVectorStore.
+TEXT_KEY = "text"
+
+# Identifiers such as eth_getBlockByHash, msg.sender or 0x-prefixed hashes stay whole tokens.
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+# The constant of reciprocal rank fusion. Larger values flatten the advantage of the top ranks.
+RRF_K = 60
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cases the alphanumeric tokens of a text. A snake_case identifier also yields its parts,
+    so `eth_getBalance` matches both the method name and a query for `getBalance`.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.lower()
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+def _replay(directory: str) -> dict:
+    live = {}
+    documents_path = os.path.join(directory, DOCUMENTS_FILE)
+    if not os.path.exists(documents_path):
+        return live
+    with open(documents_path, "r", encoding="utf-8") as documents_file:
+        for line in documents_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("deleted"):
+                live.pop(entry["id"], None)
+            else:
+                live[entry["id"]] = entry["metadata"]
+    return live
+
+def _repair(documents_path: str):
+    # An interrupted append can leave a partial last line; drop it before appending again.
+    if not os.path.exists(documents_path):
+        return
+    with open(documents_path, "rb+") as documents_file:
+        content = documents_file.read()
+        if content and not content.endswith(b"\n"):
+            documents_file.truncate(content.rfind(b"\n") + 1)
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        """
+        The on-disk store of the BM25 index, written by the ingestion pipeline next to the vector
+        index through the same `upsert` / `delete` calls.
+
+        Each namespace directory holds an append-only `documents.jsonl` of chunk texts and
+        deletions; `BM25Index` builds the inverted index from it when it is opened.
+
+        Args:
+            path (str): The root directory of the index.
+        """
+        self.path = path
+        self._repaired = set()
+        self._lock = threading.Lock()
+
+    def _documents_path(self, namespace: str) -> str:
+        directory = os.path.join(self.path, namespace or "default")
+        documents_path = os.path.join(directory, DOCUMENTS_FILE)
+        if directory not in self._repaired:
+            os.makedirs(directory, exist_ok=True)
+            _repair(documents_path)
+            self._repaired.add(directory)
+        return documents_path
+
+    def ids(self, namespace: str) -> set:
+        """
+        Returns the IDs of the chunks indexed in a namespace.
+        """
+        with self._lock:
+            return set(_replay(os.path.join(self.path, namespace or "default")))
+
+    def upsert(self, vectors, namespace: str = None):
+        """
+        Indexes (id, values, metadata) tuples by the text in their metadata; the values are ignored.
+        """
+        with self._lock:
+            with open(self._documents_path(namespace), "a", encoding="utf-8") as documents_file:
+                for vector_id, _, metadata in vectors:
+                    documents_file.write(json.dumps({"id": vector_id, "metadata": metadata}) + "\n")
+
+    def delete(self, ids, namespace: str = None):
+        with self._lock:
+            with open(self._documents_path(namespace), "a", encoding="utf-8") as documents_file:
+                for vector_id in ids:
+                    documents_file.write(json.dumps({"id": vector_id, "deleted": True}) + "\n")
+
+    def compact(self):
+        """
+        Rewrites every namespace written through this index with only its live chunks.
+        """
+        with self._lock:
+            for directory in self._repaired:
+                documents_path = os.path.join(directory, DOCUMENTS_FILE)
+                temporary_path = f"{documents_path}.tmp"
+                with open(temporary_path, "w", encoding="utf-8") as documents_file:
+                    for vector_id, metadata in _replay(directory).items():
+                        documents_file.write(json.dumps({"id": vector_id, "metadata": metadata}) + "\n")
+                os.replace(temporary_path, documents_path)
+
+class BM25Index:
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75):
+        """
+        An in-memory Okapi BM25 index over the chunks of one namespace.
+
+        Args:
+            directory (str): The namespace directory written by `LexicalIndex`.
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self._lengths = []
+        postings = defaultdict(list)
+        for metadata in _replay(directory).values():
+            metadata = dict(metadata)
+            text = metadata.pop(TEXT_KEY, "")
+            counts = Counter(tokenize(text))
+            for term, frequency in counts.items():
+                postings[term].append((len(self.documents), frequency))
+            self.documents.append(Document(page_content=text, metadata=metadata))
+            self._lengths.append(sum(counts.values()))
+
+        count = len(self.documents)
+        self._postings = dict(postings)
+        self._average_length = sum(self._lengths) / count if count else 0.0
+        self._idf = {term: math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5)) for term, entries in postings.items()}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query: str, k: int) -> List[Document]:
+        """
+        Returns up to `k` chunks ranked by BM25 score; chunks sharing no term with the query are left out.
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, frequency in self._postings[term]:
+                length_norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / self._average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.documents[position] for position, _ in best]
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], limit: int = None, k: int = RRF_K) -> List[Document]:
+    """
+    Merges rankings by reciprocal rank fusion: each chunk scores the sum of 1 / (k + rank) over the
+    rankings it appears in. A chunk is identified by its source and text, so the copy returned by
+    the vector store and the lexical index count as one.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = (document.metadata.get("source"), document.page_content)
+            documents.setdefault(key, document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ordered[:limit]]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses the candidates of a vector retriever and of a BM25 index with reciprocal rank fusion
+    and returns the top `k`.
+    """
+    vector_retriever: BaseRetriever
+    lexical_index: Any
+    k: int = 4
+    candidates: int = 10
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_documents = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return reciprocal_rank_fusion([vector_documents, self.lexical_index.search(query, self.candidates)], limit=self.k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # Scoring a large namespace is pure Python; it runs on a worker thread while the vector side is queried.
+        vector_documents, lexical_documents = await asyncio.gather(
+            self.vector_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()}),
+            asyncio.to_thread(self.lexical_index.search, query, self.candidates),
+        )
+        return reciprocal_rank_fusion([vector_documents, lexical_documents], limit=self.k)
+
+class BM25Pool:
+    def __init__(self, path: str):
+        """
+        Builds the BM25 index of each namespace under `path` once and shares it, so the indexes can
+        be built ahead of the first query without opening the vector side.
+
+        Args:
+            path (str): The root directory written by `LexicalIndex`.
+        """
+        self.path = path
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str) -> BM25Index:
+        """
+        Returns the BM25 index of a namespace, building it on first use.
+        """
+        index = self._indexes.get(namespace)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(namespace)
+                if index is None:
+                    index = BM25Index(os.path.join(self.path, namespace))
+                    if not len(index):
+                        log.warning("lexical_namespace_empty", namespace=namespace, path=self.path)
+                    self._indexes[namespace] = index
+        return index
+
+    def warm_up(self, namespaces: List[str]):
+        for namespace in namespaces:
+            self.get(namespace)
+
+def hybrid_retriever(vector_retriever: BaseRetriever, lexical_index: BM25Index, k: int = 4, candidates: int = 10) -> HybridRetriever:
+    """
+    Wraps a namespace's vector retriever, which should return `candidates` documents, with the
+    BM25 index of the same namespace.
+    """
+    return HybridRetriever(vector_retriever=vector_retriever, lexical_index=lexical_index, k=k, candidates=candidates)
@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import reprlib
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER = "web3buddy"
+
+_settings = {"payloads": True, "sample_rate": 1.0, "max_field_chars": 500}
+_repr = reprlib.Repr()
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, logger, event and the structured fields.
+    """
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without ever blocking the caller. When the queue is full
+    the record is dropped and counted instead.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only the traceback is rendered here; the JSON formatting happens on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(level="INFO", payloads: bool = True, sample_rate: float = 1.0,
+                      max_field_chars: int = 500, queue_size: int = 10000, stream=None):
+    """
+    Routes every `web3buddy.*` logger through a bounded queue to a JSON stream handler on a
+    background thread, so logging never does stdout I/O on the request path.
+
+    Args:
+        level (str): The minimum level, e.g. 'INFO' or 'DEBUG'.
+        payloads (bool): Log payload fields (questions, answers, documents, chat history, command
+            output). Turn off in production so no conversation content reaches the log pipeline.
+        sample_rate (float): The share of DEBUG and INFO records kept. WARNING and above are never sampled.
+        max_field_chars (int): The longest rendering of a single field; longer values are truncated.
+        queue_size (int): Records buffered for the listener thread before new ones are dropped.
+        stream: The output stream, stdout by default.
+    """
+    global _listener
+
+    if not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1")
+
+    _settings.update(payloads=payloads, sample_rate=sample_rate, max_field_chars=max_field_chars)
+    _repr.maxstring = _repr.maxother = max_field_chars
+    _repr.maxlist = _repr.maxdict = _repr.maxtuple = 10
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    root.addHandler(DroppingQueueHandler(log_queue))
+
+def shutdown_logging():
+    """
+    Flushes the queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
+
+def _compact(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else _repr.repr(value)
+    limit = _settings["max_field_chars"]
+    if len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+class StructuredLogger:
+    def __init__(self, name: str):
+        """
+        A logger that takes an event name and keyword fields instead of a formatted message.
+
+        Small fields (IDs, counts, decisions, latencies) are passed as keywords. Conversation
+        content goes in `payload`, which is dropped when payload logging is off; a DEBUG or INFO
+        record that carries a payload is then skipped altogether. Every field is truncated to
+        `max_field_chars`, and nothing is rendered for a record filtered out by level or sampling.
+
+        Args:
+            name (str): The logger name, placed under the `web3buddy` logger.
+        """
+        self._logger = logging.getLogger(name if name.startswith(ROOT_LOGGER) else f"{ROOT_LOGGER}.{name}")
+
+    def debug(self, event: str, payload: dict = None, **fields):
+        self._log(logging.DEBUG, event, payload, fields)
+
+    def info(self, event: str, payload: dict = None, **fields):
+        self._log(logging.INFO, event, payload, fields)
+
+    def warning(self, event: str, payload: dict = None, **fields):
+        self._log(logging.WARNING, event, payload, fields)
+
+    def error(self, event: str, payload: dict = None, **fields):
+        self._log(logging.ERROR, event, payload, fields)
+
+    def exception(self, event: str, payload: dict = None, **fields):
+        self._log(logging.ERROR, event, payload, fields, exc_info=True)
+
+    def _log(self, level, event, payload, fields, exc_info=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            if payload is not None and not _settings["payloads"]:
+                return
+            if random.random() >= _settings["sample_rate"]:
+                return
+        fields = {key: _compact(value) for key, value in fields.items()}
+        if payload and _settings["payloads"]:
+            fields.update((key, _compact(value)) for key, value in payload.items())
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    Returns a structured logger, setting up the default configuration on first use.
+    """
+    if _listener is None:
+        configure_logging()
+    return StructuredLogger(name)
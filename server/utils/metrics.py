@@ -0,0 +1,59 @@
+from prometheus_client import Counter, Histogram
+
+LOOP_ITERATIONS = Histogram(
+    "web3buddy_loop_iterations",
+    "Iterations of a graph retry loop in a single turn",
+    ["loop"],
+    buckets=(0, 1, 2, 3, 4, 5, 8),
+)
+
+RETRY_BUDGET_EXHAUSTED = Counter(
+    "web3buddy_retry_budget_exhausted_total",
+    "Turns that ran out of retry budget and ended with the fallback answer",
+    ["loop"],
+)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "web3buddy_time_to_first_token_seconds",
+    "Seconds from the start of a streamed turn to the first answer token, by answering node",
+    ["node"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30),
+)
+
+STEP_DURATION = Histogram(
+    "web3buddy_step_duration_seconds",
+    "Wall time of a graph node or conditional edge",
+    ["node", "kind", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+
+STEP_LLM_CALLS = Histogram(
+    "web3buddy_step_llm_calls",
+    "LLM calls made by a graph node or conditional edge",
+    ["node", "kind", "route"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16),
+)
+
+STEP_TOKENS = Histogram(
+    "web3buddy_step_tokens",
+    "Prompt and completion tokens used by a graph node or conditional edge",
+    ["node", "kind", "route", "type"],
+    buckets=(0, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+
+RETRIEVED_DOCUMENTS = Histogram(
+    "web3buddy_retrieved_documents",
+    "Documents returned by a retrieval node",
+    ["node", "route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 10, 15, 20),
+)
+
+def record_turn_loops(state):
+    """
+    Records how many times each retry loop ran in a finished turn.
+
+    Args:
+        state (dict): The final graph state.
+    """
+    LOOP_ITERATIONS.labels(loop="generate").observe(state.get("generation_attempts", 0))
+    LOOP_ITERATIONS.labels(loop="transform_query").observe(state.get("query_rewrites", 0))
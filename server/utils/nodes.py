@@ -1,10 +1,14 @@
 from document import Document
 from utils.generate_chain import create_generate_chain
+from utils.rpc_executor import JsonRpcExecutor, CurlParseError, ExecutionError
+from utils.prompts import ANSWER_TAG, create_prompt_registry
+from utils.metrics import record_turn_loops
+from utils.logger import get_logger
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
-from langchain.prompts import PromptTemplate
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
 import time
 import json
 from dotenv import load_dotenv, find_dotenv
@@ -13,116 +17,249 @@ import os
 load_dotenv(find_dotenv()) 
 infura_key = os.getenv("INFURA_API_KEY")
 
+log = get_logger(__name__)
+
+GRADING_MODES = ("sequential", "concurrent", "batch")
+
+# off: no rewrite. use: rewrite, then route and retrieve with the rewritten question.
+# concurrent: route the original question while the rewrite runs, retrieve with the rewritten question.
+REWRITE_MODES = ("off", "use", "concurrent")
+
+FALLBACK_ANSWER = (
+    "I couldn't find enough reliable information in the documentation to answer this question. "
+    "Could you rephrase it or add more details?"
+)
+
+EXECUTION_MAX_RETRIES = 3
+EXECUTION_TIMEOUT = 10
+
 class GraphNodes:
-    def __init__(self, llm, retriever, retrieval_grader, hallucination_grader, code_evaluator, question_rewriter, saveMessage,get_all_messages):
+    def __init__(self, llm, retriever, retrieval_grader, hallucination_grader, code_evaluator, question_rewriter, saveMessage,get_all_messages,
+                 batch_retrieval_grader=None, grading_mode="sequential", grading_concurrency=4,
+                 asaveMessage=None, aget_all_messages=None, answer_cache=None, saveTurn=None, asaveTurn=None,
+                 rpc_executor=None, rewrite_mode="off", route_question=None, aroute_question=None,
+                 prompt_registry=None):
+        if grading_mode not in GRADING_MODES:
+            raise ValueError(f"grading_mode must be one of {GRADING_MODES}, got '{grading_mode}'")
+        if grading_mode == "batch" and batch_retrieval_grader is None:
+            raise ValueError("grading_mode 'batch' requires a batch_retrieval_grader")
+        if rewrite_mode not in REWRITE_MODES:
+            raise ValueError(f"rewrite_mode must be one of {REWRITE_MODES}, got '{rewrite_mode}'")
+        if rewrite_mode == "concurrent" and route_question is None:
+            raise ValueError("rewrite_mode 'concurrent' requires route_question")
+
         self.llm = llm
         self.retriever = retriever
         self.retrieval_grader = retrieval_grader
+        self.batch_retrieval_grader = batch_retrieval_grader
+        self.grading_mode = grading_mode
+        self.grading_concurrency = max(1, int(grading_concurrency))
         self.hallucination_grader = hallucination_grader
         self.code_evaluator = code_evaluator
         self.question_rewriter = question_rewriter
-        self.generate_chain = create_generate_chain(llm)
-        self.userId = ""
-        self.conv_id = ""
+        # The answer-producing runs are tagged so the streaming endpoint can tell their tokens apart.
+        self.generate_chain = create_generate_chain(llm).with_config(tags=[ANSWER_TAG])
+        self.chat_llm = llm.with_config(tags=[ANSWER_TAG])
         self.saveMessage = saveMessage
         self.get_all_messages = get_all_messages
-    
-    def saveChatInfo(self, userId, conv_id):
+        self.asaveMessage = asaveMessage
+        self.aget_all_messages = aget_all_messages
+        self.saveTurn = saveTurn
+        self.asaveTurn = asaveTurn
+        self.answer_cache = answer_cache
+        self.rpc_executor = rpc_executor or JsonRpcExecutor(timeout=EXECUTION_TIMEOUT, max_retries=EXECUTION_MAX_RETRIES)
+        self.rewrite_mode = rewrite_mode
+        self.route_question = route_question
+        self.aroute_question = aroute_question
+        self.prompts = (prompt_registry or create_prompt_registry()).compile(llm)
+
+    def _save_turn(self, user_id, conv_id, messages):
+        """
+        Saves the messages of one turn, in a single write when a turn store was provided.
+        """
+        if self.saveTurn is not None:
+            return self.saveTurn(user_id, conv_id, messages)
+        for message, message_type in messages:
+            self.saveMessage(user_id, conv_id, message, message_type)
+        return True
+
+    async def _asave_turn(self, user_id, conv_id, messages):
         """
-        Save the userId from the state to the graph.
+        Saves the messages of one turn without blocking the event loop, using the async stores when they were provided.
+        """
+        if self.asaveTurn is not None:
+            return await self.asaveTurn(user_id, conv_id, messages)
+        if self.asaveMessage is not None:
+            for message, message_type in messages:
+                await self.asaveMessage(user_id, conv_id, message, message_type)
+            return True
+        return await asyncio.to_thread(self._save_turn, user_id, conv_id, messages)
+
+    def _turn_messages(self, state, answer):
+        """
+        The user and assistant messages of the current turn. The question is saved together with
+        the answer instead of on arrival, so a turn costs a single write.
+        """
+        return [(state["input"], "user"), (answer, "assistant")]
+
+    async def _aget_all_messages(self, user_id, conv_id):
+        """
+        Loads the chat history without blocking the event loop, using the async store when one was provided.
+        """
+        if self.aget_all_messages is not None:
+            return await self.aget_all_messages(user_id, conv_id)
+        return await asyncio.to_thread(self.get_all_messages, user_id, conv_id)
+
+    def _chat_identity(self, state, config):
+        """
+        Resolves the user and conversation of the current request. Identity travels with the
+        request, either in the graph state or in the runnable config's `configurable` section,
+        so concurrent requests never share it.
 
         Args:
             state (dict): The current graph state
+            config (dict): The runnable config of the current run
 
         Returns:
-            dict: Updated state with the userId.
+            tuple: The user ID and the conversation ID.
         """
-        print("---SAVE USER ID---")
-        self.userId = userId
-        self.conv_id = conv_id 
+        configurable = (config or {}).get("configurable", {})
+        user_id = state.get("userId") or configurable.get("user_id", "")
+        conv_id = state.get("convId") or configurable.get("conv_id", "")
+        return user_id, conv_id
 
-    def rewrite_question(self, state):
+    def rewrite_question(self, state, config=None):
         """
-        Rewrites the input question to optimize it for vector store retrieval and tool usage.
+        Entry point of a turn: loads the chat history and, depending on `rewrite_mode`, rewrites the
+        input question to optimize it for vector store retrieval and tool usage.
 
         Args:
             state (dict): The current graph state
+            config (dict): The runnable config, carrying 'user_id' and 'conv_id' under 'configurable'
 
         Returns:
-            dict: Updated state with the rewritten question.
+            dict: Updated state with the chat history and, when enabled, the rewritten question and route.
         """
-        print("---REWRITE QUESTION---")
         question = state["input"]
-        
-        self.saveMessage(self.userId, self.conv_id, question, "user")
+        user_id, conv_id = self._chat_identity(state, config)
+
         chat_history = state.get("chat_history", [])
-        print("----------CHAT HISTORY----------")
-        print(f"context: {chat_history}")
-        print("----------User----------")
-        print(f"userId: {self.userId}")
-        print(f"conv_id: {self.conv_id}")
         if not chat_history:
-            chat_history = self.get_all_messages(self.userId, self.conv_id)
-
-        rewrite_prompt = PromptTemplate(
-            template="""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            Your task is to improve the clarity and precision of the user's question without altering its original intent.
-            Do not add any new information or change the meaning of the question. 
-            Only rewrite the question itself.
-
-            The question to be rewritten is below:
-            "{question}"
-
-            <|eot_id|>
-            <|start_header_id|>user<|end_header_id|>
-            Please rewrite the question to be more clear and concise, while keeping its original intent intact.
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """,
-            input_variables=["question"]
-        )
+            chat_history = self.get_all_messages(user_id, conv_id)
+        self._log_chat_identity(chat_history, user_id, conv_id)
+
+        _, rewrite_chain = self.prompts.get("rewrite_question", user_id)
+        rewritten_question, route = None, None
+        if self.rewrite_mode == "use":
+            rewritten_question = rewrite_chain.invoke({"question": question})
+        elif self.rewrite_mode == "concurrent":
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                # Each call runs in a copy of this context, so its LLM calls stay attributed to this node.
+                routing = pool.submit(contextvars.copy_context().run, self.route_question, question)
+                rewriting = pool.submit(contextvars.copy_context().run, rewrite_chain.invoke, {"question": question})
+                route, rewritten_question = routing.result(), rewriting.result()
+
+        return self._rewritten_state(question, chat_history, user_id, conv_id, rewritten_question, route)
+
+    async def arewrite_question(self, state, config=None):
+        """
+        Async variant of `rewrite_question`.
+        """
+        question = state["input"]
+        user_id, conv_id = self._chat_identity(state, config)
+
+        chat_history = state.get("chat_history", [])
+        if not chat_history:
+            chat_history = await self._aget_all_messages(user_id, conv_id)
+        self._log_chat_identity(chat_history, user_id, conv_id)
+
+        _, rewrite_chain = self.prompts.get("rewrite_question", user_id)
+        rewritten_question, route = None, None
+        if self.rewrite_mode == "use":
+            rewritten_question = await rewrite_chain.ainvoke({"question": question})
+        elif self.rewrite_mode == "concurrent":
+            route, rewritten_question = await asyncio.gather(
+                self._aroute_question(question),
+                rewrite_chain.ainvoke({"question": question})
+            )
 
-        question_rewriter =  rewrite_prompt | self.llm | StrOutputParser()
-        rewritten_question = question_rewriter.invoke({"question": question})
-        print(f"Rewritten Question: {rewritten_question}")
+        return self._rewritten_state(question, chat_history, user_id, conv_id, rewritten_question, route)
 
-        return {
+    async def _aroute_question(self, question):
+        if self.aroute_question is not None:
+            return await self.aroute_question(question)
+        return await asyncio.to_thread(self.route_question, question)
+
+    def _log_chat_identity(self, chat_history, user_id, conv_id):
+        log.info("rewrite_question", user_id=user_id, conv_id=conv_id, rewrite_mode=self.rewrite_mode, history_messages=len(chat_history or []))
+        log.debug("chat_history", payload={"chat_history": chat_history}, user_id=user_id, conv_id=conv_id)
+
+    def _rewritten_state(self, question, chat_history, user_id, conv_id, rewritten_question, route):
+        """
+        Builds the state update of the entry node. In "use" mode the rewritten question also drives
+        routing, which reads 'generation'; in "concurrent" mode the route is already decided.
+        """
+        if rewritten_question is not None:
+            log.debug("rewritten_question", payload={"rewritten_question": rewritten_question}, user_id=user_id)
+
+        update = {
             "chat_history": chat_history,
             "input": question,
             "documents": [],
-            "generation": question,
-            "userId": self.userId,
-            "convId": self.conv_id
+            "generation": rewritten_question if self.rewrite_mode == "use" else question,
+            "userId": user_id,
+            "convId": conv_id,
+            "generation_attempts": 0,
+            "query_rewrites": 0
         }
+        if rewritten_question is not None:
+            update["rewritten_input"] = rewritten_question
+        if route is not None:
+            update["route"] = route
+        return update
 
-    def chat(self, state):
+    def chat(self, state, config=None):
         """
         A chat node to handle conversational interactions using historical context and document retrieval.
         It ensures that the LLM uses retrieved documents to avoid hallucination.
         """
-        print("---CHAT---")
         question = state["input"]
         chat_history = state.get("chat_history", [])
-        print(f"userId: {state['userId']}")
+        log.info("chat", user_id=state["userId"])
 
-        def create_system_prompt(chat_history, input):
-            return (
-                "You are Web3Buddy, a helpful assistant that provides detailed answers about Web3. "
-                "Always refer to the context from the previous conversation and the following retrieved documents. "
-                "Do not make up any information; if the documents do not have enough details, say you don't know. "
+        system_prompt = self._chat_system_prompt(chat_history, question)
+        
+        response = self.chat_llm.invoke(system_prompt, config)
 
-                f"Chat History:\n{chat_history}\n\n"
-                
-                f"Question: {input}\n\n"
-            )
+        return self._chat_response(state, question, chat_history, response)
 
-        system_prompt = create_system_prompt(chat_history, question)
-        
-        response = self.llm.invoke(system_prompt)
+    async def achat(self, state, config=None):
+        """
+        Async variant of `chat`.
+        """
+        question = state["input"]
+        chat_history = state.get("chat_history", [])
+        log.info("chat", user_id=state["userId"])
+
+        system_prompt = self._chat_system_prompt(chat_history, question)
+
+        response = await self.chat_llm.ainvoke(system_prompt, config)
+
+        return self._chat_response(state, question, chat_history, response)
+
+    def _chat_system_prompt(self, chat_history, input):
+        return (
+            "You are Web3Buddy, a helpful assistant that provides detailed answers about Web3. "
+            "Always refer to the context from the previous conversation and the following retrieved documents. "
+            "Do not make up any information; if the documents do not have enough details, say you don't know. "
 
-        print("---CHAT RESPONSE---")
-        print( response)
+            f"Chat History:\n{chat_history}\n\n"
+            
+            f"Question: {input}\n\n"
+        )
+
+    def _chat_response(self, state, question, chat_history, response):
+        log.debug("chat_response", payload={"response": response.content}, user_id=state["userId"])
         chat_history.append(HumanMessage(content=question))
         chat_history.append(response)
 
@@ -133,9 +270,54 @@ class GraphNodes:
             "chat_history": chat_history,
             "input": question,
             "documents": [],
-            "generation": response.content  
+            "generation": response.content,
+            "route": "chat"
         }
 
+    def answer_cache_infura(self, state):
+        """
+        Looks up a cached answer for a question routed to the Infura documentation.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            state (dict): The routed namespace, whether the cache hit and, on a hit, the cached answer as 'generation'.
+        """
+        return self._answer_cache_result(state, "infura-docs", self.answer_cache.lookup(state["input"], "infura-docs"))
+
+    async def aanswer_cache_infura(self, state):
+        """
+        Async variant of `answer_cache_infura`.
+        """
+        return self._answer_cache_result(state, "infura-docs", await self.answer_cache.alookup(state["input"], "infura-docs"))
+
+    def answer_cache_solidity(self, state):
+        """
+        Looks up a cached answer for a question routed to the Solidity documentation.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            state (dict): The routed namespace, whether the cache hit and, on a hit, the cached answer as 'generation'.
+        """
+        return self._answer_cache_result(state, "solidity-docs", self.answer_cache.lookup(state["input"], "solidity-docs"))
+
+    async def aanswer_cache_solidity(self, state):
+        """
+        Async variant of `answer_cache_solidity`.
+        """
+        return self._answer_cache_result(state, "solidity-docs", await self.answer_cache.alookup(state["input"], "solidity-docs"))
+
+    def _answer_cache_result(self, state, namespace, cached_answer):
+        if cached_answer is None:
+            log.info("answer_cache", namespace=namespace, hit=False)
+            return {"vector_store_namespace": namespace, "cache_hit": False}
+
+        log.info("answer_cache", namespace=namespace, hit=True)
+        return {"vector_store_namespace": namespace, "cache_hit": True, "generation": cached_answer}
+
     def retrieveInfura(self, state):
         """
         Retrieve documents from the vector store based on the user's query.
@@ -146,17 +328,21 @@ class GraphNodes:
         Returns:
             state (dict): New key added to state, 'documents', that contains retrieved documents
         """
-        print("---RETRIEVE---")
-        improvedQuestion = state["input"]
-     
-        print(f"Improved Question: {improvedQuestion}")
+        improvedQuestion = state.get("rewritten_input") or state["input"]
         new_namespace = "infura-docs"
-        changed_retriever = self.retriever.set_namespace(new_namespace)
-        infura_retriver = self.retriever.get_retriever()
-        documents = infura_retriver.invoke(improvedQuestion)
-        print("---RETRIEVED DOCUMENTS---")
-        print(documents)
-        return {"documents": documents, "input": improvedQuestion, "vector_store_namespace": "infura-docs"}
+        documents = self.retriever.retrieve(improvedQuestion, namespace=new_namespace)
+        self._log_retrieval(improvedQuestion, new_namespace, documents)
+        return {"documents": documents, "input": state["input"], "vector_store_namespace": "infura-docs"}
+
+    async def aretrieveInfura(self, state):
+        """
+        Async variant of `retrieveInfura`.
+        """
+        improvedQuestion = state.get("rewritten_input") or state["input"]
+        new_namespace = "infura-docs"
+        documents = await self.retriever.aretrieve(improvedQuestion, namespace=new_namespace)
+        self._log_retrieval(improvedQuestion, new_namespace, documents)
+        return {"documents": documents, "input": state["input"], "vector_store_namespace": "infura-docs"}
     
     def retrieveSolidity(self, state):
         """
@@ -168,65 +354,266 @@ class GraphNodes:
         Returns:
             state (dict): New key added to state, 'documents', that contains retrieved documents
         """
-        print("---RETRIEVE---")
-        improvedQuestion = state["input"]
-     
-        print(f"Improved Question: {improvedQuestion}")
+        improvedQuestion = state.get("rewritten_input") or state["input"]
+
+        new_namespace = "solidity-docs"
+        documents = self.retriever.retrieve(improvedQuestion, namespace=new_namespace)
+        self._log_retrieval(improvedQuestion, new_namespace, documents)
+        return {"documents": documents, "input": state["input"], "vector_store_namespace": new_namespace}
+
+    async def aretrieveSolidity(self, state):
+        """
+        Async variant of `retrieveSolidity`.
+        """
+        improvedQuestion = state.get("rewritten_input") or state["input"]
 
         new_namespace = "solidity-docs"
-        changed_retriever = self.retriever.set_namespace(new_namespace)
-        solidity_retriver = self.retriever.get_retriever()
-        documents = solidity_retriver.invoke(improvedQuestion)
-        print("---RETRIEVED DOCUMENTS---")
-        print(documents)
-        return {"documents": documents, "input": improvedQuestion, "vector_store_namespace": new_namespace}
+        documents = await self.retriever.aretrieve(improvedQuestion, namespace=new_namespace)
+        self._log_retrieval(improvedQuestion, new_namespace, documents)
+        return {"documents": documents, "input": state["input"], "vector_store_namespace": new_namespace}
+
+    def _log_retrieval(self, question, namespace, documents):
+        log.info("retrieve", namespace=namespace, documents=len(documents))
+        log.debug("retrieved_documents", payload={"question": question, "documents": documents}, namespace=namespace)
 
-    def generate(self, state):
+    def generate(self, state, config=None):
         """
         Generate an answer using LLM based on retrieved documents and the question.
 
         Args:
             state (dict): The current graph state
+            config (dict): The runnable config of the node, passed on so the answer tokens are streamed
 
         Returns:
             state (dict): New key added to state, 'generation', that contains LLM generation
         """
-        print("---GENERATE---")
         question = state["input"]
         documents = state["documents"]
+        log.info("generate", attempt=state.get("generation_attempts", 0) + 1, documents=len(documents))
+
+        generation = self.generate_chain.invoke({"context": documents, "input": question}, config)
+        return {
+            "documents": documents,
+            "input": question,
+            "generation": generation,
+            "best_generation": generation,
+            "generation_attempts": state.get("generation_attempts", 0) + 1
+        }
+
+    async def agenerate(self, state, config=None):
+        """
+        Async variant of `generate`.
+        """
+        question = state["input"]
+        documents = state["documents"]
+        log.info("generate", attempt=state.get("generation_attempts", 0) + 1, documents=len(documents))
 
-        generation = self.generate_chain.invoke({"context": documents, "input": question})
-        return {"documents": documents, "input": question, "generation": generation}
+        generation = await self.generate_chain.ainvoke({"context": documents, "input": question}, config)
+        return {
+            "documents": documents,
+            "input": question,
+            "generation": generation,
+            "best_generation": generation,
+            "generation_attempts": state.get("generation_attempts", 0) + 1
+        }
 
     def grade_documents(self, state):
         """
         Determines whether the retrieved documents are relevant to the question.
 
+        Depending on `grading_mode`, documents are graded one after another ("sequential"),
+        fanned out to at most `grading_concurrency` parallel grader calls ("concurrent"),
+        or graded together in a single structured prompt ("batch"). The filtered documents
+        always keep their retrieval order.
+
         Args:
             state (dict): The current graph state
 
         Returns:
             state (dict): Updates 'documents' key with only filtered relevant documents
         """
-        print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
         question = state["input"]
         documents = state["documents"]
         generation = state.get("generation", "")
-        print(f"Question: {question}")
-        print(f"Documents: {documents}")
 
+        started = time.perf_counter()
+        if self.grading_mode == "batch":
+            results = self._grade_documents_batch(question, documents, generation)
+        elif self.grading_mode == "concurrent":
+            results = self._grade_documents_concurrently(question, documents, generation)
+        else:
+            results = [self._grade_document(question, d, generation) for d in documents]
+        elapsed = time.perf_counter() - started
+
+        filtered_docs = self._filter_graded_documents(documents, results, elapsed)
+
+        return {"documents": filtered_docs, "input": question}
+
+    async def agrade_documents(self, state):
+        """
+        Async variant of `grade_documents`. In "concurrent" mode the grader calls are awaited
+        together, bounded by a semaphore of size `grading_concurrency`.
+        """
+        question = state["input"]
+        documents = state["documents"]
+        generation = state.get("generation", "")
+
+        started = time.perf_counter()
+        if self.grading_mode == "batch":
+            results = await self._agrade_documents_batch(question, documents, generation)
+        elif self.grading_mode == "concurrent":
+            results = await self._agrade_documents_concurrently(question, documents, generation)
+        else:
+            results = [await self._agrade_document(question, d, generation) for d in documents]
+        elapsed = time.perf_counter() - started
+
+        filtered_docs = self._filter_graded_documents(documents, results, elapsed)
+
+        return {"documents": filtered_docs, "input": question}
+
+    def _filter_graded_documents(self, documents, results, elapsed):
+        """
+        Keeps the documents graded as relevant, in retrieval order, and reports grading latency.
+
+        Args:
+            documents (list): The retrieved documents.
+            results (list): One (grade, latency) tuple per document.
+            elapsed (float): The total grading time in seconds.
+
+        Returns:
+            list: The relevant documents.
+        """
         filtered_docs = []
-        for d in documents:
-            score = self.retrieval_grader.invoke({"input": question, "document": d.page_content, "rewrited_question":generation } )
-            grade = score["score"]
+        for index, (d, (grade, latency)) in enumerate(zip(documents, results)):
+            log.debug("grade_document", index=index, relevant=grade == "yes", latency_s=round(latency, 3))
             if grade == "yes":
-                print("---GRADE: DOCUMENT RELEVANT---")
                 filtered_docs.append(d)
-            else:
-                print("---GRADE: DOCUMENT IRRELEVANT---")
-                continue
 
-        return {"documents": filtered_docs, "input": question}
+        log.info("grade_documents", mode=self.grading_mode, documents=len(documents), relevant=len(filtered_docs), elapsed_s=round(elapsed, 3))
+
+        return filtered_docs
+
+    def _grade_document(self, question, document, generation):
+        """
+        Grades a single document against the question.
+
+        Args:
+            question (str): The user's question.
+            document (Document): The retrieved document to grade.
+            generation (str): The rewritten question, if any.
+
+        Returns:
+            tuple: The grade ('yes' or 'no') and the grading latency in seconds.
+        """
+        started = time.perf_counter()
+        score = self.retrieval_grader.invoke({"input": question, "document": document.page_content, "rewrited_question": generation})
+        return score["score"], time.perf_counter() - started
+
+    async def _agrade_document(self, question, document, generation):
+        """
+        Async variant of `_grade_document`.
+        """
+        started = time.perf_counter()
+        score = await self.retrieval_grader.ainvoke({"input": question, "document": document.page_content, "rewrited_question": generation})
+        return score["score"], time.perf_counter() - started
+
+    def _grade_documents_concurrently(self, question, documents, generation):
+        """
+        Grades all documents at once with at most `grading_concurrency` grader calls in flight.
+
+        Args:
+            question (str): The user's question.
+            documents (list): The retrieved documents to grade.
+            generation (str): The rewritten question, if any.
+
+        Returns:
+            list: One (grade, latency) tuple per document, in the same order as `documents`.
+        """
+        if not documents:
+            return []
+
+        max_workers = min(self.grading_concurrency, len(documents))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # One context copy per call, taken here, so the grader calls stay attributed to this node.
+            futures = [executor.submit(contextvars.copy_context().run, self._grade_document, question, d, generation) for d in documents]
+            return [future.result() for future in futures]
+
+    async def _agrade_documents_concurrently(self, question, documents, generation):
+        """
+        Async variant of `_grade_documents_concurrently`.
+        """
+        semaphore = asyncio.Semaphore(self.grading_concurrency)
+
+        async def grade(d):
+            async with semaphore:
+                return await self._agrade_document(question, d, generation)
+
+        return list(await asyncio.gather(*(grade(d) for d in documents)))
+
+    def _batch_grading_inputs(self, question, documents, generation):
+        numbered_documents = "\n\n".join(
+            f"Document {index}:\n{d.page_content}" for index, d in enumerate(documents)
+        )
+        return {
+            "input": question,
+            "documents": numbered_documents,
+            "document_count": len(documents),
+            "rewrited_question": generation,
+        }
+
+    def _grade_documents_batch(self, question, documents, generation):
+        """
+        Grades all documents in a single structured prompt. The per-document latency is the
+        call latency amortized over the documents. Falls back to concurrent grading when the
+        grader does not return exactly one score per document.
+
+        Args:
+            question (str): The user's question.
+            documents (list): The retrieved documents to grade.
+            generation (str): The rewritten question, if any.
+
+        Returns:
+            list: One (grade, latency) tuple per document, in the same order as `documents`.
+        """
+        if not documents:
+            return []
+
+        started = time.perf_counter()
+        try:
+            score = self.batch_retrieval_grader.invoke(self._batch_grading_inputs(question, documents, generation))
+            grades = score["scores"]
+        except Exception as e:
+            log.warning("batch_grading_failed", error=str(e), fallback="concurrent")
+            return self._grade_documents_concurrently(question, documents, generation)
+        latency = (time.perf_counter() - started) / len(documents)
+
+        if not isinstance(grades, list) or len(grades) != len(documents):
+            log.warning("batch_grading_mismatch", documents=len(documents), fallback="concurrent")
+            return self._grade_documents_concurrently(question, documents, generation)
+
+        return [(grade, latency) for grade in grades]
+
+    async def _agrade_documents_batch(self, question, documents, generation):
+        """
+        Async variant of `_grade_documents_batch`.
+        """
+        if not documents:
+            return []
+
+        started = time.perf_counter()
+        try:
+            score = await self.batch_retrieval_grader.ainvoke(self._batch_grading_inputs(question, documents, generation))
+            grades = score["scores"]
+        except Exception as e:
+            log.warning("batch_grading_failed", error=str(e), fallback="concurrent")
+            return await self._agrade_documents_concurrently(question, documents, generation)
+        latency = (time.perf_counter() - started) / len(documents)
+
+        if not isinstance(grades, list) or len(grades) != len(documents):
+            log.warning("batch_grading_mismatch", documents=len(documents), fallback="concurrent")
+            return await self._agrade_documents_concurrently(question, documents, generation)
+
+        return [(grade, latency) for grade in grades]
 
     def transform_query(self, state):
         """
@@ -238,14 +625,41 @@ class GraphNodes:
         Returns:
             state (dict): Updates 'input' key with a re-phrased question
         """
-        print("---TRANSFORM QUERY---")
         question = state["input"]
         documents = state["documents"]
-        print("-----transform query-----")
+        log.info("transform_query", rewrite=state.get("query_rewrites", 0) + 1)
 
         better_question = self.question_rewriter.invoke({"question": question})
-        print(f"Better Question: {better_question}")
-        return {"documents": documents, "input": question, "generation": better_question}
+        log.debug("better_question", payload={"better_question": better_question})
+        return {
+            "documents": documents,
+            "input": question,
+            "generation": better_question,
+            # A generation rejected as "not supported" is always generated again before a rewrite,
+            # so the latest one reaching here passed the hallucination grader.
+            "grounded_generation": state.get("best_generation"),
+            "query_rewrites": state.get("query_rewrites", 0) + 1
+        }
+
+    async def atransform_query(self, state):
+        """
+        Async variant of `transform_query`.
+        """
+        question = state["input"]
+        documents = state["documents"]
+        log.info("transform_query", rewrite=state.get("query_rewrites", 0) + 1)
+
+        better_question = await self.question_rewriter.ainvoke({"question": question})
+        log.debug("better_question", payload={"better_question": better_question})
+        return {
+            "documents": documents,
+            "input": question,
+            "generation": better_question,
+            # A generation rejected as "not supported" is always generated again before a rewrite,
+            # so the latest one reaching here passed the hallucination grader.
+            "grounded_generation": state.get("best_generation"),
+            "query_rewrites": state.get("query_rewrites", 0) + 1
+        }
     
     def transform_execution(self, state):
         """
@@ -258,40 +672,32 @@ class GraphNodes:
         Returns:
             dict: Updated state with the extracted cURL command.
         """
-        print("---TRANSFORM EXECUTION---")
+        log.info("transform_execution")
         
         question = state["input"]
         generation = state["generation"]
         
-        transform_prompt = PromptTemplate(
-            template="""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            You are tasked with extracting only the cURL command from a given block of text.
-            
-            The extracted cURL command should not contain any Markdown formatting or explanation text, 
-            and it must be fully executable in a terminal. Ensure the following:
-
-            - Remove any "```bash" or similar Markdown notation.
-            - Replace any mentions of API keys with `infuraKey` within curly brakets to be replaced later.
-            - Provide only the clean cURL command, no additional information.
-
-            Below is the text from which to extract the cURL command:
-            {generation}
-
-            <|eot_id|>
-            <|start_header_id|>user<|end_header_id|>
-            Ensure only the cURL command is returned without any surrounding Markdown notation or extra explanation.
-            The placeholder for the API key should be replaced with `infuraKey` within curly brakets .
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """,
-            input_variables=["generation"]
-        )
-        
-        extract_command = transform_prompt | self.llm | StrOutputParser()
+        _, extract_command = self.prompts.get("transform_execution", state.get("userId"))
         curl_command = extract_command.invoke({"generation": generation})
 
-        print(f"Extracted cURL Command: {curl_command}")
+        return self._transformed_execution(state, question, curl_command)
+
+    async def atransform_execution(self, state):
+        """
+        Async variant of `transform_execution`.
+        """
+        log.info("transform_execution")
+
+        question = state["input"]
+        generation = state["generation"]
+
+        _, extract_command = self.prompts.get("transform_execution", state.get("userId"))
+        curl_command = await extract_command.ainvoke({"generation": generation})
+
+        return self._transformed_execution(state, question, curl_command)
+
+    def _transformed_execution(self, state, question, curl_command):
+        log.debug("extracted_command", payload={"command": curl_command})
 
         curl_command_cleaned = curl_command.replace("```bash", "").replace("```", "").strip()
 
@@ -306,8 +712,9 @@ class GraphNodes:
     
     def execution(self, state):
         """
-        Executes the cURL command extracted from the generation, inserts the Infura key, and returns the command output.
-        Retries up to 3 times in case of failure or timeout, and returns an error message if unsuccessful.
+        Executes the cURL command extracted from the generation, inserts the Infura key, and returns the response.
+        The command is parsed and sent in process by the JSON-RPC executor, never through a shell, and
+        failed attempts are retried with exponential backoff. Returns an error message if unsuccessful.
 
         Args:
             state (dict): The current graph state, containing 'generation' (the cURL command).
@@ -315,54 +722,56 @@ class GraphNodes:
         Returns:
             dict: Updated state with the result of the cURL command execution or an error message.
         """
-        print("---EXECUTING CURL COMMAND---")
-        
+        curl_command_with_key = self._curl_command_with_key(state)
+
+        try:
+            command_output = self.rpc_executor.execute(curl_command_with_key)
+            return self._execution_output(state, command_output)
+        except CurlParseError as e:
+            return self._return_error(state, f"This command cannot be executed: {e}")
+        except ExecutionError:
+            return self._return_error(state, self._unavailable_message(state))
+
+    async def aexecution(self, state):
+        """
+        Async variant of `execution`.
+        """
+        curl_command_with_key = self._curl_command_with_key(state)
+
+        try:
+            command_output = await self.rpc_executor.aexecute(curl_command_with_key)
+            return self._execution_output(state, command_output)
+        except CurlParseError as e:
+            return self._return_error(state, f"This command cannot be executed: {e}")
+        except ExecutionError:
+            return self._return_error(state, self._unavailable_message(state))
+
+    def _unavailable_message(self, state):
+        # The generated command, not the one carrying the Infura key, so the key never reaches the user.
+        return f"Service for this {state['generation']} is currently unavailable."
+
+    def _curl_command_with_key(self, state):
         curl_command = state["generation"]
 
         curl_command_with_key = curl_command.replace("{infuraKey}", infura_key)
 
-        print(f"Executing: {curl_command_with_key}")
-
-        print(f"user id: {state['userId']}")
-        max_retries = 3
-        retry_delay = 2
-
-        for attempt in range(max_retries):
-            try:
-                result = subprocess.run(curl_command_with_key, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
-                
-                command_output = result.stdout.decode('utf-8')
-                print(f"Command Output: {command_output}")
-                
-                state["generation"] = command_output
-
-                return {
-                    "chat_history": state.get("chat_history", []),
-                    "input": state["input"],
-                    "documents": state.get("documents", []),
-                    "generation": command_output
-                }
-            
-            except subprocess.TimeoutExpired:
-                print(f"Attempt {attempt+1}: Timeout occurred while executing the command.")
-                if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    print("Max retries reached. Service unavailable.")
-                    error_message = f"Service for this {curl_command_with_key} is currently unavailable due to a timeout."
-                    return self._return_error(state, error_message)
-            
-            except subprocess.CalledProcessError as e:
-                error_message = e.stderr.decode('utf-8')
-                print(f"Attempt {attempt+1}: Error executing cURL command: {error_message}")
-                if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    print("Max retries reached. Service unavailable.")
-                    error_message = f"Service for this {curl_command_with_key} is currently unavailable."
-                    return self._return_error(state, error_message)
+        # The command is logged before the key is inserted, so the key never reaches the logs.
+        log.info("execution", user_id=state["userId"])
+        log.debug("execution_command", payload={"command": curl_command})
+        return curl_command_with_key
+
+    def _execution_output(self, state, command_output):
+        log.debug("execution_output", payload={"output": command_output})
+
+        state["generation"] = command_output
+
+        return {
+            "chat_history": state.get("chat_history", []),
+            "input": state["input"],
+            "documents": state.get("documents", []),
+            "generation": command_output,
+            "executed": True
+        }
 
     def _return_error(self, state, error_message):
         """
@@ -375,13 +784,14 @@ class GraphNodes:
         Returns:
             dict: Updated state with the error message.
         """
-        print(f"Returning error: {error_message}")
-        
+        log.warning("execution_failed", payload={"error": error_message})
+
         return {
             "chat_history": state.get("chat_history", []),
             "input": state["input"],
             "documents": state.get("documents", []),
-            "generation": error_message
+            "generation": error_message,
+            "executed": True
         }
 
     def path_to_execution(self, state):
@@ -394,7 +804,7 @@ class GraphNodes:
         Returns:
             dict: The updated state indicating the next steps.
         """
-        print("---Guiding to probable execution---")
+        log.info("path_to_execution")
         return {
             "chat_history": state.get("chat_history", []),
             "input": state.get("input"),
@@ -402,52 +812,53 @@ class GraphNodes:
             "generation": state.get("generation"),
         
         }
+
+    async def apath_to_execution(self, state):
+        """
+        Async variant of `path_to_execution`.
+        """
+        return self.path_to_execution(state)
     
-    def execution_interpreter(self, state):
+    def execution_interpreter(self, state, config=None):
         """
         Interprets the output of the cURL command execution and provides a concise response.
         If the result contains hexadecimal values, it converts them to human-readable numbers.
 
         Args:
             state (dict): The current graph state, containing 'generation' (the command output).
+            config (dict): The runnable config of the node, passed on so the answer tokens are streamed.
 
         Returns:
             dict: Updated state with the interpretation of the command output.
         """
-        print("---Interpreting Execution Output---")
+        log.info("execution_interpreter")
         
         command_output = state["generation"]
         documents = state.get("documents", [])
         input_question = state["input"]
 
-        interpret_prompt = PromptTemplate(
-            template="""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            Your task is to interpret the output of the cURL command execution and provide a clear response explaning what this command result means.
-            If there are any hexadecimal values in the "result" field (e.g., "0x497c5d178"), convert them to human-readable decimal numbers and explain their significance.
-            Provide only the most relevant interpretation of the output, including any errors if present. Make sure that in the answer you show the command used and the output, then explain.
+        _, interpretation = self.prompts.get("execution_interpreter", state.get("userId"))
+        interpretation_output = interpretation.invoke({"generation": command_output, "documents": documents, "input": input_question}, config)
 
-            The output of the cURL command execution is below:
-            {generation}
-            
-            The question that led to this command execution is: {input}
+        return self._interpreted_execution(state, interpretation_output)
 
-            Additionally, consider the following documents which may provide context:
-            {documents}
-            
-            <|eot_id|>
-            <|start_header_id|>user<|end_header_id|>
-            Please interpret the output of the cURL command execution. Convert any hexadecimal values to human-readable numbers.
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """,
-            input_variables=["generation", "documents", "input"]
-        )
-        
-        interpretation = interpret_prompt | self.llm | StrOutputParser()
-        interpretation_output = interpretation.invoke({"generation": command_output, "documents": documents, "input": input_question})
+    async def aexecution_interpreter(self, state, config=None):
+        """
+        Async variant of `execution_interpreter`.
+        """
+        log.info("execution_interpreter")
+
+        command_output = state["generation"]
+        documents = state.get("documents", [])
+        input_question = state["input"]
 
-        print(f"Interpreted Output: {interpretation_output}")
+        _, interpretation = self.prompts.get("execution_interpreter", state.get("userId"))
+        interpretation_output = await interpretation.ainvoke({"generation": command_output, "documents": documents, "input": input_question}, config)
+
+        return self._interpreted_execution(state, interpretation_output)
+
+    def _interpreted_execution(self, state, interpretation_output):
+        log.debug("interpreted_output", payload={"interpretation": interpretation_output})
 
         return {
                 "chat_history": state.get("chat_history", []),
@@ -468,18 +879,26 @@ class GraphNodes:
             dict: The updated state indicating the parameters needed for the cURL command, with parameter names and types.
         """
         
-        print("---PARAMS NEEDED---")
+        log.info("params_needed")
         return {
             "chat_history": state.get("chat_history", []),
             "input": state.get("input"),
             "documents": state.get("documents", []),
         }
-    def params_inquiry(self, state):
+
+    async def aparams_needed(self, state):
+        """
+        Async variant of `params_needed`.
+        """
+        return self.params_needed(state)
+
+    def params_inquiry(self, state, config=None):
         """ 
         Inquires about the missing parameters for the cURL command execution.
 
         Args:
             state (dict): The current graph state, containing the cURL command, related documents, and the user's input question.
+            config (dict): The runnable config of the node, passed on so the answer tokens are streamed.
 
         Returns:
             dict: The updated state indicating the parameters needed for the cURL command, with parameter names and types.
@@ -489,55 +908,43 @@ class GraphNodes:
         documents = state.get("documents", [])
         input_question = state["input"]
 
-        interpret_prompt = PromptTemplate(
-            template="""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            Your task is to analyze the provided cURL command and identify which parameters are required for its execution. 
-            Specifically, you will:
-            
-            1. Review the cURL command and check if there is a method call (e.g., "eth_call").
-            2. Identify if parameters such as `address`, `block`, or others are required based on the method call.
-            3. Review the provided documents to see if the method mentioned in the cURL command has any specific parameters that are necessary.
-            4. Provide a structured response in the following format:
-            
-            {{
-            "input": "{input_question}",                # The question or input that led to the cURL command
-            "content": "A brief description of the needed parameters",  # Explanation of the parameters
-            "params": {{
-                "param_name_1": "param_type_1",         # Param name and type (string, bool, int, etc.)
-                "param_name_2": "param_type_2"
-            }}
-            }}
-            
-            DO NOT ADD MARKDOWN NOTATION ```json , PLAIN OBJECT 
-            The cURL command is provided below:
-            {generation}
-
-            The question that led to this cURL command is: {input_question}
+        _, interpretation = self.prompts.get("params_inquiry", state.get("userId"))
 
-            Additionally, consider the following documents which may provide context:
-            {documents}
+        interpretation_output = interpretation.invoke({
+            "generation": command_output, 
+            "documents": documents, 
+            "input_question": input_question
+        }, config)
 
-            Ignore any references to API keys and focus only on relevant execution parameters such as `address`, `block`, `data`, etc.
+        log.info("params_inquiry", user_id=state.get("userId"))
+        record_turn_loops(state)
+        self._save_turn(state.get("userId", ""), state.get("convId", ""), self._turn_messages(state, interpretation_output))
+        return {
+            "chat_history": state.get("chat_history", []),
+            "input": state.get("input"),
+            "documents": state.get("documents", []),
+            "generation": interpretation_output,
+        }
 
-            <|eot_id|>
-            <|start_header_id|>user<|end_header_id|>
-            Please analyze the cURL command, check for method calls, and identify the required parameters for execution. Provide the structured response with parameter names and types.
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """,
-            input_variables=["generation", "documents", "input_question"]
-        )
+    async def aparams_inquiry(self, state, config=None):
+        """
+        Async variant of `params_inquiry`.
+        """
+        command_output = state["generation"]
+        documents = state.get("documents", [])
+        input_question = state["input"]
 
-        interpretation = interpret_prompt | self.llm | StrOutputParser()
+        _, interpretation = self.prompts.get("params_inquiry", state.get("userId"))
 
-        interpretation_output = interpretation.invoke({
-            "generation": command_output, 
-            "documents": documents, 
+        interpretation_output = await interpretation.ainvoke({
+            "generation": command_output,
+            "documents": documents,
             "input_question": input_question
-        })
+        }, config)
 
-        print("---PARAMS INQUIRY---")
+        log.info("params_inquiry", user_id=state.get("userId"))
+        record_turn_loops(state)
+        await self._asave_turn(state.get("userId", ""), state.get("convId", ""), self._turn_messages(state, interpretation_output))
         return {
             "chat_history": state.get("chat_history", []),
             "input": state.get("input"),
@@ -555,16 +962,105 @@ class GraphNodes:
         Returns:
             dict: The final state indicating the end of the conversation.
         """
-        print("---END---")
-        print(f"documents: {state['documents']}")
-        print(f"userId: {state['userId']}")
-        print(f"conv_id: {state['convId']}")
-        print(f"generation: {state['generation']}")
-        print(f"chat_history: {state['chat_history']}")
-        print(f"input: {state['input']}")
+        self._log_final_state(state)
+        record_turn_loops(state)
+
+        self._save_turn(state["userId"], state["convId"], self._turn_messages(state, state["generation"]))
+
+        if self._should_cache_answer(state):
+            self.answer_cache.store(state["input"], state["vector_store_namespace"], state["generation"], executed=state.get("executed", False))
+
+        return self._final_state(state)
+
+    async def aending(self, state):
+        """
+        Async variant of `ending`.
+        """
+        self._log_final_state(state)
+        record_turn_loops(state)
+
+        await self._asave_turn(state["userId"], state["convId"], self._turn_messages(state, state["generation"]))
+
+        if self._should_cache_answer(state):
+            await self.answer_cache.astore(state["input"], state["vector_store_namespace"], state["generation"], executed=state.get("executed", False))
+
+        return self._final_state(state)
+
+    def fallback(self, state):
+        """
+        Ends a turn whose query rewrite budget ran out. Answers with the latest generation, which
+        passed the hallucination grader but was not judged useful, or with a request to rephrase
+        when nothing was generated.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            dict: Updated state with the fallback answer.
+        """
+        return self._fallback(state, "fallback", state.get("best_generation"))
+
+    async def afallback(self, state):
+        """
+        Async variant of `fallback`.
+        """
+        return self.fallback(state)
+
+    def unsupported_fallback(self, state):
+        """
+        Ends a turn whose generation budget ran out on a generation not supported by the documents.
+        That generation is never served: the turn answers with the latest grounded generation, or
+        with a request to rephrase when there is none.
+
+        Args:
+            state (dict): The current graph state
+
+        Returns:
+            dict: Updated state with the fallback answer.
+        """
+        return self._fallback(state, "unsupported_fallback", state.get("grounded_generation"))
 
-        self.saveMessage(state["userId"], state["convId"], state["generation"], "assistant")
+    async def aunsupported_fallback(self, state):
+        """
+        Async variant of `unsupported_fallback`.
+        """
+        return self.unsupported_fallback(state)
+
+    def _fallback(self, state, event, generation):
+        log.warning(event, generation_attempts=state.get("generation_attempts", 0), query_rewrites=state.get("query_rewrites", 0), has_generation=bool(generation))
+        return {
+            "documents": state.get("documents", []),
+            "input": state["input"],
+            "generation": generation or FALLBACK_ANSWER,
+            "retry_budget_exhausted": True
+        }
+
+    def _should_cache_answer(self, state):
+        """
+        Answers are cached only for documentation routes, and never when they were served from the cache.
+        """
+        return (
+            self.answer_cache is not None
+            and not state.get("cache_hit", False)
+            and not state.get("retry_budget_exhausted", False)
+            and state.get("vector_store_namespace") in ("infura-docs", "solidity-docs")
+            and isinstance(state.get("generation"), str)
+        )
+
+    def _log_final_state(self, state):
+        log.info(
+            "ending",
+            user_id=state["userId"],
+            conv_id=state["convId"],
+            documents=len(state.get("documents", [])),
+            cache_hit=bool(state.get("cache_hit")),
+            executed=bool(state.get("executed")),
+            generation_attempts=state.get("generation_attempts", 0),
+            query_rewrites=state.get("query_rewrites", 0),
+        )
+        log.debug("final_state", payload={"input": state["input"], "generation": state["generation"], "documents": state.get("documents", [])}, user_id=state["userId"])
 
+    def _final_state(self, state):
         return {
             "chat_history": state.get("chat_history", []),
             "input": state.get("input"),
@@ -586,52 +1082,7 @@ class GraphNodes:
         input_question = state["input"]
         documents = state.get("documents", [])
 
-        add_params_prompt = PromptTemplate(
-            template="""
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            Your task is to insert the provided parameters into the cURL command. The command has placeholders or an empty "params" array, 
-            and your task is to replace those with the actual values provided within the input.
-
-            RETURN THE PLAIN COMMAND, NO MARKDOWN  like this ```bash ```
-
-            Follow these steps:
-            1. Identify where the "params" array is located in the cURL command.
-            2. Replace the placeholders or empty values with the actual parameter values provided within the input.
-            3. Ensure that all provided parameters are correctly inserted into the command.
-
-            Example:
-
-            Input command:
-            curl -X POST https://mainnet.infura.io/v3/{{infuraKey}} 
-            -H "Content-Type: application/json" 
-            -d '{{"jsonrpc":"2.0","method":"eth_getBlockByHash","params": ["<BLOCK_HASH>", true],"id":1}}'
-
-            Parameters provided:
-            {{"params": ["0x12345abcde...", true]}}
-
-            Output:
-            curl -X POST https://mainnet.infura.io/v3/{{infuraKey}} 
-            -H "Content-Type: application/json" 
-            -d '{{"jsonrpc":"2.0","method":"eth_getBlockByHash","params": ["0x12345abcde...", true],"id":1}}'
-            
-            Your output must return only the updated cURL command.
-
-            <|eot_id|>
-            <|start_header_id|>context<|end_header_id|>
-            cURL Command: {generation}
-            Input (which contains the params): {input}
-            Documents for reference: {documents}
-
-            <|eot_id|>
-            <|start_header_id|>user<|end_header_id|>
-            Insert the provided parameters into the cURL command and return the complete cURL command for execution.
-            <|eot_id|>
-            <|start_header_id|>assistant<|end_header_id|>
-            """,
-            input_variables=["generation", "input", "documents"]
-        )
-        
-        add_params_interpreter = add_params_prompt | self.llm | StrOutputParser()
+        _, add_params_interpreter = self.prompts.get("adding_params", state.get("userId"))
         updated_curl_command = add_params_interpreter.invoke({
             "generation": command_output, 
             "input": input_question,
@@ -643,4 +1094,26 @@ class GraphNodes:
             "input": state.get("input"),
             "documents": state.get("documents", []),
             "generation": updated_curl_command  
-        }
\ No newline at end of file
+        }
+
+    async def aadding_params(self, state):
+        """
+        Async variant of `adding_params`.
+        """
+        command_output = state["generation"]
+        input_question = state["input"]
+        documents = state.get("documents", [])
+
+        _, add_params_interpreter = self.prompts.get("adding_params", state.get("userId"))
+        updated_curl_command = await add_params_interpreter.ainvoke({
+            "generation": command_output,
+            "input": input_question,
+            "documents": documents
+        })
+
+        return {
+            "chat_history": state.get("chat_history", []),
+            "input": state.get("input"),
+            "documents": state.get("documents", []),
+            "generation": updated_curl_command
+        }
@@ -1,40 +1,137 @@
+import asyncio
+import threading
 from pinecone import Pinecone
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
+from utils.embedding_cache import CachedEmbeddings
+from utils.lexical_index import BM25Pool, hybrid_retriever
 
 class PineconeRetriever:
-    def __init__(self, pinecone_api_key: str, openai_api_key: str, index_name: str, namespace: str):
+    def __init__(self, pinecone_api_key: str, openai_api_key: str, index_name: str, namespace: str, namespaces=None,
+                 embedding_cache_size: int = 1024, embedding_cache_path: str = None, lazy: bool = False,
+                 lexical_index_path: str = None, hybrid_candidates: int = 10):
+        """
+        Initializes the Pinecone index and a pool of retrievers, one per namespace.
+
+        Retrievers are never mutated after they are built, so callers choose the namespace on
+        every call and concurrent requests cannot change each other's namespace.
+
+        Args:
+            pinecone_api_key (str): The Pinecone API key.
+            openai_api_key (str): The OpenAI API key used for query embeddings.
+            index_name (str): The name of the Pinecone index.
+            namespace (str): The default namespace, used when a call does not name one.
+            namespaces (list): Additional namespaces to build retrievers for at startup. Any other
+                namespace is built lazily on first use and then cached.
+            embedding_cache_size (int): The number of query embeddings kept in the in-memory LRU cache.
+            embedding_cache_path (str): Optional sqlite path that persists query embeddings across restarts.
+            lazy (bool): Defer connecting to the Pinecone index and building the pool until first use
+                (or an explicit `warm_up`), so constructing the retriever makes no network calls.
+            lexical_index_path (str): The BM25 index built by `documentLoader`. When given, each namespace
+                fuses its vector and BM25 results by reciprocal rank fusion.
+            hybrid_candidates (int): The number of results each side contributes to the fusion.
+        """
         if not pinecone_api_key or not openai_api_key:
             raise ValueError("Please provide both Pinecone and OpenAI API keys.")
 
-      
-        self.index = self._initialize_pinecone(pinecone_api_key, index_name)
- 
-        self.embeddings = OpenAIEmbeddings(api_key=openai_api_key, model="text-embedding-ada-002")
- 
-        self.vector_store = PineconeVectorStore(index=self.index, embedding=self.embeddings, namespace=namespace)
- 
-        self.retriever = self.vector_store.as_retriever()
+        self._pinecone_api_key = pinecone_api_key
+        self.index_name = index_name
+        self._index = None
+
+        embedding_model = "text-embedding-ada-002"
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(api_key=openai_api_key, model=embedding_model),
+            model=embedding_model,
+            max_size=embedding_cache_size,
+            db_path=embedding_cache_path,
+        )
+
+        self.namespace = namespace
+        self.namespaces = list(dict.fromkeys([namespace, *(namespaces or [])]))
+
+        self.lexical_index_path = lexical_index_path
+        self.hybrid_candidates = hybrid_candidates
+        self._lexical_indexes = BM25Pool(lexical_index_path) if lexical_index_path else None
+
+        self._retrievers = {}
+        self._retrievers_lock = threading.RLock()
+
+        if not lazy:
+            self.warm_up()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._retrievers_lock:
+                if self._index is None:
+                    self._index = self._initialize_pinecone(self._pinecone_api_key, self.index_name)
+        return self._index
+
+    def warm_up(self):
+        """
+        Connects to the Pinecone index and builds the retrievers of the configured namespaces.
+        """
+        for name in self.namespaces:
+            self.get_retriever(name)
+
+    def warm_up_lexical(self):
+        """
+        Builds the BM25 indexes of the configured namespaces without connecting to Pinecone, so the
+        first hybrid query does not pay for indexing.
+        """
+        if self._lexical_indexes is not None:
+            self._lexical_indexes.warm_up(self.namespaces)
 
     def _initialize_pinecone(self, api_key: str, index_name: str):
         pc = Pinecone(api_key=api_key)
         return pc.Index(index_name)
 
-    def set_namespace(self, new_namespace: str):
+    def _build_retriever(self, namespace: str):
+        vector_store = PineconeVectorStore(index=self.index, embedding=self.embeddings, namespace=namespace)
+        if not self.lexical_index_path:
+            return vector_store.as_retriever()
+        vector_retriever = vector_store.as_retriever(search_kwargs={"k": self.hybrid_candidates})
+        return hybrid_retriever(vector_retriever, self._lexical_indexes.get(namespace), candidates=self.hybrid_candidates)
+
+    def get_retriever(self, namespace: str = None):
         """
-        Updates the namespace for the vector store and retriever.
+        Returns the pooled retriever for a namespace, building and caching it on first use.
 
         Args:
-            new_namespace (str): The new namespace to set.
+            namespace (str): The namespace to query. Defaults to the namespace given at construction.
+
+        Returns:
+            A retriever object for querying the vector store.
         """
-        self.vector_store = PineconeVectorStore(index=self.index, embedding=self.embeddings, namespace=new_namespace)
-        self.retriever = self.vector_store.as_retriever()
+        namespace = namespace or self.namespace
+        retriever = self._retrievers.get(namespace)
+        if retriever is None:
+            with self._retrievers_lock:
+                retriever = self._retrievers.get(namespace)
+                if retriever is None:
+                    retriever = self._build_retriever(namespace)
+                    self._retrievers[namespace] = retriever
+        return retriever
 
-    def get_retriever(self):
+    def retrieve(self, query: str, namespace: str = None):
         """
-        Returns the current retriever object.
+        Retrieves the documents most similar to the query from a namespace.
+
+        Args:
+            query (str): The query to search for.
+            namespace (str): The namespace to query. Defaults to the namespace given at construction.
 
         Returns:
-            A retriever object for querying the vector store.
+            list: The retrieved documents.
+        """
+        return self.get_retriever(namespace).invoke(query)
+
+    async def aretrieve(self, query: str, namespace: str = None):
+        """
+        Async variant of `retrieve`. A namespace's first call connects to the index and builds its
+        retriever on a worker thread, so the blocking index lookup never stalls the event loop.
         """
-        return self.retriever
+        retriever = self._retrievers.get(namespace or self.namespace)
+        if retriever is None:
+            retriever = await asyncio.to_thread(self.get_retriever, namespace)
+        return await retriever.ainvoke(query)
@@ -0,0 +1,299 @@
+import hashlib
+import random
+from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+# Tag of the chains whose output is shown to the user as the answer. The streaming endpoint only
+# forwards tokens of model runs carrying it, so grader and routing tokens never reach the client.
+ANSWER_TAG = "web3buddy:answer"
+
+# Version 1 of every GraphNodes prompt. New versions are registered next to them in
+# `create_prompt_registry` and rolled out with `PromptRegistry.set_weights`.
+
+REWRITE_QUESTION_PROMPT = PromptTemplate(
+    template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            Your task is to improve the clarity and precision of the user's question without altering its original intent.
+            Do not add any new information or change the meaning of the question. 
+            Only rewrite the question itself.
+
+            The question to be rewritten is below:
+            "{question}"
+
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+            Please rewrite the question to be more clear and concise, while keeping its original intent intact.
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+    input_variables=["question"]
+)
+
+TRANSFORM_EXECUTION_PROMPT = PromptTemplate(
+    template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            You are tasked with extracting only the cURL command from a given block of text.
+            
+            The extracted cURL command should not contain any Markdown formatting or explanation text, 
+            and it must be fully executable in a terminal. Ensure the following:
+
+            - Remove any "```bash" or similar Markdown notation.
+            - Replace any mentions of API keys with `infuraKey` within curly brakets to be replaced later.
+            - Provide only the clean cURL command, no additional information.
+            - If the text needs several JSON-RPC calls to the same endpoint, return a single cURL command whose 
+              data is a JSON array of those calls (a JSON-RPC batch), each with its own "id".
+
+            Below is the text from which to extract the cURL command:
+            {generation}
+
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+            Ensure only the cURL command is returned without any surrounding Markdown notation or extra explanation.
+            The placeholder for the API key should be replaced with `infuraKey` within curly brakets .
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+    input_variables=["generation"]
+)
+
+EXECUTION_INTERPRETER_PROMPT = PromptTemplate(
+    template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            Your task is to interpret the output of the cURL command execution and provide a clear response explaning what this command result means.
+            If there are any hexadecimal values in the "result" field (e.g., "0x497c5d178"), convert them to human-readable decimal numbers and explain their significance.
+            Provide only the most relevant interpretation of the output, including any errors if present. Make sure that in the answer you show the command used and the output, then explain.
+
+            The output of the cURL command execution is below:
+            {generation}
+            
+            The question that led to this command execution is: {input}
+
+            Additionally, consider the following documents which may provide context:
+            {documents}
+            
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+            Please interpret the output of the cURL command execution. Convert any hexadecimal values to human-readable numbers.
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+    input_variables=["generation", "documents", "input"]
+)
+
+PARAMS_INQUIRY_PROMPT = PromptTemplate(
+    template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            Your task is to analyze the provided cURL command and identify which parameters are required for its execution. 
+            Specifically, you will:
+            
+            1. Review the cURL command and check if there is a method call (e.g., "eth_call").
+            2. Identify if parameters such as `address`, `block`, or others are required based on the method call.
+            3. Review the provided documents to see if the method mentioned in the cURL command has any specific parameters that are necessary.
+            4. Provide a structured response in the following format:
+            
+            {{
+            "input": "{input_question}",                # The question or input that led to the cURL command
+            "content": "A brief description of the needed parameters",  # Explanation of the parameters
+            "params": {{
+                "param_name_1": "param_type_1",         # Param name and type (string, bool, int, etc.)
+                "param_name_2": "param_type_2"
+            }}
+            }}
+            
+            DO NOT ADD MARKDOWN NOTATION ```json , PLAIN OBJECT 
+            The cURL command is provided below:
+            {generation}
+
+            The question that led to this cURL command is: {input_question}
+
+            Additionally, consider the following documents which may provide context:
+            {documents}
+
+            Ignore any references to API keys and focus only on relevant execution parameters such as `address`, `block`, `data`, etc.
+
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+            Please analyze the cURL command, check for method calls, and identify the required parameters for execution. Provide the structured response with parameter names and types.
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+    input_variables=["generation", "documents", "input_question"]
+)
+
+ADDING_PARAMS_PROMPT = PromptTemplate(
+    template="""
+            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+            Your task is to insert the provided parameters into the cURL command. The command has placeholders or an empty "params" array, 
+            and your task is to replace those with the actual values provided within the input.
+
+            RETURN THE PLAIN COMMAND, NO MARKDOWN  like this ```bash ```
+
+            Follow these steps:
+            1. Identify where the "params" array is located in the cURL command.
+            2. Replace the placeholders or empty values with the actual parameter values provided within the input.
+            3. Ensure that all provided parameters are correctly inserted into the command.
+
+            Example:
+
+            Input command:
+            curl -X POST https://mainnet.infura.io/v3/{{infuraKey}} 
+            -H "Content-Type: application/json" 
+            -d '{{"jsonrpc":"2.0","method":"eth_getBlockByHash","params": ["<BLOCK_HASH>", true],"id":1}}'
+
+            Parameters provided:
+            {{"params": ["0x12345abcde...", true]}}
+
+            Output:
+            curl -X POST https://mainnet.infura.io/v3/{{infuraKey}} 
+            -H "Content-Type: application/json" 
+            -d '{{"jsonrpc":"2.0","method":"eth_getBlockByHash","params": ["0x12345abcde...", true],"id":1}}'
+            
+            Your output must return only the updated cURL command.
+
+            <|eot_id|>
+            <|start_header_id|>context<|end_header_id|>
+            cURL Command: {generation}
+            Input (which contains the params): {input}
+            Documents for reference: {documents}
+
+            <|eot_id|>
+            <|start_header_id|>user<|end_header_id|>
+            Insert the provided parameters into the cURL command and return the complete cURL command for execution.
+            <|eot_id|>
+            <|start_header_id|>assistant<|end_header_id|>
+            """,
+    input_variables=["generation", "input", "documents"]
+)
+
+class PromptRegistry:
+    def __init__(self):
+        """
+        Holds every version of the GraphNodes prompts and how traffic is split between them.
+
+        A prompt with a single version always uses it. With several versions, `select` picks one by
+        weight, deterministically per key (the user ID), so a user keeps seeing the same variant
+        for the whole A/B test.
+        """
+        self._prompts = {}
+        self._weights = {}
+        self._tags = {}
+
+    def register(self, name: str, version: str, prompt: PromptTemplate, weight: float = None, tags: list = None):
+        """
+        Registers a prompt version.
+
+        Args:
+            name (str): The prompt name, e.g. 'transform_execution'.
+            version (str): The version label, e.g. 'v1'.
+            prompt (PromptTemplate): The prompt.
+            weight (float): The share of traffic for this version. Without weights, only the most
+                recently registered version receives traffic.
+            tags (list): Extra tags of the compiled chain, such as `ANSWER_TAG`.
+        """
+        self._prompts.setdefault(name, {})[version] = prompt
+        self._tags.setdefault(name, {})[version] = list(tags or [])
+        if weight is not None:
+            self._weights.setdefault(name, {})[version] = weight
+
+    def set_weights(self, name: str, weights: dict):
+        """
+        Sets the traffic split of a prompt, e.g. {"v1": 0.9, "v2": 0.1}.
+        """
+        unknown = set(weights) - set(self._prompts.get(name, {}))
+        if unknown:
+            raise ValueError(f"Unknown versions for prompt '{name}': {sorted(unknown)}")
+        if not any(weight > 0 for weight in weights.values()):
+            raise ValueError(f"At least one version of prompt '{name}' needs a positive weight")
+        self._weights[name] = dict(weights)
+
+    def versions(self, name: str):
+        return list(self._prompts[name])
+
+    def select(self, name: str, key: str = None):
+        """
+        Picks the version of a prompt to use.
+
+        Args:
+            name (str): The prompt name.
+            key (str): A stable key, such as the user ID, that pins the choice. None picks at random.
+
+        Returns:
+            str: The selected version.
+        """
+        weights = {version: weight for version, weight in self._weights.get(name, {}).items() if weight > 0}
+        if not weights:
+            return self.versions(name)[-1]
+        if len(weights) == 1:
+            return next(iter(weights))
+
+        if key is None:
+            point = random.random()
+        else:
+            digest = hashlib.sha256(f"{name}:{key}".encode()).digest()
+            point = int.from_bytes(digest[:8], "big") / 2 ** 64
+
+        total = sum(weights.values())
+        cumulative = 0.0
+        for version, weight in weights.items():
+            cumulative += weight / total
+            if point < cumulative:
+                return version
+        return version
+
+    def compile(self, llm):
+        """
+        Builds the `prompt | llm | parser` chain of every registered version once. Each chain is
+        tagged with its prompt name and version, so traces can be compared per variant.
+
+        Args:
+            llm: The chat model shared by the chains.
+
+        Returns:
+            CompiledPrompts: The chains, selected per call with `get`.
+        """
+        chains = {
+            name: {
+                version: (prompt | llm | StrOutputParser()).with_config(
+                    run_name=name,
+                    tags=[f"prompt:{name}:{version}", *self._tags[name][version]],
+                    metadata={"prompt": name, "prompt_version": version}
+                )
+                for version, prompt in versions.items()
+            }
+            for name, versions in self._prompts.items()
+        }
+        return CompiledPrompts(self, chains)
+
+class CompiledPrompts:
+    def __init__(self, registry: PromptRegistry, chains: dict):
+        self.registry = registry
+        self.chains = chains
+
+    def get(self, name: str, key: str = None):
+        """
+        Returns the selected version of a prompt and its prebuilt chain.
+
+        Args:
+            name (str): The prompt name.
+            key (str): A stable key, such as the user ID, that pins the A/B choice.
+
+        Returns:
+            tuple: The version and the chain.
+        """
+        version = self.registry.select(name, key)
+        return version, self.chains[name][version]
+
+def create_prompt_registry():
+    """
+    Creates the registry with the current version of every GraphNodes prompt.
+
+    Returns:
+        PromptRegistry: The registry.
+    """
+    registry = PromptRegistry()
+    registry.register("rewrite_question", "v1", REWRITE_QUESTION_PROMPT)
+    registry.register("transform_execution", "v1", TRANSFORM_EXECUTION_PROMPT)
+    registry.register("execution_interpreter", "v1", EXECUTION_INTERPRETER_PROMPT, tags=[ANSWER_TAG])
+    registry.register("params_inquiry", "v1", PARAMS_INQUIRY_PROMPT, tags=[ANSWER_TAG])
+    registry.register("adding_params", "v1", ADDING_PARAMS_PROMPT)
+    return registry
@@ -0,0 +1,84 @@
+import re
+
+# (route, pattern, weight). Patterns are matched case-insensitively against the question.
+ROUTING_RULES = [
+    # Live chain data and the Infura API.
+    ("infura", r"\binfura\b", 3),
+    ("infura", r"\beth_[a-z]+\b", 4),
+    ("infura", r"\bjson[- ]?rpc\b", 3),
+    ("infura", r"\b0x[0-9a-f]{64}\b", 3),
+    ("infura", r"\b0x[0-9a-f]{40}\b", 2),
+    ("infura", r"\b(latest|current|last|recent) block\b", 3),
+    ("infura", r"\bblock (number|height|hash)\b", 2),
+    ("infura", r"\b(current|latest|today'?s)? ?gas (price|fees?)\b", 2),
+    ("infura", r"\b(balance|nonce) of\b", 2),
+    ("infura", r"\b(account|wallet|address) balance\b", 2),
+    ("infura", r"\btransaction (receipt|status|count|by hash)\b", 2),
+    ("infura", r"\bchain ?id\b", 2),
+    ("infura", r"\b(mainnet|sepolia|holesky|goerli|polygon|arbitrum|optimism|linea)\b", 1),
+    ("infura", r"\b(api key|endpoint|rate limit|curl)\b", 1),
+    # Smart contract development.
+    ("solidity", r"\bsolidity\b", 3),
+    ("solidity", r"\bsmart contracts?\b", 2),
+    ("solidity", r"\bpragma\b", 3),
+    ("solidity", r"\b(modifier|mapping|struct|enum|payable|fallback|receive|constructor|inheritance|interface|abstract contract|library)\b", 2),
+    ("solidity", r"\b(u?int(8|16|32|64|128|256)?|bytes32|address payable)\b", 2),
+    ("solidity", r"\b(msg\.sender|msg\.value|block\.timestamp|require\(|revert\(|assert\(|emit )", 3),
+    ("solidity", r"\b(erc-?20|erc-?721|erc-?1155|openzeppelin|reentrancy)\b", 2),
+    ("solidity", r"\b(remix|hardhat|foundry|truffle|solc|abi|bytecode)\b", 1),
+    ("solidity", r"\b(storage|memory|calldata)\b", 1),
+    ("solidity", r"\b(view|pure) functions?\b", 2),
+    ("solidity", r"\bgas optimi[sz](ation|e|ing)\b", 3),
+    ("solidity", r"\bcontract \w+ ?\{", 3),
+    # Conversational turns.
+    ("chat", r"^\s*(hi|hello|hey|yo|gm|good (morning|afternoon|evening))\b", 4),
+    ("chat", r"^\s*(thanks|thank you|thx|cheers|bye|goodbye)\b", 4),
+    ("chat", r"\b(who|what) are you\b", 4),
+    ("chat", r"\bwhat can you do\b", 4),
+    ("chat", r"\bhow are you\b", 4),
+]
+
+class KeywordRouter:
+    def __init__(self, rules=ROUTING_RULES, min_score: int = 2, min_margin: int = 2):
+        """
+        A deterministic router that answers the obvious "infura" / "solidity" / "chat" decisions
+        from keyword and regex rules, before any LLM call.
+
+        Every matching rule adds its weight to its route. The top route is returned when it scores
+        at least `min_score` and leads the runner-up by at least `min_margin`; otherwise the router
+        is unsure and returns None, and the caller falls back to the LLM action evaluator.
+
+        Args:
+            rules (list): (route, pattern, weight) tuples.
+            min_score (int): The minimum score of a confident decision.
+            min_margin (int): The minimum lead of the top route over the runner-up.
+        """
+        self.rules = [(route, re.compile(pattern, re.IGNORECASE), weight) for route, pattern, weight in rules]
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    def scores(self, question: str):
+        """
+        Returns the score of every route for a question.
+        """
+        scores = {"infura": 0, "solidity": 0, "chat": 0}
+        for route, pattern, weight in self.rules:
+            if pattern.search(question):
+                scores[route] += weight
+        return scores
+
+    def route(self, question: str):
+        """
+        Routes a question without calling the LLM.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            str: "infura", "solidity" or "chat", or None when the rules are not confident.
+        """
+        ranked = sorted(self.scores(question).items(), key=lambda item: item[1], reverse=True)
+        (best, best_score), (_, runner_up_score) = ranked[0], ranked[1]
+        if best_score >= self.min_score and best_score - runner_up_score >= self.min_margin:
+            return best
+        return None
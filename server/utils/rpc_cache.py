@@ -0,0 +1,141 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Results that never change once they exist: lookups by hash and chain identity.
+IMMUTABLE_METHODS = {
+    "eth_chainId",
+    "net_version",
+    "eth_getBlockByHash",
+    "eth_getBlockTransactionCountByHash",
+    "eth_getTransactionByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+    "eth_getTransactionReceipt",
+    "eth_getUncleByBlockHashAndIndex",
+    "eth_getUncleCountByBlockHash",
+}
+
+# Results that can change with every new block.
+HEAD_METHODS = {
+    "eth_blockNumber",
+    "eth_gasPrice",
+    "eth_maxPriorityFeePerGas",
+    "eth_blobBaseFee",
+    "eth_feeHistory",
+    "eth_syncing",
+    "eth_getBalance",
+    "eth_getTransactionCount",
+    "eth_getCode",
+    "eth_getStorageAt",
+    "eth_call",
+    "eth_estimateGas",
+    "eth_getLogs",
+    "eth_getBlockByNumber",
+    "eth_getBlockTransactionCountByNumber",
+}
+
+# Average Ethereum mainnet block time, in seconds.
+BLOCK_TIME = 12
+
+MISSING = object()
+
+class JsonRpcCache:
+    def __init__(self, head_ttl: float = BLOCK_TIME, max_size: int = 2048):
+        """
+        Caches JSON-RPC results according to their method.
+
+        Results of `IMMUTABLE_METHODS` are kept until evicted, as long as they describe a mined
+        block or transaction. Results of `HEAD_METHODS` are kept for `head_ttl` seconds, about
+        one block. Any other method, such as `eth_sendRawTransaction`, is never cached. Error
+        responses are never cached.
+
+        Args:
+            head_ttl (float): Seconds a head-dependent result stays valid.
+            max_size (int): The maximum number of cached results.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.head_ttl = head_ttl
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def cacheable(call) -> bool:
+        return call.get("method") in IMMUTABLE_METHODS or call.get("method") in HEAD_METHODS
+
+    @staticmethod
+    def key(url: str, call):
+        return (url, call.get("method"), json.dumps(call.get("params", []), sort_keys=True))
+
+    def ttl_for(self, method: str, result):
+        """
+        Returns how long a result stays valid, or None when it must not be cached.
+        """
+        if method in IMMUTABLE_METHODS:
+            # Unknown hashes return null and pending transactions have no block yet; both can still change.
+            if result is None or (isinstance(result, dict) and "blockHash" in result and not result["blockHash"]):
+                return None
+            return math.inf
+        if method in HEAD_METHODS and self.head_ttl > 0:
+            return self.head_ttl
+        return None
+
+    def get(self, key):
+        """
+        Returns the cached result for a key, or MISSING.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response):
+        """
+        Caches the result of a JSON-RPC response if its method allows it.
+        """
+        if "error" in response or "result" not in response:
+            return
+        ttl = self.ttl_for(key[1], response["result"])
+        if ttl is None:
+            return
+        with self._lock:
+            self._entries[key] = (response["result"], time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The hits, misses, hit rate, requests coalesced with an identical in-flight request and number of cached results.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import random
+import shlex
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+import httpx
+from utils.rpc_cache import MISSING
+from utils.logger import get_logger
+
+# Responses worth retrying: rate limiting and server-side failures. Any other status is returned as-is,
+# the same way curl prints the body of a 4xx response.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+log = get_logger(__name__)
+
+class CurlParseError(ValueError):
+    """
+    Raised when a generated command is not a single, plain HTTP(S) curl request.
+    """
+
+class ExecutionError(Exception):
+    """
+    Raised when a request still fails after all retries.
+    """
+
+class UnparsableResponse(Exception):
+    """
+    Raised when a JSON-RPC endpoint answers with something other than the responses that were asked for.
+    The body is passed through to the user unchanged.
+    """
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.text = text
+
+class HttpRequest(NamedTuple):
+    method: str
+    url: str
+    headers: Dict[str, str]
+    body: Optional[str]
+
+# curl flags that only affect how curl prints or follows the response.
+_IGNORED_FLAGS = {"-s", "--silent", "-S", "--show-error", "-L", "--location", "-i", "--include", "-v", "--verbose", "--compressed"}
+_DATA_FLAGS = {"-d", "--data", "--data-raw", "--data-binary", "--json"}
+
+def parse_curl(command: str) -> HttpRequest:
+    """
+    Parses a curl command into the parts of an HTTP request, without ever handing it to a shell.
+
+    Only the flags the generated Infura commands use are understood (-X, -H, -d and its variants,
+    --url). Anything else, including a second URL or shell syntax such as `;` or `|`, is rejected.
+
+    Args:
+        command (str): The curl command.
+
+    Returns:
+        HttpRequest: The method, URL, headers and body of the request.
+    """
+    try:
+        tokens = shlex.split(command.replace("\\\n", " "))
+    except ValueError as e:
+        raise CurlParseError(f"Could not parse command: {e}")
+
+    if not tokens or tokens[0] != "curl":
+        raise CurlParseError("Only curl commands can be executed")
+
+    method, url, headers, body = None, None, {}, None
+    args = iter(tokens[1:])
+    for token in args:
+        if token in _IGNORED_FLAGS:
+            continue
+        if token in ("-X", "--request"):
+            method = next(args, "").upper()
+        elif token in ("-H", "--header"):
+            name, _, value = next(args, "").partition(":")
+            if not name.strip():
+                raise CurlParseError("Malformed header")
+            headers[name.strip()] = value.strip()
+        elif token in _DATA_FLAGS:
+            body = next(args, None)
+            if body is None:
+                raise CurlParseError(f"{token} needs a value")
+            if token == "--json":
+                headers.setdefault("Content-Type", "application/json")
+                headers.setdefault("Accept", "application/json")
+        elif token == "--url" or not token.startswith("-"):
+            if url is not None:
+                raise CurlParseError("Only a single URL can be requested")
+            url = token if token != "--url" else next(args, None)
+        else:
+            raise CurlParseError(f"Unsupported curl option: {token}")
+
+    if not url or urlparse(url).scheme not in ("http", "https") or not urlparse(url).netloc:
+        raise CurlParseError("The command must request an http(s) URL")
+
+    if body is not None:
+        try:
+            json.loads(body)
+        except ValueError:
+            raise CurlParseError("The request body must be valid JSON")
+
+    return HttpRequest(method or ("POST" if body is not None else "GET"), url, headers, body)
+
+class JsonRpcExecutor:
+    def __init__(self, timeout: float = 10, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8, max_connections: int = 20, cache=None):
+        """
+        Sends curl-style JSON-RPC requests in process through pooled keep-alive HTTP clients,
+        so repeated calls to the same endpoint reuse their connection and TLS session.
+
+        Failed attempts (transport errors, timeouts and retryable status codes) are retried with
+        exponential backoff and full jitter.
+
+        With a `cache`, JSON-RPC bodies (single requests or batch arrays) are split into calls:
+        cached results are answered locally, calls identical to one already in flight wait for
+        its response instead of being sent again, and the remaining calls go out together as a
+        single batch array.
+
+        Args:
+            timeout (float): Seconds allowed for each attempt.
+            max_retries (int): The maximum number of attempts.
+            backoff_base (float): The backoff ceiling, in seconds, after the first failed attempt.
+            backoff_max (float): The largest backoff ceiling, in seconds.
+            max_connections (int): The connection pool size of each client.
+            cache (JsonRpcCache): Optional method-aware result cache.
+        """
+        if max_retries < 1:
+            raise ValueError("max_retries must be at least 1")
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+        self.cache = cache
+
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # The longest an owner can take over a call, including every retry and backoff. A call
+        # waiting on an identical one in flight gives up after this long.
+        self.coalesce_timeout = timeout * max_retries + backoff_max * (max_retries - 1)
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits)
+            return self._client
+
+    @property
+    def async_client(self):
+        # Created on first use so it binds to the event loop that serves requests.
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._async_client
+
+    def _backoff(self, attempt: int):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, attempt: int, reason: str):
+        if attempt < self.max_retries - 1:
+            log.warning("rpc_attempt_failed", attempt=attempt + 1, reason=reason)
+            return True
+        log.error("rpc_retries_exhausted", attempts=attempt + 1, reason=reason)
+        return False
+
+    def _send(self, request: HttpRequest) -> str:
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.request(request.method, request.url, headers=request.headers, content=request.body)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response.text
+                reason = f"Received HTTP {response.status_code}."
+            except httpx.TimeoutException:
+                reason = "Timeout occurred while executing the request."
+            except httpx.TransportError as e:
+                reason = f"Error executing the request: {e}"
+
+            if not self._should_retry(attempt, reason):
+                raise ExecutionError(reason)
+            time.sleep(self._backoff(attempt))
+
+    async def _asend(self, request: HttpRequest) -> str:
+        for attempt in range(self.max_retries):
+            try:
+                response = await self.async_client.request(request.method, request.url, headers=request.headers, content=request.body)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response.text
+                reason = f"Received HTTP {response.status_code}."
+            except httpx.TimeoutException:
+                reason = "Timeout occurred while executing the request."
+            except httpx.TransportError as e:
+                reason = f"Error executing the request: {e}"
+
+            if not self._should_retry(attempt, reason):
+                raise ExecutionError(reason)
+            await asyncio.sleep(self._backoff(attempt))
+
+    def execute(self, command: str) -> str:
+        """
+        Executes a curl command and returns the response body.
+
+        Args:
+            command (str): The curl command.
+
+        Returns:
+            str: The response body.
+
+        Raises:
+            CurlParseError: The command is not a plain curl request.
+            ExecutionError: Every attempt failed.
+        """
+        request = parse_curl(command)
+        calls = self._jsonrpc_calls(request)
+        if calls is None:
+            return self._send(request)
+
+        plan = self._plan(request.url, calls)
+        try:
+            if plan["pending"]:
+                self._settle(plan, self._decode(self._send(self._batch_request(request, calls, plan["pending"])), calls, plan["pending"]))
+            for index, future in plan["waits"]:
+                try:
+                    response = future.result(timeout=self.coalesce_timeout)
+                except FutureTimeoutError:
+                    raise ExecutionError("Timeout occurred while waiting for an identical request.")
+                plan["responses"][index] = self._with_id(response, calls[index])
+        except UnparsableResponse as e:
+            self._fail(plan, e)
+            return e.text
+        except Exception as e:
+            self._fail(plan, e)
+            raise
+        finally:
+            # An interrupted request still releases the calls it owns, so identical calls never wait on it.
+            self._fail(plan, ExecutionError("The request was interrupted before a response arrived."))
+        return self._encode(plan["responses"], calls)
+
+    async def aexecute(self, command: str) -> str:
+        """
+        Async variant of `execute`.
+        """
+        request = parse_curl(command)
+        calls = self._jsonrpc_calls(request)
+        if calls is None:
+            return await self._asend(request)
+
+        plan = self._plan(request.url, calls)
+        try:
+            if plan["pending"]:
+                self._settle(plan, self._decode(await self._asend(self._batch_request(request, calls, plan["pending"])), calls, plan["pending"]))
+            for index, future in plan["waits"]:
+                # Shielded, so a cancelled waiter does not cancel the future other requests share.
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.coalesce_timeout)
+                except asyncio.TimeoutError:
+                    raise ExecutionError("Timeout occurred while waiting for an identical request.")
+                plan["responses"][index] = self._with_id(response, calls[index])
+        except UnparsableResponse as e:
+            self._fail(plan, e)
+            return e.text
+        except Exception as e:
+            self._fail(plan, e)
+            raise
+        finally:
+            # A cancelled request (e.g. a client disconnecting mid-stream) raises CancelledError,
+            # which `except Exception` misses; it must still release the calls it owns.
+            self._fail(plan, ExecutionError("The request was cancelled before a response arrived."))
+        return self._encode(plan["responses"], calls)
+
+    def _jsonrpc_calls(self, request: HttpRequest):
+        """
+        Returns the JSON-RPC calls of a request as a list, or None when the request should be sent as-is.
+        A single call is returned as a list of one; `_encode` answers it with a single response again.
+        """
+        if self.cache is None or request.body is None or request.method != "POST":
+            return None
+        body = json.loads(request.body)
+        calls = body if isinstance(body, list) else [body]
+        if not calls or not all(isinstance(call, dict) and isinstance(call.get("method"), str) for call in calls):
+            return None
+        return calls if isinstance(body, list) else _SingleCall(calls)
+
+    def _plan(self, url: str, calls):
+        """
+        Sorts the calls of a request into answered from the cache, waiting on an identical call
+        already in flight, or pending. A pending cacheable call registers itself as in flight.
+        """
+        plan = {"responses": [None] * len(calls), "pending": [], "waits": [], "owned": []}
+        for index, call in enumerate(calls):
+            if not self.cache.cacheable(call):
+                plan["pending"].append(index)
+                continue
+
+            key = self.cache.key(url, call)
+            result = self.cache.get(key)
+            if result is not MISSING:
+                plan["responses"][index] = {"jsonrpc": "2.0", "id": call.get("id"), "result": result}
+                continue
+
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    plan["owned"].append((index, key, future))
+                    plan["pending"].append(index)
+                    continue
+            self.cache.record_coalesced()
+            plan["waits"].append((index, future))
+        return plan
+
+    def _batch_request(self, request: HttpRequest, calls, pending):
+        # Outgoing ids are the positions in the original request, so responses can be matched even
+        # when the generated calls reuse ids. `_with_id` restores the original ids.
+        batch = [dict(calls[index], id=index) for index in pending]
+        body = batch[0] if len(batch) == 1 else batch
+        return request._replace(body=json.dumps(body))
+
+    def _decode(self, text: str, calls, pending):
+        try:
+            body = json.loads(text)
+        except ValueError:
+            raise UnparsableResponse(text)
+
+        responses = body if isinstance(body, list) else [body]
+        by_index = {response.get("id"): response for response in responses if isinstance(response, dict)}
+        if any(index not in by_index for index in pending):
+            raise UnparsableResponse(text)
+        return {index: by_index[index] for index in pending}
+
+    def _settle(self, plan, decoded):
+        for index, response in decoded.items():
+            plan["responses"][index] = response
+        for index, key, future in plan["owned"]:
+            self.cache.put(key, decoded[index])
+            self._release(key, future, result=decoded[index])
+        plan["owned"] = []
+
+    def _fail(self, plan, error):
+        for index, key, future in plan["owned"]:
+            self._release(key, future, error=error)
+        plan["owned"] = []
+
+    def _release(self, key, future, result=None, error=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _with_id(self, response, call):
+        return dict(response, id=call.get("id"))
+
+    def _encode(self, responses, calls):
+        responses = [self._with_id(response, call) for response, call in zip(responses, calls)]
+        return json.dumps(responses[0] if isinstance(calls, _SingleCall) else responses)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+
+class _SingleCall(list):
+    """
+    A request body that held a single JSON-RPC object rather than a batch array.
+    """
@@ -0,0 +1,79 @@
+import time
+from utils.metrics import TIME_TO_FIRST_TOKEN
+from utils.prompts import ANSWER_TAG
+
+# Graph steps that mean the generation streamed before them failed grading: "generate" again, or
+# "unsupported_fallback" once the retries ran out, when it was not supported by the documents, and
+# "transform_query" when it did not answer the question.
+RETRACTING_STEPS = {"generate": "not supported", "unsupported_fallback": "not supported", "transform_query": "not useful"}
+
+# Graph steps that write a complete answer of their own. One starting after another answer has
+# streamed (e.g. `command_interpreter` after `generate` on the execution route) replaces it.
+ANSWER_STEPS = {"generate", "chat", "command_interpreter", "params_inquiry"}
+
+def _is_graph_step(event):
+    return any(tag.startswith("graph:step:") for tag in event.get("tags", []))
+
+async def stream_answer(chain, payload: dict, config: dict):
+    """
+    Runs one turn of the compiled graph and yields the answer as server-sent events while it is generated.
+
+    Events:
+        token: {"node", "content"}, a chunk of the answer produced by `generate`, `chat`,
+            `command_interpreter` or `params_inquiry`.
+        retract: {"node", "reason"}, the text streamed so far must be discarded: it failed grading
+            ("not supported", "not useful") and another attempt or the fallback answer follows, or another step is about
+            to write the answer that replaces it ("superseded").
+        annotate: {"node", "note"}, the text streamed so far is kept but ran out of retry budget
+            before passing grading.
+        end: {"answer", "retry_budget_exhausted", "time_to_first_token"}, sent once the turn is
+            over. `answer` is the authoritative final answer, including when nothing was streamed
+            (e.g. an answer cache hit).
+
+    Args:
+        chain: The compiled workflow.
+        payload (dict): The graph input, e.g. {"input": "..."}.
+        config (dict): The runnable config, carrying 'user_id' and 'conv_id' under 'configurable'.
+
+    Yields:
+        tuple: The event name and its data.
+    """
+    started = time.perf_counter()
+    time_to_first_token = None
+    step = None
+    streamed = None
+    final = {}
+
+    async for event in chain.astream_events(payload, config=config, version="v1"):
+        if event["event"] == "on_chain_start" and _is_graph_step(event):
+            node = step = event["name"]
+            if streamed == "generate" and node in RETRACTING_STEPS:
+                yield "retract", {"node": streamed, "reason": RETRACTING_STEPS[node]}
+                streamed = None
+            elif streamed is not None and node in ANSWER_STEPS:
+                yield "retract", {"node": streamed, "reason": "superseded"}
+                streamed = None
+            elif streamed == "generate" and node == "fallback":
+                yield "annotate", {"node": streamed, "note": "unverified"}
+            continue
+
+        if event["event"] == "on_chat_model_stream" and ANSWER_TAG in event.get("tags", []):
+            content = event["data"]["chunk"].content
+            if not content:
+                continue
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - started
+                TIME_TO_FIRST_TOKEN.labels(node=step).observe(time_to_first_token)
+            streamed = step
+            yield "token", {"node": step, "content": content}
+
+        elif event["event"] == "on_chain_end" and _is_graph_step(event):
+            output = event["data"].get("output")
+            if isinstance(output, dict):
+                final.update(output)
+
+    yield "end", {
+        "answer": final.get("generation"),
+        "retry_budget_exhausted": final.get("retry_budget_exhausted", False),
+        "time_to_first_token": time_to_first_token,
+    }
@@ -0,0 +1,158 @@
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, StateGraph
+from utils.graph import GraphState
+from utils.instrumentation import instrument
+
+def awaitable(sync_step, async_step, name=None, kind="node", instrumented=True):
+    """
+    Registers a graph step with both variants, so the compiled graph serves `invoke`/`stream`
+    from the sync one and `ainvoke`/`astream` (used by langserve) from the async one.
+    Instrumented steps also export their latency, LLM calls, tokens and retrieval size.
+    """
+    step = RunnableLambda(sync_step, afunc=async_step)
+    if not instrumented:
+        return step
+    return instrument(step, name or sync_step.__name__, kind)
+
+def build_workflow(graph_nodes, edge_graph, use_answer_cache=False, instrumented=True):
+    """
+    Wires the Web3Buddy nodes and edges into a StateGraph.
+
+    Args:
+        graph_nodes (GraphNodes): The node implementations.
+        edge_graph (EdgeGraph): The conditional edge implementations.
+        use_answer_cache (bool): Route documentation questions through the semantic answer cache nodes.
+        instrumented (bool): Export per-node and per-edge metrics on `/metrics`.
+
+    Returns:
+        StateGraph: The uncompiled workflow.
+    """
+    workflow = StateGraph(GraphState)
+
+    def node(name, sync_step, async_step):
+        workflow.add_node(name, awaitable(sync_step, async_step, name, "node", instrumented))
+
+    def edge(sync_step, async_step):
+        return awaitable(sync_step, async_step, kind="edge", instrumented=instrumented)
+
+    node("retrieveInfura", graph_nodes.retrieveInfura, graph_nodes.aretrieveInfura)
+    node("retrieveSolidity", graph_nodes.retrieveSolidity, graph_nodes.aretrieveSolidity)
+    node("grade_documents", graph_nodes.grade_documents, graph_nodes.agrade_documents)
+    node("generate", graph_nodes.generate, graph_nodes.agenerate)
+    node("transform_query", graph_nodes.transform_query, graph_nodes.atransform_query)
+    node("evaluator", graph_nodes.rewrite_question, graph_nodes.arewrite_question)
+    node("chat", graph_nodes.chat, graph_nodes.achat)
+    node("transform_execution", graph_nodes.transform_execution, graph_nodes.atransform_execution)
+    node("execution", graph_nodes.execution, graph_nodes.aexecution)
+    node("path_to_execution", graph_nodes.path_to_execution, graph_nodes.apath_to_execution)
+    node("command_interpreter", graph_nodes.execution_interpreter, graph_nodes.aexecution_interpreter)
+    node("ending", graph_nodes.ending, graph_nodes.aending)
+    node("params_needed", graph_nodes.params_needed, graph_nodes.aparams_needed)
+    node("params_inquiry", graph_nodes.params_inquiry, graph_nodes.aparams_inquiry)
+    node("adding_params", graph_nodes.adding_params, graph_nodes.aadding_params)
+    node("fallback", graph_nodes.fallback, graph_nodes.afallback)
+    node("unsupported_fallback", graph_nodes.unsupported_fallback, graph_nodes.aunsupported_fallback)
+
+    workflow.set_entry_point("evaluator")
+
+    if not use_answer_cache:
+        workflow.add_conditional_edges(
+            "evaluator",
+            edge(edge_graph.action_first, edge_graph.aaction_first),
+            {
+                "infura": "retrieveInfura",
+                "solidity": "retrieveSolidity",
+                "chat": "chat",
+            },
+        )
+    else:
+        node("answer_cache_infura", graph_nodes.answer_cache_infura, graph_nodes.aanswer_cache_infura)
+        node("answer_cache_solidity", graph_nodes.answer_cache_solidity, graph_nodes.aanswer_cache_solidity)
+        workflow.add_conditional_edges(
+            "evaluator",
+            edge(edge_graph.action_first, edge_graph.aaction_first),
+            {
+                "infura": "answer_cache_infura",
+                "solidity": "answer_cache_solidity",
+                "chat": "chat",
+            },
+        )
+        for cache_node in ("answer_cache_infura", "answer_cache_solidity"):
+            workflow.add_conditional_edges(
+                cache_node,
+                edge(edge_graph.answer_cached, edge_graph.aanswer_cached),
+                {
+                    "cached": "ending",
+                    "infura": "retrieveInfura",
+                    "solidity": "retrieveSolidity",
+                },
+            )
+
+    workflow.add_edge("ending", END)
+    workflow.add_edge("chat", "ending")
+
+    workflow.add_edge("retrieveInfura", "grade_documents")
+    workflow.add_edge("retrieveSolidity", "grade_documents")
+    workflow.add_conditional_edges(
+        "grade_documents",
+        edge(edge_graph.decide_to_generate, edge_graph.adecide_to_generate),
+        {
+            "transform_query": "transform_query",
+            "generate": "generate",
+            "fallback": "fallback",
+        },
+    )
+
+    workflow.add_conditional_edges(
+        "transform_query",
+        edge(edge_graph.tool_direction, edge_graph.atool_direction),
+        {
+            "infura": "retrieveInfura",
+            "solidity": "retrieveSolidity",
+        },
+    )
+    workflow.add_conditional_edges(
+        "generate",
+        edge(edge_graph.grade_generation_v_documents_and_question, edge_graph.agrade_generation_v_documents_and_question),
+        {
+            "not supported": "generate",
+            "useful": "path_to_execution",
+            "not useful": "transform_query",
+            "fallback": "fallback",
+            "unsupported fallback": "unsupported_fallback",
+        },
+    )
+
+    workflow.add_conditional_edges(
+        "path_to_execution",
+        edge(edge_graph.decide_to_execute, edge_graph.adecide_to_execute),
+        {
+            "execute": "transform_execution",
+            "no-execute": "ending",
+        },
+    )
+
+    workflow.add_conditional_edges(
+        "transform_execution",
+        edge(edge_graph.paramsCheck, edge_graph.aparamsCheck),
+        {
+            "params-needed": "params_needed",
+            "no-params-needed": "execution",
+        }
+    )
+    workflow.add_conditional_edges(
+        "params_needed",
+        edge(edge_graph.paramsProvided, edge_graph.aparamsProvided), 
+        {
+            "params-provided": "adding_params", 
+            "params-not-provided": "params_inquiry",
+        }
+    )
+    workflow.add_edge("adding_params", "execution")
+    workflow.add_edge("execution", "command_interpreter")
+    workflow.add_edge("command_interpreter", "ending")
+    workflow.add_edge("params_inquiry", END)
+    workflow.add_edge("fallback", "ending")
+    workflow.add_edge("unsupported_fallback", "ending")
+
+    return workflow